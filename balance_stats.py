@@ -0,0 +1,327 @@
+"""
+CSC111 Final Project: Reconstructing the Ethereum Network Using
+Graph Data Structures in Python
+
+General Information
+------------------------------------------------------------------------------
+This file was created for the purpose of applying concepts in learned in
+CSC111 to the real world problem domain of cryptocurrency transactions.
+
+Module Info: balance_stats.py
+
+This file contains summary statistics of the balances of the accounts of a
+graph (their number, sum, minimum, maximum, mean, variance and quantiles),
+which build_graph and update_graph keep up to date as balances are loaded, so
+that they can be looked up without going over every account.
+
+Copyright Information
+------------------------------------------------------------------------------
+This file is Copyright of Tobey Brizuela, Daniel Lazaro, Matthew Parvaneh, and
+Michael Umeh.
+"""
+import math
+
+import numpy as np
+
+from compact_graph import CompactGraph, Graph
+
+# The default relative accuracy of the quantiles of a BalanceStats: every quantile
+# is within this fraction of the true one.
+DEFAULT_RELATIVE_ACCURACY = 0.01
+
+
+class BalanceStats:
+    """
+    Summary statistics of a collection of (non-negative) Ether balances, which
+    can have balances added to and removed from it, and be merged with the
+    statistics of other balances.
+
+    The mean and variance are updated with Welford's method (in its batched
+    form), and the quantiles come from a sketch that counts the balances in
+    buckets whose bounds grow geometrically, so that the representative value
+    of a bucket is within the relative accuracy of every balance in it. The
+    sketch has one bucket per order of magnitude / log10(1 + 2 * accuracy),
+    however many balances there are.
+
+    Instance Attributes:
+        - count: the number of balances
+        - total: the sum of the balances
+        - minimum: the smallest balance (nan if there are none)
+        - maximum: the largest balance (nan if there are none)
+        - relative_accuracy: the relative accuracy of the quantiles
+
+    Representation Invariants:
+        - self.count >= 0
+        - 0 < self.relative_accuracy < 1
+        - self._zero_count + sum(self._buckets.values()) == self.count
+
+    Sample Usage:
+    >>> stats = BalanceStats.from_values(np.array([0.0, 1.0, 2.0, 3.0, 9.0]))
+    >>> stats.count, stats.total, stats.minimum, stats.maximum, stats.mean, stats.variance
+    (5, 15.0, 0.0, 9.0, 3.0, 10.0)
+    >>> stats.remove(np.array([9.0]))
+    True
+    >>> stats.set_extremes(0.0, 3.0)
+    >>> stats.mean, stats.variance
+    (1.5, 1.25)
+    >>> round(stats.quantile(0.5), 1)
+    1.0
+    """
+    count: int
+    total: float
+    minimum: float
+    maximum: float
+    relative_accuracy: float
+
+    # Private Instance Attributes:
+    #   - _mean: the mean of the balances (0.0 if there are none)
+    #   - _m2: the sum of the squared differences between the balances and their mean
+    #   - _log_gamma: the log of the ratio between the bounds of every bucket
+    #   - _zero_count: the number of balances of 0
+    #   - _buckets: maps every bucket index i to the number of positive balances b with
+    #     gamma ** (i - 1) < b <= gamma ** i, where gamma == exp(self._log_gamma)
+    _mean: float
+    _m2: float
+    _log_gamma: float
+    _zero_count: int
+    _buckets: dict[int, int]
+
+    def __init__(self, relative_accuracy: float = DEFAULT_RELATIVE_ACCURACY) -> None:
+        """
+        Initialize the statistics of no balances, whose quantiles will be within
+        relative_accuracy of the true ones.
+
+        Preconditions:
+            - 0 < relative_accuracy < 1
+        """
+        self.count = 0
+        self.total = 0.0
+        self.minimum = math.nan
+        self.maximum = math.nan
+        self.relative_accuracy = relative_accuracy
+
+        self._mean = 0.0
+        self._m2 = 0.0
+        self._log_gamma = math.log((1 + relative_accuracy) / (1 - relative_accuracy))
+        self._zero_count = 0
+        self._buckets = {}
+
+    @classmethod
+    def from_values(cls, values: np.ndarray,
+                    relative_accuracy: float = DEFAULT_RELATIVE_ACCURACY) -> 'BalanceStats':
+        """
+        Return the statistics of the balances in values.
+
+        Preconditions:
+            - all(values >= 0)
+            - 0 < relative_accuracy < 1
+        """
+        stats = cls(relative_accuracy)
+        stats.add(values)
+        return stats
+
+    @property
+    def mean(self) -> float:
+        """The mean of the balances (nan if there are none)."""
+        return self._mean if self.count > 0 else math.nan
+
+    @property
+    def variance(self) -> float:
+        """The (population) variance of the balances (nan if there are none)."""
+        return self._m2 / self.count if self.count > 0 else math.nan
+
+    def add(self, values: np.ndarray) -> None:
+        """
+        Add the balances in values.
+
+        Preconditions:
+            - all(values >= 0)
+        """
+        values = np.asarray(values, dtype=np.float64)
+        if len(values) == 0:
+            return
+
+        batch_mean = float(values.mean())
+        batch_m2 = float(np.square(values - batch_mean).sum())
+        self._combine(len(values), batch_mean, batch_m2)
+
+        self.total += float(values.sum())
+        self.minimum = float(np.fmin(self.minimum, values.min()))
+        self.maximum = float(np.fmax(self.maximum, values.max()))
+        self._count_buckets(values, 1)
+
+    def remove(self, values: np.ndarray) -> bool:
+        """
+        Remove the balances in values, each of which must have been added.
+
+        Return whether the minimum or the maximum was removed, in which case
+        they are no longer known, and set_extremes must be called with the new
+        ones (unless no balances are left).
+
+        Preconditions:
+            - values are among the balances that were added (and not yet removed)
+        """
+        values = np.asarray(values, dtype=np.float64)
+        if len(values) == 0:
+            return False
+
+        batch_mean = float(values.mean())
+        batch_m2 = float(np.square(values - batch_mean).sum())
+        self._combine(-len(values), batch_mean, batch_m2)
+        self._count_buckets(values, -1)
+
+        if self.count == 0:
+            self.total = 0.0
+            self.minimum = self.maximum = math.nan
+            return False
+
+        self.total -= float(values.sum())
+        return bool(values.min() <= self.minimum or values.max() >= self.maximum)
+
+    def set_extremes(self, minimum: float, maximum: float) -> None:
+        """
+        Set the smallest and the largest balance, after remove has removed
+        either of them.
+
+        Preconditions:
+            - minimum and maximum are the smallest and largest remaining balances
+        """
+        self.minimum = minimum
+        self.maximum = maximum
+
+    def merge(self, other: 'BalanceStats') -> None:
+        """
+        Add the balances summarized by other to these statistics.
+
+        Preconditions:
+            - other.relative_accuracy == self.relative_accuracy
+        """
+        if other.count == 0:
+            return
+
+        self._combine(other.count, other._mean, other._m2)
+        self.total += other.total
+        self.minimum = float(np.fmin(self.minimum, other.minimum))
+        self.maximum = float(np.fmax(self.maximum, other.maximum))
+        self._zero_count += other._zero_count
+        for bucket, count in other._buckets.items():
+            self._buckets[bucket] = self._buckets.get(bucket, 0) + count
+
+    def quantile(self, q: float) -> float:
+        """
+        Return (within the relative accuracy) the balance below which a
+        fraction q of the balances are: the balance of rank q * (count - 1)
+        (counting from 0) in increasing order.
+
+        Preconditions:
+            - self.count > 0
+            - 0 <= q <= 1
+        """
+        if q <= 0:
+            return self.minimum
+        if q >= 1:
+            return self.maximum
+
+        rank = math.floor(q * (self.count - 1))
+        if rank < self._zero_count:
+            return 0.0
+
+        seen = self._zero_count
+        for bucket in sorted(self._buckets):
+            seen += self._buckets[bucket]
+            if seen > rank:
+                # The bucket holds balances in (gamma ** (bucket - 1), gamma ** bucket].
+                value = 2 * math.exp(bucket * self._log_gamma) / (1 + math.exp(self._log_gamma))
+                return min(max(value, self.minimum), self.maximum)
+
+        return self.maximum
+
+    def copy(self) -> 'BalanceStats':
+        """Return a copy of these statistics."""
+        stats = BalanceStats(self.relative_accuracy)
+        stats.merge(self)
+        return stats
+
+    def _combine(self, count: int, mean: float, m2: float) -> None:
+        """
+        Update the count, mean and sum of squared differences with those of a
+        batch of count balances (or, if count is negative, without those of a
+        batch of -count balances).
+        """
+        new_count = self.count + count
+        if new_count == 0:
+            self._mean = self._m2 = 0.0
+        elif count > 0:
+            delta = mean - self._mean
+            self._mean += delta * count / new_count
+            self._m2 += m2 + delta ** 2 * self.count * count / new_count
+        else:
+            new_mean = (self.count * self._mean + count * mean) / new_count
+            delta = mean - new_mean
+            self._m2 = max(self._m2 - m2 - delta ** 2 * new_count * -count / self.count, 0.0)
+            self._mean = new_mean
+
+        self.count = new_count
+
+    def _count_buckets(self, values: np.ndarray, sign: int) -> None:
+        """Add sign to the counts of the buckets of every balance in values."""
+        positive = values[values > 0]
+        self._zero_count += sign * (len(values) - len(positive))
+
+        buckets, counts = np.unique(np.ceil(np.log(positive) / self._log_gamma).astype(np.int64),
+                                    return_counts=True)
+        for bucket, count in zip(buckets.tolist(), counts.tolist()):
+            count = self._buckets.get(bucket, 0) + sign * count
+            if count == 0:
+                del self._buckets[bucket]
+            else:
+                self._buckets[bucket] = count
+
+
+def balance_stats(graph: Graph) -> BalanceStats:
+    """
+    Return the statistics of the balances of the accounts of graph.
+
+    build_graph attaches them to the graph as graph.graph['balance_stats'], and
+    update_graph keeps them up to date. For a graph that doesn't have them
+    (like one loaded from a snapshot), they are computed here and attached.
+    """
+    if 'balance_stats' not in graph.graph:
+        graph.graph['balance_stats'] = BalanceStats.from_values(graph_balances(graph))
+
+    return graph.graph['balance_stats']
+
+
+def graph_balances(graph: Graph) -> np.ndarray:
+    """
+    Return the balances of the accounts of graph that have one, in the order of
+    graph.nodes.
+    """
+    if isinstance(graph, CompactGraph):
+        return graph.balances[graph.has_balance]
+
+    return np.array([attributes['balance'] for _, attributes in graph.nodes(data=True)
+                     if attributes != {}], dtype=np.float64)
+
+
+if __name__ == '__main__':
+    # Check all doctests.
+    import doctest
+    doctest.testmod()
+
+    import python_ta
+    python_ta.check_all(config={
+        'max-line-length': 100,
+        'disable': ['E1136', 'W0212'],
+        'allowed-io': [],
+        'extra-imports': ['math', 'numpy', 'compact_graph']
+    })
+
+    import python_ta.contracts
+    python_ta.contracts.check_all_contracts()
+
+    # Example lookups of the statistics of a graph.
+    # from build_graph import build_graph
+    # ethereum_graph = build_graph('balances.csv', 'transactions.csv')
+    # stats = balance_stats(ethereum_graph)
+    # stats.mean, stats.quantile(0.99)
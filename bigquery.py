@@ -12,15 +12,39 @@ Copyright Information
 This file is Copyright of Tobey Brizuela, Daniel Lazaro, Matthew Parvaneh, and
 Michael Umeh.
 """
-from google.cloud import bigquery
 import os
 import csv
+import random
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from functools import partial
+from threading import Lock
+from typing import Any, Callable, Iterator, Optional
 
+from columnar import ColumnarWriter, export_table
+from query_cache import QueryCache
 
-def user_input_query_helper(credentials: str) -> None:
+# The number of rows requested from BigQuery per page of results.
+DEFAULT_PAGE_SIZE = 10_000
+
+# The columns written to the transactions and balances files.
+TRANSACTION_COLUMNS = ['nonce', 'from_address', 'to_address', 'value', 'block_timestamp']
+BALANCE_COLUMNS = ['eth_balance', 'address']
+
+
+def user_input_query_helper(credentials: str, client: Optional[Any] = None,
+                            columnar: bool = False, use_cache: bool = True) -> None:
     """
     Passes arguments to bigquery_helper according to user input.
+
+    client and columnar are passed on to _bigquery_helper. Unless use_cache is
+    False, query results are cached locally (see query_cache.py), so repeating
+    a query with the same parameters doesn't contact BigQuery again.
     """
+    cache = QueryCache() if use_cache else None
+
     # Default values (default strings used in the query)
     filter_values = 'AND value > 0 '  # Filter out values of 0
     transaction_limit = 'LIMIT 1000 '  # Limit to 1000 transactions
@@ -33,16 +57,17 @@ def user_input_query_helper(credentials: str) -> None:
         default = input('Would you like to customize your query? (Y/N, default N): ')
     if default.lower().strip() in {'n', 'no', ''}:
         print('\nQuerying using default parameters (see report for details).\n')
-        _bigquery_helper(credentials, filter_values, transaction_limit, sorting, range)
+        _bigquery_helper(credentials, filter_values, transaction_limit, sorting, range,
+                         client, columnar, cache=cache)
     else:
         # Filter out transactions with value 0?
         filter_values_input = input(
-            'Would you like to filter out transactions with value 0? ' 
+            'Would you like to filter out transactions with value 0? '
             '(Y/N, default Y): ')
         while filter_values_input.lower().strip() not in {'y', 'yes', 'n', 'no', ''}:
             print('Invalid input.')
             filter_values_input = input(
-                'Would you like to filter out transactions with value 0? ' 
+                'Would you like to filter out transactions with value 0? '
                 '(Y/N, default Y): ')
         if filter_values_input.lower().strip() in {'n', 'no'}:
             filter_values = ''
@@ -50,7 +75,7 @@ def user_input_query_helper(credentials: str) -> None:
         # Date range?
         # Note: higher values only make a difference when sorting by date ASC
         range_input = input(
-            'How many days (in the past) of transactions would you like to query? ' 
+            'How many days (in the past) of transactions would you like to query? '
             '(default 1, high values may lead to query failing): ')
         while not range_input.strip().isnumeric() or int(range_input) == 0:
             if range_input == '':
@@ -58,110 +83,460 @@ def user_input_query_helper(credentials: str) -> None:
                 break
             print('Invalid input.')
             range_input = input(
-                'How many days (in the past) of transactions would you like to query? ' 
+                'How many days (in the past) of transactions would you like to query? '
                 '(default 1, high values may lead to query failing): ')
         if range_input.strip() != '':
             range = range_input.strip()
 
         # Sorting?
         sorting_input = input(
-            'How would you like the transaction times to be sorted? ' 
+            'How would you like the transaction times to be sorted? '
             '(ASC/DESC, default DESC): ')
-        while sorting_input.strip().lower() not in {'ascending', 'descending', 
+        while sorting_input.strip().lower() not in {'ascending', 'descending',
                                                     'asc', 'desc', 'a', 'd', ''}:
             print('Invalid input.')
             sorting_input = input(
-                'How would you like the transactions to be sorted? ' 
+                'How would you like the transactions to be sorted? '
                 '(ASC/DESC, default DESC): ')
         if sorting_input.strip() in {'ascending', 'asc', 'a'}:
             sorting = 'ORDER BY block_timestamp ASC '
-                    
+
         # Transaction limit = ?
         transaction_limit_input = input(
-            'How many transactions would you like to limit the query to? ' 
+            'How many transactions would you like to limit the query to? '
             '(default 1000, higher limits not recommended): ')
         while not (transaction_limit_input.strip().isnumeric() or transaction_limit_input == ''):
             print('Invalid input.')
             transaction_limit_input = input(
-                'How many transactions would you like to limit the query to? ' 
+                'How many transactions would you like to limit the query to? '
                 '(default 1000, higher limits not recommended): ')
         if transaction_limit_input.strip() != '':
             transaction_limit = 'LIMIT ' + transaction_limit_input.strip() + ' '
 
         print('\nQuerying using user-specified parameters.\n')
-        _bigquery_helper(credentials, filter_values, transaction_limit, sorting, range)
-        
+        _bigquery_helper(credentials, filter_values, transaction_limit, sorting, range,
+                         client, columnar, cache=cache)
+
 
 def _bigquery_helper(
-        credentials: str, 
-        filter_values: str, 
-        transaction_limit: str, 
-        sorting: str, 
-        range: str
-    ) -> None:
+        credentials: str,
+        filter_values: str,
+        transaction_limit: str,
+        sorting: str,
+        range: str,
+        client: Optional[Any] = None,
+        columnar: bool = False,
+        page_size: int = DEFAULT_PAGE_SIZE,
+        cache: Optional[QueryCache] = None,
+        output_dir: str = ''
+) -> dict[str, float]:
     """
     Queries the Ethereum BigQuery dataset according to user's input.
+
+    The results are streamed to disk page by page (page_size rows at a time),
+    so memory use doesn't grow with the size of the query. They are written to
+    'transactions.csv' and 'balances.csv', or, if columnar is True, to the
+    columnar tables 'transactions' and 'balances' (see columnar.py), in
+    output_dir (the working directory by default).
+
+    client is the BigQuery client to use; if it is None, one is created using
+    the credentials file. Any object with the same query interface works, e.g.
+    a FakeBigQueryClient, which needs no network access.
+
+    If a cache is given, it is checked before BigQuery is contacted, and the
+    results of a query that misses the cache are stored in it.
+
+    Return the time taken by each query ('transactions_seconds' and
+    'balances_seconds'), the total time ('total_seconds') and the number of
+    bytes processed by BigQuery ('bytes_processed').
     """
+    start = time.perf_counter()
+
+    transactions_path = os.path.join(output_dir, 'transactions' if columnar else 'transactions.csv')
+    balances_path = os.path.join(output_dir, 'balances' if columnar else 'balances.csv')
+
+    if cache is not None:
+        # The selected columns are part of the key, so that results cached before a
+        # column was added (or removed) are never served in place of the new ones.
+        key = cache.key({'filter_values': filter_values, 'transaction_limit': transaction_limit,
+                         'sorting': sorting, 'range': range,
+                         'transaction_columns': ','.join(TRANSACTION_COLUMNS),
+                         'balance_columns': ','.join(BALANCE_COLUMNS)})
+        entry = cache.get(key)
+        stats = {'transactions_seconds': 0.0, 'balances_seconds': 0.0, 'bytes_processed': 0}
+        if entry is None:
+            # Fetch the results into a new cache entry, then copy them from there.
+            entry = cache.prepare(key)
+            stats = _bigquery_helper(credentials, filter_values, transaction_limit, sorting,
+                                     range, client, columnar=True, page_size=page_size,
+                                     output_dir=entry)
+            cache.commit(key)
+        else:
+            print('Using cached query results (no BigQuery quota was used).\n')
+
+        export_table(os.path.join(entry, 'transactions'), transactions_path)
+        export_table(os.path.join(entry, 'balances'), balances_path)
+        print(f"The '{transactions_path}' and '{balances_path}' files should now be in the "
+              "working directory.")
+        return {**stats, 'total_seconds': time.perf_counter() - start}
+
     print('Fetching the Ethereum transaction/balance data from Google BigQuery.')
     print('This may take a while...\n')
-    # Initialize client (this will use the specified credentials file to authenticate)
-    os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = credentials
-    client = bigquery.Client()
+    if client is None:
+        client = _make_client(credentials)
+
+    # The balances are selected from the results table of the transactions query, so
+    # the transactions table is only scanned once, and the balances are always those
+    # of the addresses in the transactions fetched (even if new blocks arrive in
+    # between). Once the transactions query has finished, both results are streamed
+    # to disk at the same time.
+    progress = _Progress()
+    start = time.perf_counter()
+    transactions_job = client.query(_build_transactions_query(filter_values, transaction_limit,
+                                                              sorting, range))
+    transactions_job.result()  # Wait for the query to finish, so its results table exists
+    balances_query = _build_balances_query(str(transactions_job.destination))
+    wait_seconds = time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        transactions_future = pool.submit(
+            stream_job, transactions_job, transactions_path, TRANSACTION_COLUMNS,
+            page_size, partial(progress.update, 'transactions'))
+        balances_future = pool.submit(
+            stream_query, client, balances_query, balances_path, BALANCE_COLUMNS,
+            page_size, partial(progress.update, 'balances'))
+        transactions_stats = transactions_future.result()
+        balances_stats = balances_future.result()
+    progress.finish()
+
+    stats = {
+        'transactions_seconds': wait_seconds + transactions_stats['seconds'],
+        'balances_seconds': balances_stats['seconds'],
+        'total_seconds': time.perf_counter() - start,
+        'bytes_processed': transactions_stats['bytes_processed']
+        + balances_stats['bytes_processed']
+    }
+    print(f"Transactions query successful ({transactions_stats['rows']:,} rows, "
+          f"{stats['transactions_seconds']:.1f}s).")
+    print(f"Balances query successful ({balances_stats['rows']:,} rows, "
+          f"{stats['balances_seconds']:.1f}s).")
+    print(f"Total: {stats['total_seconds']:.1f}s, {stats['bytes_processed']:,} bytes processed.\n")
 
-    # Perform the transactions query (query written in SQL)
-    QUERY = ''.join([
+    # The output directory should now contain the files used to build the transaction graph
+    print('Successfully queried BigQuery for desired data.')
+    if output_dir == '':
+        print(f"The '{transactions_path}' and '{balances_path}' files should now be in the "
+              "working directory.")
+
+    return stats
+
+
+def _build_transactions_query(filter_values: str, transaction_limit: str, sorting: str,
+                              range: str) -> str:
+    """
+    Return the transactions query (written in SQL) for the given query parameters.
+    """
+    return ''.join([
         'SELECT nonce, from_address, to_address, value, block_timestamp ',
         'FROM `bigquery-public-data.crypto_ethereum.transactions` ',
         'WHERE DATE_ADD(CURRENT_DATE(), INTERVAL -', range, ' day) <= DATE(block_timestamp) ',
         filter_values,
         sorting,
         transaction_limit])
-    query_job = client.query(QUERY)  # Make API request
-    transactions = query_job.result()  # Wait for query to finish and assign the returned table 
-    print('Transactions query successful. (1/2)\n')
-
-    # Write results to 'transactions.csv' (file is placed in working directory)
-    with open('transactions.csv', mode='w', newline='') as transactions_file:
-        writer = csv.writer(transactions_file)
-        # Write header row
-        writer.writerow(['nonce', 'from_address', 'to_address', 'value'])
-        # Write all transactions
-        for transaction in transactions:
-            writer.writerow([transaction.nonce, transaction.from_address, 
-                            transaction.to_address, transaction.value])
-
-    # Perform the balances query
-    QUERY = ''.join([
+
+
+def _build_balances_query(transactions_table: str) -> str:
+    """
+    Return the balances query (written in SQL) for the addresses in the given
+    table of transactions, e.g. the results table of the transactions query.
+
+    Both addresses of every transaction are collected with UNNEST, so the table
+    is only read once (rather than once for the senders and once for the
+    receivers).
+    """
+    addresses = ''.join([
+        'SELECT DISTINCT address ',
+        'FROM `', transactions_table, '`, UNNEST([from_address, to_address]) AS address'])
+    return ''.join([
         'SELECT eth_balance, address ',
         'FROM `bigquery-public-data.crypto_ethereum.balances` ',
-        'WHERE address IN ( ',
-            'SELECT from_address ',
-            'FROM `bigquery-public-data.crypto_ethereum.transactions` ',
-            'WHERE DATE_ADD(CURRENT_DATE(), INTERVAL -', range, ' day) <= DATE(block_timestamp) ',
-            filter_values,
-            sorting,
-            transaction_limit,
-        ') OR address IN ( ',
-            'SELECT to_address ',
-            'FROM `bigquery-public-data.crypto_ethereum.transactions` ',
-            'WHERE DATE_ADD(CURRENT_DATE(), INTERVAL -', range, ' day) <= DATE(block_timestamp) ',
-            filter_values,
-            sorting,
-            transaction_limit,
-        ')'])
-    query_job = client.query(QUERY)  # Make API request
-    accounts = query_job.result()  # Wait for query to finish and assign the returned table 
-    print('Balances query successful. (2/2)\n')
-
-    # Write results to 'balances.csv'
-    with open('balances.csv', mode='w', newline='') as transactions_file:
-        writer = csv.writer(transactions_file)
-        # Write header row
-        writer.writerow(['eth_balance', 'address'])
-        # Write all accounts/balances
-        for account in accounts:
-            writer.writerow([account.eth_balance, account.address])
-    
-    # The working directory should now contain the files used to build the transaction graph
-    print('Successfully queried BigQuery for desired data.')
-    print("The 'transactions.csv' and 'balances.csv' files should now be in the working directory.")
+        'WHERE address IN ( ', addresses, ')'])
+
+
+def _make_client(credentials: str) -> Any:
+    """
+    Return a BigQuery client authenticated with the given credentials file.
+    """
+    from google.cloud import bigquery
+
+    # Initialize client (this will use the specified credentials file to authenticate)
+    os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = credentials
+    return bigquery.Client()
+
+
+def stream_query(client: Any, query: str, path: str, columns: list[str],
+                 page_size: int = DEFAULT_PAGE_SIZE,
+                 report: Optional[Callable[[int, int], Any]] = None) -> dict[str, float]:
+    """
+    Run query with client, and write its results to path one page of page_size
+    rows at a time (see stream_job).
+
+    Return the number of rows written, the number of bytes the query processed
+    and the time it took, as a dictionary with the keys 'rows',
+    'bytes_processed' and 'seconds'.
+
+    Preconditions:
+        - columns are the columns selected by query, in order
+        - page_size > 0
+    """
+    start = time.perf_counter()
+    job = client.query(query)  # Make API request
+    stats = stream_job(job, path, columns, page_size, report)
+    return {**stats, 'seconds': time.perf_counter() - start}
+
+
+def stream_job(job: Any, path: str, columns: list[str], page_size: int = DEFAULT_PAGE_SIZE,
+               report: Optional[Callable[[int, int], Any]] = None) -> dict[str, float]:
+    """
+    Write the results of the query job to path one page of page_size rows at a
+    time.
+
+    Return the number of rows written, the number of bytes the query processed
+    and the time it took, as a dictionary with the keys 'rows',
+    'bytes_processed' and 'seconds'.
+
+    If path ends in '.csv', the results are written as a csv file (with columns
+    as its header row); otherwise, they are written as a columnar table.
+    After every page, report is called with the number of rows written so far
+    and the total number of rows (by default, this prints the progress).
+
+    Preconditions:
+        - columns are the columns selected by job's query, in order
+        - page_size > 0
+    """
+    if report is None:
+        progress = _Progress()
+        report = partial(progress.update, 'rows')
+
+    start = time.perf_counter()
+    rows = job.result(page_size=page_size)
+
+    if path.endswith('.csv'):
+        with open(path, mode='w', newline='') as file:
+            writer = csv.writer(file)
+            # Write header row
+            writer.writerow(columns)
+            written = _write_pages(rows, writer.writerows, report)
+    else:
+        with ColumnarWriter(path, columns) as writer:
+            written = _write_pages(rows, writer.write_batch, report)
+
+    return {'rows': written, 'bytes_processed': job.total_bytes_processed or 0,
+            'seconds': time.perf_counter() - start}
+
+
+def _write_pages(rows: Any, write: Callable[[list[tuple]], Any],
+                 report: Callable[[int, int], Any]) -> int:
+    """
+    Pass every page of the query results rows to write, as a list of tuples,
+    reporting the progress after each page. Return the number of rows written.
+    """
+    total = rows.total_rows
+    written = 0
+    for page in rows.pages:
+        batch = [tuple(row) for row in page]
+        write(batch)
+        written += len(batch)
+        report(written, total)
+
+    return written
+
+
+class _Progress:
+    """
+    A progress report for downloads that may run at the same time, printed on
+    a single line.
+
+    Instance Attributes:
+        - counts: maps the name of every download to the number of rows
+          downloaded so far and its total number of rows
+    """
+    counts: dict[str, tuple[int, int]]
+
+    # Private Instance Attributes:
+    #   - _lock: serializes updates from different threads
+    _lock: Lock
+
+    def __init__(self) -> None:
+        """Initialize a progress report with no downloads."""
+        self.counts = {}
+        self._lock = Lock()
+
+    def update(self, name: str, written: int, total: int) -> None:
+        """Record that written of the total rows of the download name are done."""
+        with self._lock:
+            self.counts[name] = (written, total)
+            status = ' | '.join(f'{name}: {written:,} of {total:,} rows'
+                                for name, (written, total) in self.counts.items())
+            print(f'\r  Downloaded {status}', end='', flush=True)
+
+    def finish(self) -> None:
+        """End the progress line."""
+        print()
+
+
+class FakeBigQueryClient:
+    """
+    A local stand-in for google.cloud.bigquery.Client, which answers the queries
+    made by _bigquery_helper with synthetic (but consistent) transactions and
+    balances, without any network access.
+
+    The results are returned in pages, like a real client's, so the whole
+    streaming fetch path can be exercised locally. To measure the fetch stages,
+    every page takes latency seconds to "download", and every query reports the
+    bytes a real one would process: the full size of each table it reads, once
+    for each time it reads it. Like a real client's, the results of every query
+    are stored in a (destination) table that later queries can read.
+
+    Instance Attributes:
+        - transactions: the synthetic transactions, as
+          (nonce, from_address, to_address, value, block_timestamp) rows, whose
+          times are spread over the three days before the client was created
+        - balances: the synthetic balances of every address in transactions, as
+          (eth_balance, address) rows
+        - queries: the queries run so far, in order
+        - results: maps the name of the destination table of every query run so
+          far to the rows of its results
+        - latency: the number of seconds it takes to return each page of results
+
+    Sample Usage:
+    >>> client = FakeBigQueryClient(num_transactions=25, seed=1)
+    >>> rows = client.query('SELECT ... LIMIT 10').result(page_size=4)
+    >>> [len(page) for page in rows.pages]
+    [4, 4, 2]
+    """
+    transactions: list[tuple]
+    balances: list[tuple]
+    queries: list[str]
+    results: dict[str, list[tuple]]
+    latency: float
+
+    def __init__(self, num_transactions: int = 1000, num_accounts: int = 200,
+                 seed: int = 0, latency: float = 0.0) -> None:
+        """
+        Initialize a fake client with num_transactions synthetic transactions
+        between num_accounts accounts.
+        """
+        rng = random.Random(seed)
+        addresses = ['0x%040x' % rng.getrandbits(160) for _ in range(num_accounts)]
+
+        # Like the real client, timestamps are returned as (UTC) datetimes.
+        now = datetime.now(timezone.utc).replace(microsecond=0)
+
+        self.transactions = []
+        for nonce in range(num_transactions):
+            timestamp = now - timedelta(seconds=rng.randrange(3 * 24 * 60 * 60))
+            self.transactions.append((nonce, rng.choice(addresses), rng.choice(addresses),
+                                      rng.randrange(1, 10 ** 22), timestamp))
+
+        used = dict.fromkeys(a for row in self.transactions for a in row[1:3])
+        self.balances = [(rng.randrange(10 ** 24), address) for address in used]
+        self.queries = []
+        self.results = {}
+        self.latency = latency
+
+    def query(self, query: str) -> '_FakeQueryJob':
+        """
+        Start a (fake) query job. Queries on the balances table get the
+        synthetic balances (only those of the addresses in a results table, if
+        the query reads one), and any other query gets the synthetic
+        transactions, truncated to the query's LIMIT (if it has one).
+        """
+        self.queries.append(query)
+        tables = [self.results[name] for name in re.findall(r'`([^`]+)`', query)
+                  if name in self.results]
+
+        # Pretend that every row of any table takes up 100 bytes.
+        bytes_processed = 100 * (
+            len(self.transactions) * query.count('crypto_ethereum.transactions`')
+            + len(self.balances) * query.count('crypto_ethereum.balances`')
+            + sum(len(table) for table in tables))
+
+        if 'crypto_ethereum.balances' in query:
+            rows = self.balances
+            if tables != []:
+                addresses = {address for table in tables for row in table for address in row[1:3]}
+                rows = [row for row in rows if row[1] in addresses]
+        else:
+            limit = re.search(r'LIMIT (\d+)', query)
+            rows = self.transactions
+            if limit is not None:
+                rows = rows[:int(limit.group(1))]
+
+        destination = f'fake-project._anonymous.results_{len(self.queries)}'
+        self.results[destination] = rows
+        return _FakeQueryJob(rows, bytes_processed, destination, self.latency)
+
+
+class _FakeQueryJob:
+    """
+    A query job started by a FakeBigQueryClient.
+
+    Instance Attributes:
+        - rows: the rows of the query's results
+        - total_bytes_processed: the number of bytes the query processed
+        - destination: the name of the table the results are stored in
+        - latency: the number of seconds it takes to return each page of results
+    """
+    rows: list[tuple]
+    total_bytes_processed: int
+    destination: str
+    latency: float
+
+    def __init__(self, rows: list[tuple], total_bytes_processed: int, destination: str,
+                 latency: float) -> None:
+        """Initialize a finished query job with the given results."""
+        self.rows = rows
+        self.total_bytes_processed = total_bytes_processed
+        self.destination = destination
+        self.latency = latency
+
+    def result(self, page_size: Optional[int] = None) -> '_FakeRowIterator':
+        """Return the results of this job, split into pages of page_size rows."""
+        return _FakeRowIterator(self.rows, page_size or DEFAULT_PAGE_SIZE, self.latency)
+
+
+class _FakeRowIterator:
+    """
+    The paged results of a fake query job (like bigquery's RowIterator).
+
+    Instance Attributes:
+        - total_rows: the number of rows in the results
+    """
+    total_rows: int
+
+    # Private Instance Attributes:
+    #   - _rows: the rows of the results
+    #   - _page_size: the number of rows in each page
+    #   - _latency: the number of seconds it takes to return each page
+    _rows: list[tuple]
+    _page_size: int
+    _latency: float
+
+    def __init__(self, rows: list[tuple], page_size: int, latency: float) -> None:
+        """Initialize the results, split into pages of page_size rows."""
+        self.total_rows = len(rows)
+        self._rows = rows
+        self._page_size = page_size
+        self._latency = latency
+
+    @property
+    def pages(self) -> Iterator[list[tuple]]:
+        """Iterate over the pages of the results."""
+        for start in range(0, len(self._rows), self._page_size):
+            time.sleep(self._latency)
+            yield self._rows[start:start + self._page_size]
+
+    def __iter__(self) -> Iterator[tuple]:
+        """Iterate over the rows of the results."""
+        return iter(self._rows)
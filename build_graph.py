@@ -11,11 +11,43 @@ This file is Copyright of Tobey Brizuela, Daniel Lazaro, Matthew Parvaneh, and
 Michael Umeh.
 """
 import csv
+import glob
+import hashlib
+import json
 import math
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Iterator, Optional, Union
+
 import networkx as nx
+import numpy as np
+
+from balance_stats import BalanceStats, graph_balances
+from columnar import is_columnar, read_columnar
+from compact_graph import CompactGraph, Graph, edge_attributes, last_occurrences
+
+# Wei is a smaller denomination of Ether, 1 Ether = 10^18 Wei.
+WEI_PER_ETHER = 10 ** 18
+
+# The exponent that turns an amount of Wei, written in decimal, into an amount of Ether.
+_WEI_EXPONENT = b'e-18'
 
+# The default number of csv rows that the streaming ingest holds in memory at once.
+DEFAULT_CHUNK_SIZE = 100_000
 
-def build_graph(accounts_file: str, transactions_file: str) -> nx.MultiDiGraph:
+# Identifies the on-disk snapshot format written by save_snapshot. The version
+# must be bumped whenever the set or layout of the stored arrays changes.
+SNAPSHOT_FORMAT = 'ethereum-graph-snapshot'
+SNAPSHOT_VERSION = 3
+
+
+def build_graph(accounts_file: Union[str, list[str]], transactions_file: Union[str, list[str]],
+                chunk_size: Optional[int] = None, compact: bool = False,
+                workers: Optional[int] = None) -> Graph:
     """
     Build up and return a networkx Graph object from data provided in
     .csv file format.
@@ -24,15 +56,51 @@ def build_graph(accounts_file: str, transactions_file: str) -> nx.MultiDiGraph:
     Initialize the vertices of the graph to hold the address of the ethereum external
     accounts and their respective balances.
     Then, add edges between all accounts based on transactions that have occurred (must be
-    a directed graph).
+    a directed graph). Every edge holds the value of its transaction (in Ether) as its
+    weight, and the time of the transaction (in seconds since the epoch) as its timestamp,
+    if the transactions file has a block_timestamp column.
+
+    If chunk_size is given, the csv files are instead streamed in chunks of
+    chunk_size rows (see _build_graph_chunked), which is much faster on large
+    files and keeps memory use bounded by the chunk size.
+
+    If compact is True, a CompactGraph (see compact_graph.py) is returned instead
+    of a networkx graph; the files are then always streamed in chunks.
+
+    accounts_file and transactions_file can also be lists of files and/or glob
+    patterns (e.g. 'transactions-*.csv'), for data that was exported in shards.
+    The shards are parsed in parallel by a pool of workers processes (one per
+    core, unless workers is given), and the result is the same graph as if the
+    shards had been concatenated, in order, into one file.
 
     Preconditions:
         - accounts_file != ''
         - transactions_file != ''
+        - chunk_size is None or chunk_size > 0
+        - workers is None or workers > 0
     """
+    accounts_files = _expand_shards(accounts_file)
+    transactions_files = _expand_shards(transactions_file)
+
+    if compact or workers is not None or len(accounts_files) > 1 \
+            or len(transactions_files) > 1:
+        return _build_graph_sharded(accounts_files, transactions_files,
+                                    chunk_size or DEFAULT_CHUNK_SIZE, compact, workers)
+
+    accounts_file, transactions_file = accounts_files[0], transactions_files[0]
+    if is_columnar(accounts_file) or is_columnar(transactions_file):
+        # Columnar tables can only be read in chunks.
+        chunk_size = chunk_size or DEFAULT_CHUNK_SIZE
+    if chunk_size is not None:
+        return _build_graph_chunked(accounts_file, transactions_file, chunk_size)
+
     # Initialize an empty networkx graph.
     graph = nx.MultiDiGraph()
 
+    # The final balance of every account (if an account is repeated, its last row
+    # wins), to compute the statistics of the balances from.
+    ethers = {}
+
     # Begin adding all nodes (account/balance pairings as vertices to graph).
     # Each vertex will be initialize to hold the tuple (account address, Ether balance).
     with open(accounts_file) as af:
@@ -61,6 +129,10 @@ def build_graph(accounts_file: str, transactions_file: str) -> nx.MultiDiGraph:
                     node_size = 30
 
             graph.add_node(item, balance=ether, size=node_size)
+            ethers[item] = ether
+
+    graph.graph['balance_stats'] = BalanceStats.from_values(
+        np.array(list(ethers.values()), dtype=np.float64))
 
     # Add directed edges between nodes based on which addresses complete transactions
     # w/ one another. Edge will be directed going form vertex corresponding to
@@ -75,17 +147,721 @@ def build_graph(accounts_file: str, transactions_file: str) -> nx.MultiDiGraph:
             from_addr = transaction[1]
             to_addr = transaction[2]
             value = transaction[3]
+            timestamp = parse_timestamp(transaction[4]) if len(transaction) > 4 else math.nan
 
             # Convert the value of Wei into Ether
             # Wei is a smaller denomination of Ether, 1 Ether = 10^18 Wei.
-            value = float(value) / (10 ** 18)
+            # The value is parsed as an (exact) int, since converting it to a
+            # float first would round it before the division.
+            value = int(value) / WEI_PER_ETHER
 
             # Add an edge between the two accounts based on the transaction.
-            graph.add_edge(from_addr, to_addr, weight=value)
+            graph.add_edge(from_addr, to_addr, **edge_attributes(value, timestamp))
+
+    return graph
+
+
+def _build_graph_chunked(accounts_file: str, transactions_file: str,
+                         chunk_size: int) -> nx.MultiDiGraph:
+    """
+    Streaming version of build_graph, which produces the same graph.
+
+    Both csv files are read chunk_size rows at a time; the Wei to Ether
+    conversion and node size bucketing are done on each chunk as a whole, and
+    its nodes and edges are inserted into the graph in bulk.
+
+    The ingest throughput (in rows per second) is printed once the graph is built.
+
+    Preconditions:
+        - chunk_size > 0
+    """
+    graph = nx.MultiDiGraph()
+    graph.graph['balance_stats'] = BalanceStats()
+    start = time.perf_counter()
+
+    num_accounts = 0
+    for addresses, balances, sizes in read_account_chunks(accounts_file, chunk_size):
+        _set_networkx_accounts(graph, addresses, balances, sizes)
+        num_accounts += len(addresses)
+
+    num_transactions = 0
+    for from_addrs, to_addrs, weights, timestamps in read_transaction_chunks(transactions_file,
+                                                                             chunk_size):
+        graph.add_edges_from(
+            (from_addr, to_addr, edge_attributes(weight, timestamp))
+            for from_addr, to_addr, weight, timestamp in zip(from_addrs, to_addrs,
+                                                             weights.tolist(),
+                                                             timestamps.tolist()))
+        num_transactions += len(from_addrs)
+
+    elapsed = time.perf_counter() - start
+    rows = num_accounts + num_transactions
+    print(f'Ingested {num_accounts} accounts and {num_transactions} transactions '
+          f'in {elapsed:.2f}s ({rows / max(elapsed, 1e-9):,.0f} rows/sec).')
+
+    return graph
+
+
+def _build_graph_sharded(accounts_files: list[str], transactions_files: list[str],
+                         chunk_size: int, compact: bool,
+                         workers: Optional[int]) -> Graph:
+    """
+    Sharded version of build_graph, which produces the same graph as building
+    it from the concatenation of the shards (in order).
+
+    Every shard is parsed (in chunks of chunk_size rows) on its own, in a pool of
+    workers processes if there is more than one shard or workers > 1. Each
+    transactions shard interns its addresses locally; the shards are then merged
+    in order, which assigns node ids in the same order a serial build would.
+
+    Preconditions:
+        - chunk_size > 0
+        - workers is None or workers > 0
+    """
+    start = time.perf_counter()
+
+    num_shards = len(accounts_files) + len(transactions_files)
+    if workers == 1 or (workers is None and num_shards <= 2):
+        account_parts = [_parse_account_shard(path, chunk_size) for path in accounts_files]
+        transaction_parts = [_parse_transaction_shard(path, chunk_size)
+                             for path in transactions_files]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            account_futures = [pool.submit(_parse_account_shard, path, chunk_size)
+                               for path in accounts_files]
+            transaction_futures = [pool.submit(_parse_transaction_shard, path, chunk_size)
+                                   for path in transactions_files]
+            account_parts = [future.result() for future in account_futures]
+            transaction_parts = [future.result() for future in transaction_futures]
+
+    graph = _assemble_graph(account_parts, transaction_parts, compact)
+
+    elapsed = time.perf_counter() - start
+    num_accounts = sum(len(part[0]) for part in account_parts)
+    num_transactions = sum(len(part[3]) for part in transaction_parts)
+    rows = num_accounts + num_transactions
+    print(f'Ingested {num_accounts} accounts and {num_transactions} transactions '
+          f'from {num_shards} file(s) in {elapsed:.2f}s ({rows / max(elapsed, 1e-9):,.0f} '
+          f'rows/sec).')
+
+    return graph
+
+
+def _parse_account_shard(accounts_file: str, chunk_size: int) \
+        -> tuple[list[str], np.ndarray, np.ndarray]:
+    """
+    Parse a whole accounts file (in chunks of chunk_size rows), and return its
+    addresses, balances and node sizes.
+
+    Preconditions:
+        - chunk_size > 0
+    """
+    addresses, balances, sizes = [], [np.zeros(0)], [np.zeros(0)]
+    for chunk_addresses, chunk_balances, chunk_sizes in read_account_chunks(accounts_file,
+                                                                            chunk_size):
+        addresses.extend(chunk_addresses)
+        balances.append(chunk_balances)
+        sizes.append(chunk_sizes)
+
+    return addresses, np.concatenate(balances), np.concatenate(sizes)
+
+
+def _parse_transaction_shard(transactions_file: str, chunk_size: int) \
+        -> tuple[list[str], np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Parse a whole transactions file (in chunks of chunk_size rows).
+
+    Return a tuple (addresses, sources, targets, weights, timestamps), where
+    addresses holds every address in the file, in order of first appearance, and
+    sources and targets hold the position in addresses of the endpoints of each
+    transaction.
 
+    Preconditions:
+        - chunk_size > 0
+    """
+    index = {}
+    sources, targets, weights = [np.zeros(0, np.int64)], [np.zeros(0, np.int64)], [np.zeros(0)]
+    timestamps = [np.zeros(0)]
+    for from_addrs, to_addrs, chunk_weights, chunk_timestamps in \
+            read_transaction_chunks(transactions_file, chunk_size):
+        # Intern the endpoints of each transaction in turn (sender first), just
+        # like graph.add_edge would add them.
+        ids = np.array([index.setdefault(a, len(index))
+                        for pair in zip(from_addrs, to_addrs) for a in pair], dtype=np.int64)
+        sources.append(ids[0::2])
+        targets.append(ids[1::2])
+        weights.append(chunk_weights)
+        timestamps.append(chunk_timestamps)
+
+    return (list(index), np.concatenate(sources), np.concatenate(targets),
+            np.concatenate(weights), np.concatenate(timestamps))
+
+
+def _assemble_graph(account_parts: list[tuple[list[str], np.ndarray, np.ndarray]],
+                    transaction_parts: list[tuple[list[str], np.ndarray, np.ndarray,
+                                                  np.ndarray, np.ndarray]],
+                    compact: bool) -> Graph:
+    """
+    Merge the parsed shards returned by _parse_account_shard and
+    _parse_transaction_shard into a single graph (a CompactGraph if compact is
+    True, otherwise a networkx graph).
+
+    Node ids are assigned in the same order that build_graph adds the nodes to
+    its graph: accounts first, then the endpoints of each transaction in turn.
+    """
+    # Maps every address to its id; ids are handed out in insertion order.
+    index = {}
+
+    account_ids = []
+    for addresses, _, _ in account_parts:
+        account_ids.append(np.array([index.setdefault(a, len(index)) for a in addresses],
+                                    dtype=np.int64))
+
+    sources, targets, weights = [np.zeros(0, np.int64)], [np.zeros(0, np.int64)], [np.zeros(0)]
+    timestamps = [np.zeros(0)]
+    for addresses, part_sources, part_targets, part_weights, part_timestamps \
+            in transaction_parts:
+        # Translate the shard's local ids into global ones.
+        remap = np.array([index.setdefault(a, len(index)) for a in addresses], dtype=np.int64)
+        sources.append(remap[part_sources])
+        targets.append(remap[part_targets])
+        weights.append(part_weights)
+        timestamps.append(part_timestamps)
+
+    sources, targets = np.concatenate(sources), np.concatenate(targets)
+    weights, timestamps = np.concatenate(weights), np.concatenate(timestamps)
+
+    num_nodes = len(index)
+    balances = np.zeros(num_nodes)
+    has_balance = np.zeros(num_nodes, dtype=bool)
+    sizes = np.full(num_nodes, 10.0)
+    for ids, (_, part_balances, part_sizes) in zip(account_ids, account_parts):
+        # If an address is repeated, its last row wins (as with graph.add_node).
+        keep = last_occurrences(ids)
+        balances[ids[keep]] = part_balances[keep]
+        sizes[ids[keep]] = part_sizes[keep]
+        has_balance[ids] = True
+
+    if compact:
+        graph = CompactGraph(list(index), balances, has_balance, sizes,
+                             sources, targets, weights, timestamps)
+        graph.graph['balance_stats'] = BalanceStats.from_values(balances[has_balance])
+        return graph
+
+    addresses = list(index)
+    graph = nx.MultiDiGraph()
+    graph.graph['balance_stats'] = BalanceStats.from_values(balances[has_balance])
+    graph.add_nodes_from(
+        (address, {'balance': balance, 'size': size} if has else {})
+        for address, balance, size, has in zip(addresses, balances.tolist(), sizes.tolist(),
+                                               has_balance.tolist()))
+    graph.add_edges_from(
+        (addresses[u], addresses[v], edge_attributes(w, t))
+        for u, v, w, t in zip(sources.tolist(), targets.tolist(), weights.tolist(),
+                              timestamps.tolist()))
     return graph
 
 
+def _expand_shards(files: Union[str, list[str]]) -> list[str]:
+    """
+    Return the list of files named by files, which is a path, a glob pattern,
+    or a list of paths and/or glob patterns. The matches of a pattern are sorted
+    by name.
+
+    >>> _expand_shards(['balances.csv', 'transactions.csv'])
+    ['balances.csv', 'transactions.csv']
+    """
+    if isinstance(files, str):
+        files = [files]
+
+    paths = []
+    for pattern in files:
+        if any(c in pattern for c in '*?['):
+            paths.extend(sorted(glob.glob(pattern)))
+        else:
+            paths.append(pattern)
+
+    return paths
+
+
+def update_graph(graph: Graph, transactions_file: Optional[str] = None,
+                 accounts_file: Optional[str] = None,
+                 chunk_size: int = DEFAULT_CHUNK_SIZE) -> None:
+    """
+    Merge new data into a graph returned by build_graph (or loaded from a
+    snapshot with load_snapshot(...).to_compact()), without rebuilding it.
+
+    transactions_file holds only the new transactions, and accounts_file only
+    the accounts whose balance has changed (or that are new); both are in the
+    same format as the files passed to build_graph. Updated accounts get a new
+    balance and node size, and degree counts are updated with the new edges,
+    so the cost of the update depends only on the size of these files.
+
+    The statistics of the balances attached to the graph by build_graph (see
+    balance_stats.py) are updated along with the balances.
+
+    A persisted graph can be updated by loading it, updating it, and saving it
+    again with save_snapshot.
+
+    Preconditions:
+        - chunk_size > 0
+    """
+    if accounts_file is not None:
+        for addresses, balances, sizes in read_account_chunks(accounts_file, chunk_size):
+            if isinstance(graph, CompactGraph):
+                graph.set_accounts(addresses, balances, sizes)
+            else:
+                _set_networkx_accounts(graph, addresses, balances, sizes)
+
+    if transactions_file is not None:
+        for from_addrs, to_addrs, weights, timestamps in \
+                read_transaction_chunks(transactions_file, chunk_size):
+            if isinstance(graph, CompactGraph):
+                graph.add_transactions(from_addrs, to_addrs, weights, timestamps)
+            else:
+                graph.add_edges_from(
+                    (from_addr, to_addr, edge_attributes(weight, timestamp))
+                    for from_addr, to_addr, weight, timestamp in zip(from_addrs, to_addrs,
+                                                                     weights.tolist(),
+                                                                     timestamps.tolist()))
+
+
+def _set_networkx_accounts(graph: nx.MultiDiGraph, addresses: list[str], balances: np.ndarray,
+                           sizes: np.ndarray) -> None:
+    """
+    Set the balance and node size of each of the given accounts of a networkx
+    graph, adding the accounts that aren't in the graph yet, and update the
+    statistics of its balances (if it has them). If an address is repeated, its
+    last balance is used.
+
+    Preconditions:
+        - len(addresses) == len(balances) == len(sizes)
+    """
+    stats = graph.graph.get('balance_stats')
+    stale = False
+    if stats is not None:
+        latest = dict(zip(addresses, balances.tolist()))
+        stale = stats.remove(np.array([graph.nodes[address]['balance'] for address in latest
+                                       if address in graph and graph.nodes[address] != {}],
+                                      dtype=np.float64))
+        stats.add(np.array(list(latest.values()), dtype=np.float64))
+
+    graph.add_nodes_from(
+        (address, {'balance': balance, 'size': size})
+        for address, balance, size in zip(addresses, balances.tolist(), sizes.tolist()))
+
+    if stale:
+        current = graph_balances(graph)
+        stats.set_extremes(float(current.min()), float(current.max()))
+
+
+def read_account_chunks(accounts_file: str, chunk_size: int = DEFAULT_CHUNK_SIZE) \
+        -> Iterator[tuple[list[str], np.ndarray, np.ndarray]]:
+    """
+    Stream accounts_file in chunks of at most chunk_size rows.
+
+    Yield a tuple (addresses, balances, sizes) for every chunk, where balances
+    holds the Ether balance of each address and sizes the size of its node.
+
+    accounts_file can also be a table in the columnar format (see columnar.py),
+    in which case every part of the table is one chunk.
+
+    Preconditions:
+        - chunk_size > 0
+    """
+    if is_columnar(accounts_file):
+        for part in read_columnar(accounts_file):
+            columns = list(part.values())
+            balances = wei_to_ether(columns[0])
+            yield columns[1].tolist(), balances, node_sizes(balances)
+        return
+
+    # pandas is slow to import, so it is only loaded once a csv file is read in chunks.
+    import pandas as pd
+
+    reader = pd.read_csv(accounts_file, usecols=[0, 1], dtype=str,
+                         keep_default_na=False, chunksize=chunk_size)
+    for chunk in reader:
+        balances = wei_to_ether(chunk.iloc[:, 0].to_numpy())
+        yield chunk.iloc[:, 1].tolist(), balances, node_sizes(balances)
+
+
+def read_transaction_chunks(transactions_file: str, chunk_size: int = DEFAULT_CHUNK_SIZE) \
+        -> Iterator[tuple[list[str], list[str], np.ndarray, np.ndarray]]:
+    """
+    Stream transactions_file in chunks of at most chunk_size rows.
+
+    Yield a tuple (from_addresses, to_addresses, weights, timestamps) for every
+    chunk, where weights holds the value (in Ether) of each transaction and
+    timestamps its time (see parse_timestamps). The timestamps are all nan if
+    the file has no block_timestamp column (its fifth).
+
+    transactions_file can also be a table in the columnar format (see
+    columnar.py), in which case every part of the table is one chunk.
+
+    Preconditions:
+        - chunk_size > 0
+    """
+    if is_columnar(transactions_file):
+        for part in read_columnar(transactions_file):
+            columns = list(part.values())
+            yield (columns[1].tolist(), columns[2].tolist(), wei_to_ether(columns[3]),
+                   _chunk_timestamps(columns[4:], len(columns[3])))
+        return
+
+    import pandas as pd
+
+    # Files written before the block_timestamp column was added only have four columns.
+    num_columns = len(pd.read_csv(transactions_file, nrows=0).columns)
+    reader = pd.read_csv(transactions_file, usecols=range(1, min(num_columns, 5)), dtype=str,
+                         keep_default_na=False, chunksize=chunk_size)
+    for chunk in reader:
+        columns = [chunk.iloc[:, i].to_numpy() for i in range(chunk.shape[1])]
+        yield (columns[0].tolist(), columns[1].tolist(), wei_to_ether(columns[2]),
+               _chunk_timestamps(columns[3:], len(chunk)))
+
+
+def _chunk_timestamps(columns: list[np.ndarray], num_rows: int) -> np.ndarray:
+    """
+    Return the timestamps of a chunk of num_rows transactions, given the list of
+    the chunk's columns after its value column (which is empty for files with
+    no block_timestamp column).
+    """
+    if columns == []:
+        return np.full(num_rows, np.nan)
+    return parse_timestamps(columns[0])
+
+
+def wei_to_ether(values: np.ndarray) -> np.ndarray:
+    """
+    Convert an array of Wei amounts (as decimal strings) into an array of Ether.
+
+    The amounts can have up to 27 digits, which is more than a float (or an
+    int64) holds exactly, so dividing them as floats would round them twice.
+    Instead, the exponent 'e-18' is written after the digits of every amount,
+    and the whole array is parsed as floats at once: parsing rounds correctly,
+    so this gives exactly the same floats as int(value) / WEI_PER_ETHER.
+
+    >>> wei_to_ether(np.array(['1000000000000000000', '123456789012345678901234567']))
+    array([1.00000000e+00, 1.23456789e+08])
+    >>> wei_to_ether(np.array(['0', '1500000000000000000', '25'])).tolist()
+    [0.0, 1.5, 2.5e-17]
+    """
+    text = np.asarray(values).astype(np.bytes_)
+    width = text.dtype.itemsize + len(_WEI_EXPONENT)
+    text = text.astype(f'S{width}')
+
+    # Write the exponent into the (zero padded) bytes right after each amount's digits.
+    chars = text.view(np.uint8)
+    ends = np.arange(0, len(text) * width, width) + np.char.str_len(text)
+    for i, char in enumerate(_WEI_EXPONENT):
+        chars[ends + i] = char
+
+    return text.astype(np.float64)
+
+
+def parse_timestamps(values: np.ndarray) -> np.ndarray:
+    """
+    Convert an array of block timestamps (as strings, like the ones BigQuery
+    returns) into an array of the number of seconds since the epoch, with nan
+    for empty timestamps.
+
+    Timestamps are in UTC, and only their first 19 characters (up to the
+    seconds) are used, so any fractional seconds and time zone are ignored.
+
+    >>> times = np.array(['2021-04-10 12:24:56+00:00', '2021-04-10 12:24:57 UTC', ''])
+    >>> parse_timestamps(times).tolist()
+    [1618057496.0, 1618057497.0, nan]
+    """
+    text = np.asarray(values, dtype='U19')
+    times = np.where(text == '', 'NaT', text).astype('datetime64[s]')
+
+    seconds = times.astype(np.int64).astype(np.float64)
+    seconds[np.isnat(times)] = np.nan
+    return seconds
+
+
+def parse_timestamp(value: str) -> float:
+    """
+    Convert a single block timestamp into the number of seconds since the epoch
+    (or nan if it is empty), exactly like parse_timestamps.
+
+    >>> parse_timestamp('2021-04-10 12:24:56 UTC')
+    1618057496.0
+    """
+    if value == '':
+        return math.nan
+    return float(np.datetime64(value[:19], 's').astype(np.int64))
+
+
+def node_sizes(balances: np.ndarray) -> np.ndarray:
+    """
+    Return the size of the node of every account with the given Ether balances:
+    the more Ether, the bigger the node.
+
+    Accounts with at most 10 Ether have size 10, and the size then grows with
+    the order of magnitude of the balance, up to a maximum of 30.
+
+    >>> node_sizes(np.array([0.5, 10.0, 150.0, 10.0 ** 20]))
+    array([10., 10., 15., 30.])
+    """
+    # Only take the log of the balances that need it (the rest may be 0). The
+    # log is computed as log(x) / log(10), the same way as math.log(x, 10).
+    big = balances > 10
+    magnitude = np.zeros(len(balances))
+    magnitude[big] = np.floor(np.log(balances[big]) / math.log(10))
+
+    sizes = np.minimum((magnitude + 10) * 1.25, 30)
+    return np.where(big, sizes, 10.0)
+
+
+@dataclass
+class GraphSnapshot:
+    """
+    A read-only, array-based view of a transaction graph that was loaded
+    from disk by load_snapshot.
+
+    Every array is memory-mapped, so opening a snapshot only reads its
+    metadata; the data itself is paged in lazily as it is accessed.
+
+    Instance Attributes:
+        - addresses: the interned account addresses; node i has address addresses[i]
+        - balances: the Ether balance of every node (0.0 if it has none)
+        - has_balance: whether each node appeared in the accounts file
+        - sizes: the plotting size of every node
+        - indptr: CSR offsets; the edges leaving node i are indptr[i]:indptr[i + 1]
+        - sources: the source node of every edge (sorted, matches indptr)
+        - targets: the target node of every edge
+        - weights: the value (in Ether) of every edge
+        - timestamps: the time of every edge (in seconds since the epoch, or nan)
+        - rev_indptr: CSR offsets of the incoming edges of every node
+        - rev_edges: the ids of the edges entering every node, grouped by target
+        - fingerprint: the fingerprints of the csv files the graph was built from
+
+    Representation Invariants:
+        - len(self.balances) == len(self.addresses) == len(self.sizes)
+        - len(self.indptr) == len(self.addresses) + 1
+        - len(self.sources) == len(self.targets) == len(self.weights) == len(self.timestamps)
+    """
+    addresses: np.ndarray
+    balances: np.ndarray
+    has_balance: np.ndarray
+    sizes: np.ndarray
+    indptr: np.ndarray
+    sources: np.ndarray
+    targets: np.ndarray
+    weights: np.ndarray
+    timestamps: np.ndarray
+    rev_indptr: np.ndarray
+    rev_edges: np.ndarray
+    fingerprint: dict
+
+    def to_compact(self) -> CompactGraph:
+        """
+        Return the CompactGraph stored in this snapshot. Its arrays stay
+        memory-mapped, so this only has to decode the address table.
+        """
+        return CompactGraph.from_snapshot(self)
+
+    def to_networkx(self) -> nx.MultiDiGraph:
+        """
+        Rebuild the networkx representation of this snapshot, with the same
+        node and edge attributes that build_graph would have produced.
+        """
+        return self.to_compact().to_networkx()
+
+
+def csv_fingerprint(path: str) -> dict:
+    """
+    Return a fingerprint of the file at path: its size, modification time and
+    the SHA-256 digest of its contents.
+
+    If path is a columnar table (a directory), the fingerprint covers all of
+    its files: their total size, latest modification time and combined digest.
+
+    Preconditions:
+        - os.path.exists(path)
+    """
+    digest = hashlib.sha256()
+    for file in _data_files(path):
+        with open(file, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+
+    size, mtime_ns = _quick_stat(path)
+    return {'size': size, 'mtime_ns': mtime_ns, 'sha256': digest.hexdigest()}
+
+
+def _data_files(path: str) -> list[str]:
+    """
+    Return the files that hold the data at path: path itself if it is a file,
+    or every file in it (sorted by name) if it is a directory.
+    """
+    if os.path.isdir(path):
+        return [os.path.join(path, name) for name in sorted(os.listdir(path))]
+    return [path]
+
+
+def _quick_stat(path: str) -> tuple[int, int]:
+    """
+    Return the total size and the latest modification time (in nanoseconds) of
+    the data files at path.
+    """
+    stats = [os.stat(file) for file in _data_files(path)]
+    return sum(stat.st_size for stat in stats), max(stat.st_mtime_ns for stat in stats)
+
+
+def save_snapshot(graph: Graph, snapshot_dir: str,
+                  accounts_file: str, transactions_file: str) -> None:
+    """
+    Write graph to snapshot_dir in the binary snapshot format, so that it can
+    later be reopened with load_snapshot instead of being rebuilt from the
+    csv files.
+
+    The snapshot records a fingerprint of accounts_file and transactions_file,
+    which snapshot_is_stale uses to tell when the csv files have changed.
+
+    Any snapshot already in snapshot_dir is replaced, which is safe even if
+    graph was loaded from it (and so is still memory-mapped from its files).
+
+    Preconditions:
+        - accounts_file and transactions_file are the files graph was built from
+    """
+    # The snapshot is written to a new directory next to snapshot_dir, which then
+    # takes its place. This way, the files of the snapshot being replaced are never
+    # truncated while graph's arrays may still be mapped from them, and a snapshot
+    # whose write was interrupted is never left in snapshot_dir.
+    parent = os.path.dirname(os.path.abspath(snapshot_dir))
+    os.makedirs(parent, exist_ok=True)
+    temp_dir = tempfile.mkdtemp(prefix='.snapshot-', dir=parent)
+    try:
+        _write_snapshot(graph, temp_dir, accounts_file, transactions_file)
+    except BaseException:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        raise
+
+    old_dir = None
+    if os.path.exists(snapshot_dir):
+        old_dir = tempfile.mkdtemp(prefix='.snapshot-old-', dir=parent)
+        os.replace(snapshot_dir, os.path.join(old_dir, 'snapshot'))
+    os.replace(temp_dir, snapshot_dir)
+
+    if old_dir is not None:
+        # Open memory maps keep the old files readable (except on Windows, where
+        # they can't be removed until they are closed).
+        shutil.rmtree(old_dir, ignore_errors=True)
+
+
+def _write_snapshot(graph: Graph, snapshot_dir: str,
+                    accounts_file: str, transactions_file: str) -> None:
+    """
+    Write graph to the (empty) directory snapshot_dir, for save_snapshot.
+    """
+    # The compact representation already holds the interned address table and
+    # the CSR edge arrays, so a networkx graph is converted to it first.
+    if not isinstance(graph, CompactGraph):
+        graph = CompactGraph.from_networkx(graph)
+
+    # Make sure that edges added by update_graph are covered by the CSR arrays.
+    graph.compact()
+
+    arrays = {
+        'addresses': np.array([address.encode() for address in graph.addresses],
+                              dtype=np.bytes_),
+        'balances': graph.balances,
+        'has_balance': graph.has_balance,
+        'sizes': graph.sizes,
+        'indptr': graph.indptr,
+        'sources': graph.sources,
+        'targets': graph.targets,
+        'weights': graph.weights,
+        'timestamps': graph.timestamps,
+        'rev_indptr': graph.rev_indptr,
+        'rev_edges': graph.rev_edges
+    }
+    for name, array in arrays.items():
+        np.save(os.path.join(snapshot_dir, name + '.npy'), array)
+
+    # The metadata is written last, so a snapshot whose write was interrupted
+    # is never mistaken for a complete one.
+    meta = {
+        'format': SNAPSHOT_FORMAT,
+        'version': SNAPSHOT_VERSION,
+        'num_nodes': graph.number_of_nodes(),
+        'num_edges': graph.number_of_edges(),
+        'fingerprint': {'accounts': csv_fingerprint(accounts_file),
+                        'transactions': csv_fingerprint(transactions_file)}
+    }
+    with open(os.path.join(snapshot_dir, 'meta.json'), 'w') as f:
+        json.dump(meta, f, indent=2)
+
+
+def _read_snapshot_meta(snapshot_dir: str) -> dict:
+    """
+    Read and validate the metadata of the snapshot in snapshot_dir.
+
+    Raise a ValueError if snapshot_dir doesn't contain a snapshot of a version
+    that this module can read.
+    """
+    with open(os.path.join(snapshot_dir, 'meta.json')) as f:
+        meta = json.load(f)
+
+    if meta.get('format') != SNAPSHOT_FORMAT:
+        raise ValueError(f'{snapshot_dir} does not contain a graph snapshot')
+    if meta.get('version') != SNAPSHOT_VERSION:
+        raise ValueError(f'Unsupported snapshot version {meta.get("version")} '
+                         f'(expected {SNAPSHOT_VERSION})')
+
+    return meta
+
+
+def load_snapshot(snapshot_dir: str) -> GraphSnapshot:
+    """
+    Open the snapshot stored in snapshot_dir by save_snapshot.
+
+    The arrays are memory-mapped rather than read, so this takes roughly the
+    same time no matter how large the graph is.
+
+    Preconditions:
+        - snapshot_dir contains a snapshot written by save_snapshot
+    """
+    meta = _read_snapshot_meta(snapshot_dir)
+
+    arrays = {}
+    for name in ('addresses', 'balances', 'has_balance', 'sizes', 'indptr',
+                 'sources', 'targets', 'weights', 'timestamps', 'rev_indptr', 'rev_edges'):
+        arrays[name] = np.load(os.path.join(snapshot_dir, name + '.npy'), mmap_mode='r')
+
+    return GraphSnapshot(fingerprint=meta['fingerprint'], **arrays)
+
+
+def snapshot_is_stale(snapshot_dir: str, accounts_file: str, transactions_file: str) -> bool:
+    """
+    Return whether the snapshot in snapshot_dir is missing or out of date with
+    respect to accounts_file and transactions_file.
+
+    The size and modification time of each file are compared first; the
+    (slower) content digest is only computed when those differ, so that a file
+    that was merely touched or copied doesn't invalidate the snapshot.
+    """
+    try:
+        fingerprint = _read_snapshot_meta(snapshot_dir)['fingerprint']
+    except (OSError, ValueError):
+        return True
+
+    for key, path in (('accounts', accounts_file), ('transactions', transactions_file)):
+        saved = fingerprint[key]
+
+        size, mtime_ns = _quick_stat(path)
+        if size != saved['size']:
+            return True
+        if mtime_ns != saved['mtime_ns'] \
+                and csv_fingerprint(path)['sha256'] != saved['sha256']:
+            return True
+
+    return False
+
+
 if __name__ == '__main__':
     import doctest
     doctest.testmod()
@@ -93,9 +869,14 @@ if __name__ == '__main__':
     import python_ta
     python_ta.check_all(config={
         'max-line-length': 100,
-        'disable': ['E1136'],
-        'extra-imports': ['csv', 'networkx', 'math'],
-        'allowed-io': ['build_graph'],
+        'disable': ['E1136', 'C0415'],
+        'extra-imports': ['csv', 'networkx', 'math', 'hashlib', 'json', 'os', 'glob',
+                          'concurrent.futures', 'shutil', 'tempfile',
+                          'dataclasses', 'numpy', 'pandas', 'time', 'typing',
+                          'balance_stats', 'compact_graph', 'columnar'],
+        'allowed-io': ['build_graph', 'csv_fingerprint', '_write_snapshot',
+                       '_read_snapshot_meta', '_build_graph_chunked',
+                       '_build_graph_sharded'],
         'max-nested-blocks': 4
     })
 
@@ -106,3 +887,14 @@ if __name__ == '__main__':
     # Create the representation of the Ethereum blockchain network based on the
     # subset of data collected.
     # ethereum_graph = build_graph('balances.csv', 'transactions.csv')
+    #
+    # Save it as a snapshot, so later runs can skip parsing the csv files:
+    # save_snapshot(ethereum_graph, 'graph_snapshot', 'balances.csv', 'transactions.csv')
+    # if not snapshot_is_stale('graph_snapshot', 'balances.csv', 'transactions.csv'):
+    #     ethereum_graph = load_snapshot('graph_snapshot').to_networkx()
+    #
+    # Or use the compact representation, which needs far less memory:
+    # ethereum_graph = build_graph('balances.csv', 'transactions.csv', compact=True)
+    #
+    # Daily exports can be passed as a list or a glob pattern, and are parsed in parallel:
+    # ethereum_graph = build_graph('balances-*.csv', 'transactions-*.csv', compact=True)
@@ -0,0 +1,182 @@
+"""
+CSC111 Final Project: Reconstructing the Ethereum Network Using
+Graph Data Structures in Python
+
+General Information
+------------------------------------------------------------------------------
+This file was created for the purpose of applying concepts in learned in
+CSC111 to the real world problem domain of cryptocurrency transactions.
+
+Module Info: columnar.py
+
+This file contains a small columnar table format, used to store query results
+from BigQuery. A table is a directory holding a schema file and a sequence of
+compressed parts, each of which stores one batch of rows column by column.
+Tables are written and read one part at a time, so memory use is bounded by
+the size of a part rather than the size of the table.
+
+Copyright Information
+------------------------------------------------------------------------------
+This file is Copyright of Tobey Brizuela, Daniel Lazaro, Matthew Parvaneh, and
+Michael Umeh.
+"""
+import csv
+import json
+import os
+import shutil
+from typing import Any, Iterator
+
+import numpy as np
+
+# The name of the file describing a columnar table, inside its directory.
+SCHEMA_FILE = 'schema.json'
+
+
+class ColumnarWriter:
+    """
+    A writer that stores a table in the columnar format, one batch of rows at a
+    time. Every value is stored as a string (None becomes ''), exactly as it
+    would be written to a csv file.
+
+    The schema file is only written by close, so a table whose write was
+    interrupted is never mistaken for a complete one.
+
+    Instance Attributes:
+        - path: the directory the table is written to
+        - columns: the names of the columns of the table
+        - num_rows: the number of rows written so far
+
+    Sample Usage:
+    >>> import tempfile
+    >>> path = os.path.join(tempfile.mkdtemp(), 'table')
+    >>> with ColumnarWriter(path, ['a', 'b']) as writer:
+    ...     writer.write_batch([(1, 'x'), (2, None)])
+    ...     writer.write_batch([(3, 'z')])
+    >>> [part['a'].tolist() for part in read_columnar(path)]
+    [['1', '2'], ['3']]
+    >>> read_schema(path)['num_rows']
+    3
+    """
+    path: str
+    columns: list[str]
+    num_rows: int
+
+    # Private Instance Attributes:
+    #   - _parts: the file names of the parts written so far
+    _parts: list[str]
+
+    def __init__(self, path: str, columns: list[str]) -> None:
+        """Initialize a writer for a new table with the given columns in path."""
+        os.makedirs(path, exist_ok=True)
+
+        # Remove the schema of any table previously stored here, since its
+        # parts are about to be overwritten.
+        if os.path.exists(os.path.join(path, SCHEMA_FILE)):
+            os.remove(os.path.join(path, SCHEMA_FILE))
+
+        self.path = path
+        self.columns = columns
+        self.num_rows = 0
+        self._parts = []
+
+    def __enter__(self) -> 'ColumnarWriter':
+        """Return this writer, for use in a with statement."""
+        return self
+
+    def __exit__(self, exc_type: Any, exc_value: Any, traceback: Any) -> None:
+        """Close this writer, unless the with statement raised an exception."""
+        if exc_type is None:
+            self.close()
+
+    def write_batch(self, rows: list[tuple]) -> None:
+        """
+        Append a batch of rows to the table, as a new part.
+
+        Preconditions:
+            - all(len(row) == len(self.columns) for row in rows)
+        """
+        if rows == []:
+            return
+
+        values = zip(*(['' if v is None else str(v) for v in row] for row in rows))
+        arrays = {name: np.array(column) for name, column in zip(self.columns, values)}
+
+        name = f'part-{len(self._parts):05d}.npz'
+        np.savez_compressed(os.path.join(self.path, name), **arrays)
+        self._parts.append(name)
+        self.num_rows += len(rows)
+
+    def close(self) -> None:
+        """Finish writing the table, by writing its schema file."""
+        schema = {'columns': self.columns, 'num_rows': self.num_rows, 'parts': self._parts}
+        with open(os.path.join(self.path, SCHEMA_FILE), 'w') as f:
+            json.dump(schema, f, indent=2)
+
+
+def is_columnar(path: str) -> bool:
+    """Return whether path is a (complete) table in the columnar format."""
+    return os.path.isfile(os.path.join(path, SCHEMA_FILE))
+
+
+def read_schema(path: str) -> dict:
+    """
+    Return the schema of the columnar table in path: its column names, number
+    of rows, and the file names of its parts.
+
+    Preconditions:
+        - is_columnar(path)
+    """
+    with open(os.path.join(path, SCHEMA_FILE)) as f:
+        return json.load(f)
+
+
+def read_columnar(path: str) -> Iterator[dict[str, np.ndarray]]:
+    """
+    Iterate over the parts of the columnar table in path, yielding each part as
+    a dictionary mapping column names to arrays of strings.
+
+    Preconditions:
+        - is_columnar(path)
+    """
+    schema = read_schema(path)
+    for name in schema['parts']:
+        with np.load(os.path.join(path, name)) as part:
+            yield {column: part[column] for column in schema['columns']}
+
+
+def export_table(path: str, destination: str) -> None:
+    """
+    Copy the columnar table in path to destination, either as a csv file (if
+    destination ends in '.csv', with the column names as its header row) or
+    as another columnar table.
+
+    Preconditions:
+        - is_columnar(path)
+    """
+    if not destination.endswith('.csv'):
+        shutil.rmtree(destination, ignore_errors=True)
+        shutil.copytree(path, destination)
+        return
+
+    with open(destination, mode='w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(read_schema(path)['columns'])
+        for part in read_columnar(path):
+            writer.writerows(zip(*(column.tolist() for column in part.values())))
+
+
+if __name__ == '__main__':
+    # Check all doctests.
+    import doctest
+    doctest.testmod()
+
+    import python_ta
+    python_ta.check_all(config={
+        'max-line-length': 100,
+        'disable': ['E1136'],
+        'allowed-io': ['ColumnarWriter.close', 'read_schema', 'export_table'],
+        'extra-imports': ['csv', 'json', 'os', 'shutil', 'typing', 'numpy', 'tempfile']
+    })
+
+    import python_ta.contracts
+    python_ta.contracts.check_all_contracts()
@@ -0,0 +1,674 @@
+"""
+CSC111 Final Project: Reconstructing the Ethereum Network Using
+Graph Data Structures in Python
+
+General Information
+------------------------------------------------------------------------------
+This file was created for the purpose of applying concepts in learned in
+CSC111 to the real world problem domain of cryptocurrency transactions.
+
+Module Info: compact_graph.py
+
+This file contains a compact, array-based representation of the transaction
+graph, which can be used by the analysis modules in place of a networkx
+MultiDiGraph. Accounts are interned to integer ids and transactions are
+stored in forward and reverse CSR (compressed sparse row) adjacency arrays.
+
+Copyright Information
+------------------------------------------------------------------------------
+This file is Copyright of Tobey Brizuela, Daniel Lazaro, Matthew Parvaneh, and
+Michael Umeh.
+"""
+from typing import Any, Iterator, Optional, Union
+
+import networkx as nx
+import numpy as np
+
+
+class CompactGraph:
+    """
+    A directed multigraph of Ethereum accounts and the transactions between
+    them, stored as flat numpy arrays.
+
+    Node i is the account addresses[i]. The transactions sent by node i are the
+    edges indptr[i]:indptr[i + 1] of targets and weights, and the transactions
+    received by node i are the edges rev_edges[rev_indptr[i]:rev_indptr[i + 1]].
+    Every edge also has the time of its transaction (in seconds since the epoch),
+    which is nan for transactions whose time isn't known.
+
+    New transactions and balances can be merged into the graph with
+    add_transactions and set_accounts. New edges are appended to the edge
+    arrays, and are indexed by a small overlay until there are enough of them
+    to be worth merging into the CSR arrays (see compact), so an update costs
+    time proportional to its size rather than to the size of the graph.
+
+    Only the part of the networkx API used by the analysis modules is provided:
+    nodes, successors, predecessors, degree, get_edge_data and edges.
+
+    Instance Attributes:
+        - addresses: the address of every node, indexed by node id
+        - index: maps every address to its node id
+        - indptr: CSR offsets of the outgoing edges of every indexed node
+        - rev_indptr: CSR offsets of the incoming edges of every indexed node
+        - rev_edges: the ids of the indexed edges entering every node, grouped by target
+        - graph: a dictionary of graph-wide attributes (like networkx's graph.graph)
+
+    Representation Invariants:
+        - len(self.addresses) == len(self.index)
+        - len(self.indptr) == len(self.rev_indptr) <= len(self.addresses) + 1
+        - self.indptr[-1] == len(self.rev_edges) <= self.number_of_edges()
+    """
+    addresses: list[str]
+    index: dict[str, int]
+    indptr: np.ndarray
+    rev_indptr: np.ndarray
+    rev_edges: np.ndarray
+    graph: dict[str, Any]
+
+    # Private Instance Attributes:
+    #   - _balances, _has_balance, _sizes, _out_degrees, _in_degrees: the node
+    #     arrays; only their first len(self.addresses) entries are used, the
+    #     rest is spare capacity for new nodes.
+    #   - _sources, _targets, _weights, _timestamps: the edge arrays; only their first
+    #     _num_edges entries are used. The first _num_indexed edges are sorted
+    #     by source and covered by the CSR arrays; the rest were appended later.
+    #   - _extra_out, _extra_in: map node ids to the ids of the appended edges
+    #     leaving / entering them.
+    _balances: np.ndarray
+    _has_balance: np.ndarray
+    _sizes: np.ndarray
+    _out_degrees: np.ndarray
+    _in_degrees: np.ndarray
+    _sources: np.ndarray
+    _targets: np.ndarray
+    _weights: np.ndarray
+    _timestamps: np.ndarray
+    _num_edges: int
+    _num_indexed: int
+    _extra_out: dict[int, list[int]]
+    _extra_in: dict[int, list[int]]
+
+    def __init__(self, addresses: list[str], balances: np.ndarray, has_balance: np.ndarray,
+                 sizes: np.ndarray, sources: np.ndarray, targets: np.ndarray,
+                 weights: np.ndarray, timestamps: Optional[np.ndarray] = None,
+                 indptr: Optional[np.ndarray] = None,
+                 rev_indptr: Optional[np.ndarray] = None,
+                 rev_edges: Optional[np.ndarray] = None) -> None:
+        """
+        Initialize a compact graph from its node arrays and its edge list.
+        If timestamps isn't given, the times of the transactions are unknown.
+
+        If indptr is given, the edges must already be sorted by source node
+        (as they are in a snapshot), and indptr must be their CSR offsets.
+        Otherwise, the edges are sorted here; parallel edges keep their order.
+        The reverse adjacency is likewise computed unless it is given.
+        """
+        self.addresses = list(addresses)
+        self.index = {address: i for i, address in enumerate(self.addresses)}
+        self._balances = balances
+        self._has_balance = has_balance
+        self._sizes = sizes
+        self.graph = {}
+
+        num_nodes = len(self.addresses)
+        id_type = _id_dtype(num_nodes)
+        if timestamps is None:
+            timestamps = np.full(len(targets), np.nan)
+
+        # The position of every (sorted) edge in the original edge list.
+        order = np.arange(len(targets))
+        if indptr is None:
+            order = np.argsort(sources, kind='stable')
+            sources, targets = sources[order], targets[order]
+            weights, timestamps = weights[order], timestamps[order]
+            indptr = _offsets(sources, num_nodes)
+
+        self.indptr = indptr
+        self._sources = np.asarray(sources, dtype=id_type)
+        self._targets = np.asarray(targets, dtype=id_type)
+        self._weights = np.asarray(weights, dtype=np.float64)
+        self._timestamps = np.asarray(timestamps, dtype=np.float64)
+        self._num_edges = self._num_indexed = len(self._targets)
+        self._extra_out = {}
+        self._extra_in = {}
+
+        # The reverse adjacency stores edge ids rather than source nodes, so that
+        # the weights of incoming edges can be looked up as well. Incoming edges
+        # keep their original order, so predecessors are listed like in networkx.
+        if rev_indptr is None or rev_edges is None:
+            rev_edges = np.lexsort((order, self._targets)).astype(np.int64)
+            rev_indptr = _offsets(self._targets, num_nodes)
+
+        self.rev_edges = rev_edges
+        self.rev_indptr = rev_indptr
+
+        self._out_degrees = np.diff(self.indptr)
+        self._in_degrees = np.diff(self.rev_indptr)
+
+    @classmethod
+    def from_networkx(cls, graph: nx.MultiDiGraph) -> 'CompactGraph':
+        """
+        Return the compact representation of a graph returned by build_graph.
+        """
+        addresses = list(graph.nodes)
+        index = {address: i for i, address in enumerate(addresses)}
+
+        attrs = [graph.nodes[node] for node in addresses]
+        has_balance = np.array([attr != {} for attr in attrs], dtype=bool)
+        balances = np.array([attr.get('balance', 0.0) for attr in attrs], dtype=np.float64)
+        sizes = np.array([attr.get('size', 10) for attr in attrs], dtype=np.float64)
+
+        edges = list(graph.edges(data=True))
+        sources = np.array([index[u] for u, _, _ in edges], dtype=np.int64)
+        targets = np.array([index[v] for _, v, _ in edges], dtype=np.int64)
+        weights = np.array([attr.get('weight', np.nan) for _, _, attr in edges],
+                           dtype=np.float64)
+        timestamps = np.array([attr.get('timestamp', np.nan) for _, _, attr in edges],
+                              dtype=np.float64)
+
+        return cls(addresses, balances, has_balance, sizes, sources, targets, weights,
+                   timestamps)
+
+    @classmethod
+    def from_snapshot(cls, snapshot: Any) -> 'CompactGraph':
+        """
+        Return the compact graph stored in a GraphSnapshot (see build_graph.load_snapshot).
+
+        The snapshot's arrays are used as they are, so they stay memory-mapped
+        (until they are modified by an update).
+        """
+        addresses = [address.decode() for address in snapshot.addresses.tolist()]
+        return cls(addresses, snapshot.balances, snapshot.has_balance, snapshot.sizes,
+                   snapshot.sources, snapshot.targets, snapshot.weights,
+                   snapshot.timestamps, indptr=snapshot.indptr, rev_indptr=snapshot.rev_indptr,
+                   rev_edges=snapshot.rev_edges)
+
+    def to_networkx(self) -> nx.MultiDiGraph:
+        """
+        Return this graph as a networkx MultiDiGraph, with the same node and edge
+        attributes that build_graph gives them.
+        """
+        graph = nx.MultiDiGraph()
+        graph.add_nodes_from((address, self._node_attributes(i))
+                             for i, address in enumerate(self.addresses))
+        graph.add_edges_from(
+            (self.addresses[u], self.addresses[v], edge_attributes(w, t))
+            for u, v, w, t in zip(self.sources.tolist(), self.targets.tolist(),
+                                  self.weights.tolist(), self.timestamps.tolist()))
+        return graph
+
+    @property
+    def balances(self) -> np.ndarray:
+        """The Ether balance of every node (0.0 if it has none), indexed by node id."""
+        return self._balances[:len(self.addresses)]
+
+    @property
+    def has_balance(self) -> np.ndarray:
+        """Whether each node appeared in the accounts file, indexed by node id."""
+        return self._has_balance[:len(self.addresses)]
+
+    @property
+    def sizes(self) -> np.ndarray:
+        """The plotting size of every node, indexed by node id."""
+        return self._sizes[:len(self.addresses)]
+
+    @property
+    def sources(self) -> np.ndarray:
+        """The source node of every edge, indexed by edge id."""
+        return self._sources[:self._num_edges]
+
+    @property
+    def targets(self) -> np.ndarray:
+        """The target node of every edge, indexed by edge id."""
+        return self._targets[:self._num_edges]
+
+    @property
+    def weights(self) -> np.ndarray:
+        """The value (in Ether) of every edge, indexed by edge id."""
+        return self._weights[:self._num_edges]
+
+    @property
+    def timestamps(self) -> np.ndarray:
+        """The time of every edge (in seconds since the epoch, or nan), indexed by edge id."""
+        return self._timestamps[:self._num_edges]
+
+    @property
+    def out_degrees(self) -> np.ndarray:
+        """The number of transactions sent by every node, indexed by node id."""
+        return self._out_degrees[:len(self.addresses)]
+
+    @property
+    def in_degrees(self) -> np.ndarray:
+        """The number of transactions received by every node, indexed by node id."""
+        return self._in_degrees[:len(self.addresses)]
+
+    @property
+    def nodes(self) -> '_NodeView':
+        """
+        A view of the nodes of this graph, which can be iterated over (yielding
+        addresses) or indexed by address to get a node's attribute dictionary.
+        """
+        return _NodeView(self)
+
+    def __len__(self) -> int:
+        """Return the number of nodes in this graph."""
+        return len(self.addresses)
+
+    def __iter__(self) -> Iterator[str]:
+        """Iterate over the addresses of the nodes in this graph."""
+        return iter(self.addresses)
+
+    def __contains__(self, address: Any) -> bool:
+        """Return whether address is a node in this graph."""
+        return address in self.index
+
+    def number_of_nodes(self) -> int:
+        """Return the number of nodes in this graph."""
+        return len(self.addresses)
+
+    def number_of_edges(self) -> int:
+        """Return the number of edges (transactions) in this graph."""
+        return self._num_edges
+
+    def out_edge_ids(self, node: int) -> np.ndarray:
+        """
+        Return the ids of every edge leaving the node with id node, in the order
+        they were added.
+        """
+        edges = np.arange(0)
+        if node < len(self.indptr) - 1:
+            edges = np.arange(self.indptr[node], self.indptr[node + 1])
+        if node in self._extra_out:
+            edges = np.concatenate((edges, self._extra_out[node]))
+        return edges
+
+    def in_edge_ids(self, node: int) -> np.ndarray:
+        """
+        Return the ids of every edge entering the node with id node, in the order
+        they were added.
+        """
+        edges = np.arange(0)
+        if node < len(self.rev_indptr) - 1:
+            edges = self.rev_edges[self.rev_indptr[node]:self.rev_indptr[node + 1]]
+        if node in self._extra_in:
+            edges = np.concatenate((edges, self._extra_in[node]))
+        return edges
+
+    def successor_ids(self, node: int) -> np.ndarray:
+        """
+        Return the target ids of every edge leaving the node with id node
+        (with repeats, for parallel edges).
+        """
+        if node not in self._extra_out and node < len(self.indptr) - 1:
+            # Fast path: the edges are contiguous in the CSR arrays.
+            return self._targets[self.indptr[node]:self.indptr[node + 1]]
+        return self._targets[self.out_edge_ids(node)]
+
+    def predecessor_ids(self, node: int) -> np.ndarray:
+        """
+        Return the source ids of every edge entering the node with id node
+        (with repeats, for parallel edges).
+        """
+        return self._sources[self.in_edge_ids(node)]
+
+    def successors(self, address: str) -> Iterator[str]:
+        """
+        Iterate over the distinct accounts that address sent a transaction to,
+        in the order of their first transaction (like networkx).
+        """
+        for node in dict.fromkeys(self.successor_ids(self.index[address]).tolist()):
+            yield self.addresses[node]
+
+    def predecessors(self, address: str) -> Iterator[str]:
+        """
+        Iterate over the distinct accounts that sent a transaction to address,
+        in the order of their first transaction (like networkx).
+        """
+        for node in dict.fromkeys(self.predecessor_ids(self.index[address]).tolist()):
+            yield self.addresses[node]
+
+    def degree(self, address: Optional[str] = None) -> Union[int, Iterator[tuple[str, int]]]:
+        """
+        Return the number of transactions sent or received by address.
+
+        If no address is given, iterate over (address, degree) pairs for every
+        node instead, like networkx's graph.degree.
+        """
+        if address is None:
+            return zip(self.addresses, (self.out_degrees + self.in_degrees).tolist())
+
+        node = self.index[address]
+        return int(self._out_degrees[node] + self._in_degrees[node])
+
+    def get_edge_data(self, u: str, v: str) -> Optional[dict[int, dict[str, float]]]:
+        """
+        Return the attributes of every transaction from u to v, as a dictionary
+        mapping edge keys (0, 1, ...) to attribute dictionaries, or None if there
+        are no such transactions.
+        """
+        if u not in self.index or v not in self.index:
+            return None
+
+        edges = self.out_edge_ids(self.index[u])
+        matches = edges[self._targets[edges] == self.index[v]]
+        if len(matches) == 0:
+            return None
+
+        return {key: edge_attributes(w, t) for key, (w, t) in
+                enumerate(zip(self._weights[matches].tolist(),
+                              self._timestamps[matches].tolist()))}
+
+    def edges(self, data: Union[bool, str] = False) -> Iterator[tuple]:
+        """
+        Iterate over the edges of this graph as (u, v) pairs, or, if data is
+        'weight' (or True), as (u, v, weight) (or (u, v, attributes)) triples.
+        """
+        addresses = self.addresses
+        for u, v, w, t in zip(self.sources.tolist(), self.targets.tolist(),
+                              self.weights.tolist(), self.timestamps.tolist()):
+            if data is False:
+                yield addresses[u], addresses[v]
+            elif data is True:
+                yield addresses[u], addresses[v], edge_attributes(w, t)
+            elif data == 'weight':
+                yield addresses[u], addresses[v], w
+            else:
+                yield addresses[u], addresses[v], edge_attributes(w, t).get(data)
+
+    def set_accounts(self, addresses: list[str], balances: np.ndarray,
+                     sizes: np.ndarray) -> None:
+        """
+        Set the balance and node size of each of the given accounts, adding the
+        accounts that aren't in the graph yet. If an address is repeated, its
+        last balance is used. The statistics of the balances in
+        graph['balance_stats'] are updated, if the graph has them.
+
+        Preconditions:
+            - len(addresses) == len(balances) == len(sizes)
+        """
+        ids = self._intern(addresses)
+        keep = last_occurrences(ids)
+
+        # Keep the statistics of the balances (see balance_stats.py) up to date.
+        stats = self.graph.get('balance_stats')
+        stale = False
+        if stats is not None:
+            updated = ids[keep]
+            stale = stats.remove(self._balances[updated][self._has_balance[updated]])
+            stats.add(balances[keep])
+
+        self._balances = _writable(self._balances)
+        self._has_balance = _writable(self._has_balance)
+        self._sizes = _writable(self._sizes)
+        self._balances[ids[keep]] = balances[keep]
+        self._sizes[ids[keep]] = sizes[keep]
+        self._has_balance[ids] = True
+
+        if stale:
+            current = self.balances[self.has_balance]
+            stats.set_extremes(float(current.min()), float(current.max()))
+
+    def add_transactions(self, from_addresses: list[str], to_addresses: list[str],
+                         weights: np.ndarray, timestamps: Optional[np.ndarray] = None) -> None:
+        """
+        Add an edge for each of the given transactions, adding any accounts that
+        aren't in the graph yet. If timestamps isn't given, the times of the
+        transactions are unknown.
+
+        The degree counts are updated along with the edges. The new edges are
+        merged into the CSR arrays once they make up a large enough share of
+        the graph, which keeps the amortized cost of an update proportional to
+        the number of transactions added.
+
+        Preconditions:
+            - len(from_addresses) == len(to_addresses) == len(weights)
+        """
+        ids = self._intern([a for pair in zip(from_addresses, to_addresses) for a in pair])
+        sources, targets = ids[0::2], ids[1::2]
+
+        start, end = self._num_edges, self._num_edges + len(targets)
+        self._sources = _reserve(self._sources, end)
+        self._targets = _reserve(self._targets, end)
+        self._weights = _reserve(self._weights, end)
+        self._timestamps = _reserve(self._timestamps, end, np.nan)
+        self._sources[start:end] = sources
+        self._targets[start:end] = targets
+        self._weights[start:end] = weights
+        self._timestamps[start:end] = np.nan if timestamps is None else timestamps
+        self._num_edges = end
+
+        np.add.at(self._out_degrees, sources, 1)
+        np.add.at(self._in_degrees, targets, 1)
+
+        for edge, source, target in zip(range(start, end), sources.tolist(), targets.tolist()):
+            self._extra_out.setdefault(source, []).append(edge)
+            self._extra_in.setdefault(target, []).append(edge)
+
+        if end - self._num_indexed > max(_MIN_OVERLAY, self._num_indexed * _OVERLAY_RATIO):
+            self.compact()
+
+    def compact(self) -> None:
+        """
+        Merge the edges appended by add_transactions into the CSR arrays, so that
+        every edge is contiguous with the other edges of its source node.
+
+        This renumbers the edges; each node's incoming and outgoing edges keep
+        the order in which they were added.
+        """
+        if self._num_indexed == self._num_edges and len(self.indptr) == len(self) + 1:
+            return
+
+        num_nodes = len(self.addresses)
+        num_indexed = self._num_indexed
+
+        # Rank every edge so that, for each target, the already indexed incoming
+        # edges (in their existing order) come before the appended ones.
+        rank = np.arange(self._num_edges)
+        rank[self.rev_edges] = np.arange(num_indexed)
+
+        order = np.argsort(self.sources, kind='stable')
+        self._sources = self.sources[order]
+        self._targets = self.targets[order]
+        self._weights = self.weights[order]
+        self._timestamps = self.timestamps[order]
+        rank = rank[order]
+
+        self.indptr = _offsets(self._sources, num_nodes)
+        self.rev_edges = np.lexsort((rank, self._targets)).astype(np.int64)
+        self.rev_indptr = _offsets(self._targets, num_nodes)
+
+        self._num_indexed = self._num_edges
+        self._extra_out = {}
+        self._extra_in = {}
+
+    def _intern(self, addresses: list[str]) -> np.ndarray:
+        """
+        Return the node ids of the given addresses, adding a node (with no
+        balance) for each address that isn't in the graph yet.
+        """
+        ids = []
+        for address in addresses:
+            node = self.index.get(address)
+            if node is None:
+                node = len(self.addresses)
+                self.index[address] = node
+                self.addresses.append(address)
+            ids.append(node)
+
+        # Grow the node arrays; new nodes start out like build_graph's
+        # accounts with no balance.
+        num_nodes = len(self.addresses)
+        old = len(self._out_degrees)
+        if num_nodes > old:
+            self._balances = _reserve(self._balances, num_nodes, 0.0)
+            self._has_balance = _reserve(self._has_balance, num_nodes, False)
+            self._sizes = _reserve(self._sizes, num_nodes, 10.0)
+            self._out_degrees = _reserve(self._out_degrees, num_nodes, 0)
+            self._in_degrees = _reserve(self._in_degrees, num_nodes, 0)
+
+        return np.array(ids, dtype=np.int64)
+
+    def _node_attributes(self, node: int) -> dict[str, float]:
+        """
+        Return the attribute dictionary of the node with id node, which is empty
+        for accounts that have no balance (just like in build_graph).
+        """
+        if not self._has_balance[node]:
+            return {}
+        return {'balance': float(self._balances[node]), 'size': float(self._sizes[node])}
+
+
+class _NodeView:
+    """
+    A view of the nodes of a CompactGraph, which mimics networkx's NodeView.
+
+    Instance Attributes:
+        - _graph: the graph whose nodes are viewed
+    """
+    _graph: CompactGraph
+
+    def __init__(self, graph: CompactGraph) -> None:
+        """Initialize a view of the nodes of graph."""
+        self._graph = graph
+
+    def __call__(self) -> '_NodeView':
+        """Return this view, so that both graph.nodes and graph.nodes() work."""
+        return self
+
+    def __iter__(self) -> Iterator[str]:
+        """Iterate over the addresses of the viewed nodes."""
+        return iter(self._graph.addresses)
+
+    def __len__(self) -> int:
+        """Return the number of viewed nodes."""
+        return len(self._graph.addresses)
+
+    def __contains__(self, address: Any) -> bool:
+        """Return whether address is one of the viewed nodes."""
+        return address in self._graph.index
+
+    def __getitem__(self, address: str) -> dict[str, float]:
+        """Return the attribute dictionary of the node with the given address."""
+        return self._graph._node_attributes(self._graph.index[address])
+
+
+# Either representation of the transaction graph, accepted by the analysis modules.
+Graph = Union[nx.MultiDiGraph, CompactGraph]
+
+# Appended edges are merged into the CSR arrays once there are more than
+# _MIN_OVERLAY of them and they make up more than _OVERLAY_RATIO of the indexed edges.
+_MIN_OVERLAY = 4096
+_OVERLAY_RATIO = 0.25
+
+
+def edge_attributes(weight: float, timestamp: float) -> dict[str, float]:
+    """
+    Return the attribute dictionary of a transaction edge with the given weight
+    and timestamp; the timestamp is left out if it isn't known (nan).
+
+    >>> edge_attributes(1.5, float('nan'))
+    {'weight': 1.5}
+    >>> edge_attributes(1.5, 1618057496.0)
+    {'weight': 1.5, 'timestamp': 1618057496.0}
+    """
+    if timestamp != timestamp:  # Only nan isn't equal to itself.
+        return {'weight': weight}
+    return {'weight': weight, 'timestamp': timestamp}
+
+
+def last_occurrences(ids: np.ndarray) -> np.ndarray:
+    """
+    Return the positions in ids of the last occurrence of every distinct id.
+
+    >>> last_occurrences(np.array([3, 1, 3, 2, 1]))
+    array([4, 3, 2])
+    """
+    _, last = np.unique(ids[::-1], return_index=True)
+    return len(ids) - 1 - last
+
+
+def edge_ids(graph: Graph) -> tuple[list[str], np.ndarray, np.ndarray]:
+    """
+    Return the accounts of graph (in the order of graph.nodes), and the ids
+    (positions in that list) of the sender and the receiver of every transaction.
+
+    >>> g = nx.MultiDiGraph()
+    >>> g.add_edges_from([('a', 'b'), ('b', 'c'), ('a', 'b')])
+    [0, 0, 1]
+    >>> addresses, sources, targets = edge_ids(g)
+    >>> addresses, sources.tolist(), targets.tolist()
+    (['a', 'b', 'c'], [0, 0, 1], [1, 1, 2])
+    """
+    if isinstance(graph, CompactGraph):
+        return graph.addresses, graph.sources, graph.targets
+
+    addresses = list(graph.nodes)
+    index = {address: i for i, address in enumerate(addresses)}
+    sources = np.array([index[u] for u, _ in graph.edges()], dtype=np.int64)
+    targets = np.array([index[v] for _, v in graph.edges()], dtype=np.int64)
+    return addresses, sources, targets
+
+
+def _id_dtype(num_nodes: int) -> type:
+    """
+    Return the smallest integer type that can hold the ids of num_nodes nodes.
+    """
+    if num_nodes < 2 ** 31:
+        return np.int32
+    return np.int64
+
+
+def _reserve(array: np.ndarray, size: int, fill: Any = 0) -> np.ndarray:
+    """
+    Return array, or a copy of it with room for at least size entries if it is
+    too small. The capacity is doubled each time, so that appending is cheap.
+    Entries past the end of the original array are set to fill.
+    """
+    if len(array) >= size:
+        return array
+
+    grown = np.full(max(size, 2 * len(array)), fill, dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
+
+
+def _writable(array: np.ndarray) -> np.ndarray:
+    """
+    Return array, or a copy of it if it can't be modified (which is the case
+    for the memory-mapped arrays of a snapshot).
+    """
+    if array.flags.writeable:
+        return array
+    return np.array(array)
+
+
+def _offsets(keys: np.ndarray, num_nodes: int) -> np.ndarray:
+    """
+    Return the CSR offsets of a list of edges grouped by the node ids in keys.
+    """
+    offsets = np.zeros(num_nodes + 1, dtype=np.int64)
+    np.cumsum(np.bincount(keys, minlength=num_nodes), out=offsets[1:])
+    return offsets
+
+
+if __name__ == '__main__':
+    # Check all doctests.
+    import doctest
+    doctest.testmod()
+
+    import python_ta
+    python_ta.check_all(config={
+        'max-line-length': 100,
+        'disable': ['E1136'],
+        'allowed-io': [],
+        'extra-imports': ['networkx', 'numpy', 'typing']
+    })
+
+    import python_ta.contracts
+    python_ta.contracts.check_all_contracts()
+
+    # Uncomment if necessary, example run of function.
+    # from build_graph import build_graph
+    # g = build_graph('balances.csv', 'transactions.csv', compact=True)
+    # print(g.number_of_nodes(), g.number_of_edges())
+    # update_graph(g, 'new_transactions.csv', 'new_balances.csv')
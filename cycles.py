@@ -10,14 +10,100 @@ Copyright Information
 This file is Copyright of Tobey Brizuela, Daniel Lazaro, Matthew Parvaneh, and
 Michael Umeh.
 """
-from typing import Optional
+import math
+import os
+import tempfile
+import time
+from bisect import bisect_left
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from functools import partial
+from itertools import chain, islice
+from typing import Callable, Iterable, Iterator, Optional
 
-import networkx as nx
+import numpy as np
 
+from compact_graph import CompactGraph, Graph
 
-def transaction_cycle(graph: nx.MultiDiGraph) -> None:
+# By default, only cycles of at most this many transactions are searched for, and the
+# search stops after this many cycles. Without these bounds, the number of cycles (and
+# so the running time) can grow exponentially with the size of the graph.
+DEFAULT_MAX_LENGTH = 10
+DEFAULT_MAX_CYCLES = 1000
+
+# In parallel searches, the start accounts of every component are split between up to
+# this many tasks per worker, so that the workers stay busy until the search is done.
+TASKS_PER_WORKER = 4
+
+# The searches check whether they have run out of time once every this many accounts
+# they expand, so that reading the clock doesn't slow them down.
+_CLOCK_INTERVAL = 1024
+
+# The adjacency arrays shared by the searches run in a worker process (see _init_worker).
+_WORKER_ARRAYS = {}
+
+
+@dataclass
+class CycleRecord:
+    """
+    A cycle of transactions found by iter_cycles.
+
+    Instance Attributes:
+        - path: the accounts along the cycle, starting and ending with the same account
+        - total_value: the total value (in Ether) of the transactions along the cycle,
+          counting the largest transaction between each pair of consecutive accounts
+        - length: the number of transactions in the cycle
+
+    Representation Invariants:
+        - self.length == len(self.path) - 1
+    """
+    path: list[str]
+    total_value: float
+    length: int
+
+
+@dataclass
+class CycleSearchStats:
+    """
+    Counters of the work done by a cycle search (see iter_cycles), which are
+    updated as the search goes.
+
+    Instance Attributes:
+        - nodes_expanded: the number of times a path was extended by an account
+        - edges_scanned: the number of transactions looked at to extend paths
+        - cycles_found: the number of cycles found
+        - component_seconds: the number of accounts in every strongly connected
+          component searched so far, and the number of seconds the search took
+        - timed_out: whether the search stopped because it ran out of time
     """
-    Find a cycle from an account back to itself, to determine if
+    nodes_expanded: int = 0
+    edges_scanned: int = 0
+    cycles_found: int = 0
+    component_seconds: list[tuple[int, float]] = field(default_factory=list)
+    timed_out: bool = False
+
+    def expand(self, num_edges: int, deadline: float) -> bool:
+        """
+        Record that a path was extended by an account with num_edges transactions
+        to look at, and return whether the search may go on, which it may not
+        once deadline (a time.perf_counter() value) has passed.
+        """
+        self.nodes_expanded += 1
+        self.edges_scanned += num_edges
+        if self.nodes_expanded % _CLOCK_INTERVAL == 0 and time.perf_counter() > deadline:
+            self.timed_out = True
+
+        return not self.timed_out
+
+
+def transaction_cycle(graph: Graph, min_length: int = 3,
+                      max_length: Optional[int] = DEFAULT_MAX_LENGTH,
+                      max_cycles: Optional[int] = DEFAULT_MAX_CYCLES,
+                      temporal: bool = False, workers: Optional[int] = None,
+                      time_limit: Optional[float] = None,
+                      verbose: bool = False) -> list[list[str]]:
+    """
+    Find cycles from an account back to itself, to determine if
     a series of transactions ever comes back full circle.
 
     This function tracks a series of transactions from one account to
@@ -25,67 +111,166 @@ def transaction_cycle(graph: nx.MultiDiGraph) -> None:
     may have come back to it, as a means of studying the flow of currency
     amongst accounts.
 
+    If temporal is True, only cycles whose transactions happen in order are
+    found, since those are the only ones along which the same Ether could have
+    made its way back.
+
+    If workers is more than 1, the search is split between that many processes.
+    Either way, the search stops after time_limit seconds (if time_limit isn't
+    None), keeping the cycles found so far.
+
+    Only a summary of the search is printed, unless verbose is True, in which
+    case the time taken by every component and every cycle found are printed
+    too (as the search goes, unless it is split between processes).
+
+    Return the cycles that were found (see find_cycles and find_temporal_cycles).
+
     Preconditions:
       - list(graph.nodes) != []
+      - min_length >= 1
+      - max_length is None or max_length >= min_length
+      - max_cycles is None or max_cycles >= 0
+      - workers is None or workers >= 1
+      - time_limit is None or time_limit >= 0
     """
-    # Find any relevant nodes that we can recurse on to find cycles:
-    # Criteria:
-    # - Must have at least 1 successor (outgoing transaction)
-    # - Must have at least 1 predecessor (incoming transaction)
-    accounts = []
-    for node in graph.nodes():
-        num_predecessors = len(list(graph.predecessors(node)))
-        num_successors = len(list(graph.successors(node)))
-
-        if num_successors >= 1 and num_predecessors >= 1:
-            accounts.append(node)
-
-    # Loop through all the possible candidate accounts for having a cycle.
-    cycles = []
-    for account in accounts:
-        main_acc = account
-
-        # Now, we will check every successor of this main node (to see
-        # whether or not it is involved in a cycle that ends back at
-        # this main node.)
-        print(f"Starting Account: {main_acc}")
-        print("Beginning search for cycle starting with this account...")
-
-        cycle = _check_cycle(graph, main_acc, main_acc, set(), 0)
-        if cycle is not None:
-            print(f"Cycle found for: {main_acc}")
-            cycles.append(cycle)
-        else:
-            print(f"No Cycle found for: {main_acc}")
-
-        print("---------------------------------------")
+    start = time.perf_counter()
+    stats = CycleSearchStats()
+    if workers is not None and workers > 1:
+        search = find_temporal_cycles if temporal else find_cycles
+        cycles = search(graph, min_length, max_length, max_cycles, workers, time_limit, stats)
+        if verbose:
+            for size, seconds in stats.component_seconds:
+                print(f"Searched a component of {size} accounts in {seconds:.2f}s")
+    else:
+        records = iter_cycles(graph, min_length, max_length, temporal, time_limit, stats, verbose)
+        cycles = [record.path for record in islice(records, max_cycles)]
+        records.close()  # Record the time taken by the component the search stopped in
 
     # Print a summary of what was found.
     print("###########SUMMARY############")
-    print(f"Number of cycles found: {len(cycles)}")
+    print(f"Number of cycles found: {len(cycles)} ({time.perf_counter() - start:.2f}s)")
+    print(f"Searched {len(stats.component_seconds)} components: "
+          f"{stats.nodes_expanded:,} accounts expanded, "
+          f"{stats.edges_scanned:,} transactions scanned")
+    if stats.timed_out:
+        print(f"The search ran out of time after {time_limit}s, so more cycles may exist.")
 
     if cycles == []:
         print("Unfortunately, no cycles could be found.")
-    else:
+    elif verbose:
         for i in range(0, len(cycles)):
             print(f"Cycle {i + 1}: {cycles[i]}")
 
+    return cycles
+
 
-def _check_cycle(graph: nx.MultiDiGraph, current_account: str,
-                 target_account: str, visited: set, length: int) -> Optional[list]:
+def iter_cycles(graph: Graph, min_length: int = 3,
+                max_length: Optional[int] = DEFAULT_MAX_LENGTH, temporal: bool = False,
+                time_limit: Optional[float] = None, stats: Optional[CycleSearchStats] = None,
+                verbose: bool = False) -> Iterator[CycleRecord]:
     """
-    Recursive helper function for transaction_cycle.
+    Yield a record of every cycle of graph with between min_length and
+    max_length transactions (any number if max_length is None), as soon as it
+    is found. The cycles are those of find_cycles (or, if temporal is True,
+    find_temporal_cycles), in the same order.
+
+    The search only goes on while the cycles are being consumed, so it can be
+    stopped at any point, e.g. with itertools.islice. It also stops by itself
+    once time_limit seconds have passed (if time_limit isn't None). If stats is
+    given, it is updated with the work done by the search as it goes, so it
+    also describes a search that was stopped early. If verbose is True, the time
+    taken by every strongly connected component is printed.
+
+    Preconditions:
+        - min_length >= 1
+        - max_length is None or max_length >= min_length
+        - time_limit is None or time_limit >= 0
+        - stats is None or not stats.timed_out
+
+    Sample Usage:
+    >>> import networkx as nx
+    >>> g = nx.MultiDiGraph()
+    >>> g.add_edge('1', '2', weight=1.0)
+    0
+    >>> g.add_edge('2', '3', weight=2.0)
+    0
+    >>> g.add_edge('3', '1', weight=0.5)
+    0
+    >>> stats = CycleSearchStats()
+    >>> list(iter_cycles(g, stats=stats))
+    [CycleRecord(path=['1', '2', '3', '1'], total_value=3.5, length=3)]
+    >>> stats.cycles_found
+    1
+    """
+    if stats is None:
+        stats = CycleSearchStats()
+    deadline = math.inf if time_limit is None else time.perf_counter() + time_limit
+
+    if temporal:
+        addresses, times, targets = _temporal_adjacency(graph)
+        node_cycles = _temporal_cycles(times, targets, min_length, max_length, stats, deadline,
+                                       verbose)
+    else:
+        addresses, adjacency = _adjacency(graph)
+        node_cycles = _simple_cycles(adjacency, min_length, max_length, stats, deadline,
+                                     verbose)
+
+    for cycle in node_cycles:
+        path = [addresses[node] for node in cycle] + [addresses[cycle[0]]]
+        yield CycleRecord(path, _total_value(graph, path), len(cycle))
+
+
+def _total_value(graph: Graph, path: list[str]) -> float:
+    """
+    Return the total value of the transactions along path, counting the largest
+    transaction between each pair of consecutive accounts.
+
+    Preconditions:
+        - every pair of consecutive accounts in path has a transaction between them
+    """
+    return sum(max(data.get('weight', 0.0) for data in graph.get_edge_data(u, v).values())
+               for u, v in zip(path, path[1:]))
+
+
+def find_cycles(graph: Graph, min_length: int = 3,
+                max_length: Optional[int] = DEFAULT_MAX_LENGTH,
+                max_cycles: Optional[int] = DEFAULT_MAX_CYCLES,
+                workers: Optional[int] = None, time_limit: Optional[float] = None,
+                stats: Optional[CycleSearchStats] = None) -> list[list[str]]:
+    """
+    Return the simple cycles of graph with between min_length and max_length
+    transactions (any number if max_length is None), stopping once max_cycles
+    have been found (never, if max_cycles is None).
+
+    Every cycle is returned once, as the list of accounts along it, starting and
+    ending with the account of the cycle that comes first in graph.nodes.
+    Transactions from an account to itself are ignored, and parallel
+    transactions don't make for different cycles.
 
-    Recurses on all of the successors of current_account to see if it is
-    connected back to target_account in the form of a cycle.
+    The graph is first split into strongly connected components, since a cycle
+    can't leave the component it starts in, and accounts in a component of
+    their own can't be on any cycle. Then, the cycles through each account of a
+    component are enumerated, after which the account is left out of the
+    search in the rest of the component.
 
-    Returns a list of the cycle's path if it exists, None if it doesn't.
+    If workers is more than 1, the start accounts are split between a pool of
+    workers processes instead (see _parallel_cycles), which finds the same
+    cycles, in the same order.
+
+    The search stops after time_limit seconds (if time_limit isn't None),
+    keeping the cycles found so far. If stats is given, the work done by the
+    search is recorded in it (see CycleSearchStats).
 
     Preconditions:
-        - list(graph.nodes) != []
-        - length >= 0
+        - min_length >= 1
+        - max_length is None or max_length >= min_length
+        - max_cycles is None or max_cycles >= 0
+        - workers is None or workers >= 1
+        - time_limit is None or time_limit >= 0
+        - stats is None or not stats.timed_out
 
     Sample Usage:
+    >>> import networkx as nx
     >>> g = nx.MultiDiGraph()
     >>> for n in range(1, 5):
     ...     g.add_node(str(n))
@@ -96,56 +281,691 @@ def _check_cycle(graph: nx.MultiDiGraph, current_account: str,
     0
     >>> g.add_edge("4", "1")
     0
-    >>> cycle = _check_cycle(g, "1", "1", set(), 0)
-      Successor #0: 2
-        Successor #1: 3
-          Successor #2: 4
-            Successor #3: 1
-    >>> cycle == ["1", "2", "3", "4", "1"]
-    True
-    """
-    # If the current account is equal to the address of the original node,
-    # we know that we've found a cycle! Only as long as the length isn't 0,
-    # however, since at the very first call, the two must be equal.
-    if current_account == target_account and length != 0:
-        # A cycle is only defined for length 3, but there are some
-        # transactions
-        if length >= 3:
-            return [current_account]
+    >>> find_cycles(g)
+    [['1', '2', '3', '4', '1']]
+    >>> g.add_edge("3", "1")
+    0
+    >>> find_cycles(g)
+    [['1', '2', '3', '1'], ['1', '2', '3', '4', '1']]
+    >>> find_cycles(g, max_length=3)
+    [['1', '2', '3', '1']]
+    """
+    stats = CycleSearchStats() if stats is None else stats
+    deadline = math.inf if time_limit is None else time.perf_counter() + time_limit
+    addresses, adjacency = _adjacency(graph)
+
+    if workers is not None and workers > 1:
+        indptr, targets = _flatten(adjacency, np.int64)
+        components = _strongly_connected_components(adjacency, range(len(adjacency)))
+        node_cycles = _parallel_cycles({'indptr': indptr, 'targets': targets}, components,
+                                       min_length, max_length, max_cycles, workers, stats,
+                                       deadline)
+    else:
+        node_cycles = _simple_cycles(adjacency, min_length, max_length, stats, deadline)
+
+    return [[addresses[node] for node in cycle] + [addresses[cycle[0]]]
+            for cycle in islice(node_cycles, max_cycles)]
+
+
+def find_temporal_cycles(graph: Graph, min_length: int = 3,
+                         max_length: Optional[int] = DEFAULT_MAX_LENGTH,
+                         max_cycles: Optional[int] = DEFAULT_MAX_CYCLES,
+                         workers: Optional[int] = None, time_limit: Optional[float] = None,
+                         stats: Optional[CycleSearchStats] = None) -> list[list[str]]:
+    """
+    Return the time-respecting cycles of graph with between min_length and
+    max_length transactions (any number if max_length is None), stopping once
+    max_cycles have been found (never, if max_cycles is None).
+
+    A cycle is time-respecting if each of its transactions happened no earlier
+    than the one before it, starting from the account that sent the first one,
+    so it traces a possible round trip of funds. Every such cycle is returned
+    once for each account it can start from, as the list of accounts along it
+    (starting and ending with that account). Transactions whose time isn't
+    known are ignored.
+
+    Each account only has to look at the transactions it sent after the
+    transaction that reached it, which are found by binary search in its
+    transactions sorted by time. Of the transactions to the same account, only
+    the earliest is followed, since arriving earlier never rules out a cycle.
+
+    As in find_cycles, the search is split between a pool of workers processes
+    if workers is more than 1, it stops after time_limit seconds (if time_limit
+    isn't None), and its work is recorded in stats (if it is given).
+
+    Preconditions:
+        - min_length >= 1
+        - max_length is None or max_length >= min_length
+        - max_cycles is None or max_cycles >= 0
+        - workers is None or workers >= 1
+        - time_limit is None or time_limit >= 0
+        - stats is None or not stats.timed_out
+
+    Sample Usage:
+    >>> import networkx as nx
+    >>> g = nx.MultiDiGraph()
+    >>> g.add_edge('1', '2', weight=1.0, timestamp=10.0)
+    0
+    >>> g.add_edge('2', '3', weight=1.0, timestamp=20.0)
+    0
+    >>> g.add_edge('3', '1', weight=1.0, timestamp=5.0)
+    0
+    >>> find_cycles(g)
+    [['1', '2', '3', '1']]
+    >>> find_temporal_cycles(g)
+    [['3', '1', '2', '3']]
+    """
+    stats = CycleSearchStats() if stats is None else stats
+    deadline = math.inf if time_limit is None else time.perf_counter() + time_limit
+    addresses, times, targets = _temporal_adjacency(graph)
+
+    if workers is not None and workers > 1:
+        adjacency = [sorted(set(nodes)) for nodes in targets]
+        indptr, flat_targets = _flatten(targets, np.int64)
+        _, flat_times = _flatten(times, np.float64)
+        components = _strongly_connected_components(adjacency, range(len(adjacency)))
+        node_cycles = _parallel_cycles(
+            {'indptr': indptr, 'targets': flat_targets, 'times': flat_times}, components,
+            min_length, max_length, max_cycles, workers, stats, deadline)
+    else:
+        node_cycles = _temporal_cycles(times, targets, min_length, max_length, stats, deadline)
+
+    return [[addresses[node] for node in cycle] + [addresses[cycle[0]]]
+            for cycle in islice(node_cycles, max_cycles)]
+
+
+def _parallel_cycles(arrays: dict[str, np.ndarray], components: list[list[int]],
+                     min_length: int, max_length: Optional[int], max_cycles: Optional[int],
+                     workers: int, stats: CycleSearchStats,
+                     deadline: float = math.inf) -> list[list[int]]:
+    """
+    Return the cycles (as lists of nodes) of the graph stored in arrays, found
+    by a pool of workers processes, in the same order as the serial search.
+    The work done by every task is added to stats, and the tasks stop once
+    deadline (a time.perf_counter() value) has passed.
+    components are the strongly connected components of the graph, in the order
+    returned by _strongly_connected_components.
+
+    arrays holds the out edges of every node i at the positions
+    arrays['indptr'][i] to arrays['indptr'][i + 1] of arrays['targets'] (and, for
+    a temporal search, arrays['times']); see _task_cycles.
+
+    Rather than pickling the graph for every worker, the arrays (and the sorted
+    nodes of every component with more than one node, with their offsets) are
+    saved to a temporary directory, which every worker memory-maps (read only)
+    once. The components are then dealt out between about TASKS_PER_WORKER
+    tasks per worker of roughly the same number of start accounts: small
+    components are packed together into a task, and the starts of a component
+    bigger than that are split between several tasks. Every cycle is found from
+    exactly one start (the first of its accounts in the serial order, or, for a
+    temporal cycle, the account it starts from), so no cycle is found by more
+    than one task, and merging the results of the tasks in the serial order of
+    their starts gives exactly the cycles of the serial search.
+
+    Preconditions:
+        - workers > 1
+    """
+    searched = [sorted(component) for component in components if len(component) > 1]
+    member_offsets, members = _flatten(searched, np.int64)
+
+    num_tasks = TASKS_PER_WORKER * workers
+    budget = max(1, math.ceil(len(members) / num_tasks))
+    tasks = []
+    task, task_size = [], 0
+    for i, starts in enumerate(searched):
+        pieces = min(math.ceil(len(starts) / budget), num_tasks, len(starts))
+        if pieces > 1:
+            tasks.extend([(i, starts[k::pieces])] for k in range(pieces))
+            continue
+
+        task.append((i, starts))
+        task_size += len(starts)
+        if task_size >= budget:
+            tasks.append(task)
+            task, task_size = [], 0
+    if task != []:
+        tasks.append(task)
+
+    # time.perf_counter() values can't be compared between processes, so the
+    # workers are given the deadline as a time.time() value instead.
+    wall_deadline = time.time() + (deadline - time.perf_counter())
+
+    found = {}
+    seconds = [0.0] * len(searched)
+    with tempfile.TemporaryDirectory(prefix='.cycles-') as directory:
+        for name, array in {**arrays, 'members': members,
+                            'member_offsets': member_offsets}.items():
+            np.save(os.path.join(directory, name + '.npy'), array)
+
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(directory,)) as pool:
+            futures = [pool.submit(_task_cycles, parts, min_length, max_length, max_cycles,
+                                   wall_deadline)
+                       for parts in tasks]
+            for future in futures:
+                task_found, task_stats, task_seconds = future.result()
+                found.update(task_found)
+                stats.nodes_expanded += task_stats.nodes_expanded
+                stats.edges_scanned += task_stats.edges_scanned
+                stats.timed_out = stats.timed_out or task_stats.timed_out
+                # The tasks a component was split between run side by side.
+                for component_id, component_seconds in task_seconds.items():
+                    seconds[component_id] = max(seconds[component_id], component_seconds)
+
+    stats.component_seconds.extend((len(starts), seconds[i]) for i, starts in enumerate(searched)
+                                   if any(start in found for start in starts))
+    cycles = [cycle for starts in searched for start in starts
+              for cycle in found.get(start, [])]
+    cycles = cycles if max_cycles is None else cycles[:max_cycles]
+    stats.cycles_found += len(cycles)
+    return cycles
+
+
+def _init_worker(directory: str) -> None:
+    """Memory-map the adjacency arrays saved in directory by _parallel_cycles."""
+    for file in os.listdir(directory):
+        _WORKER_ARRAYS[file[:-len('.npy')]] = np.load(os.path.join(directory, file),
+                                                      mmap_mode='r')
+
+
+def _task_cycles(parts: list[tuple[int, list[int]]], min_length: int,
+                 max_length: Optional[int], max_cycles: Optional[int], wall_deadline: float) \
+        -> tuple[dict[int, list[list[int]]], CycleSearchStats, dict[int, float]]:
+    """
+    Return the cycles through the start nodes of every (component id, starts)
+    pair in parts, in the graph shared with this worker process, mapped to their
+    start node, along with the work done by the search, and the number of
+    seconds it spent in every component. The component ids are positions in
+    the component offsets shared with the worker (see _parallel_cycles), and
+    parts are in the serial order. The search stops once wall_deadline (a
+    time.time() value) has passed.
+
+    As in the serial search, the cycles through each start only visit the nodes
+    of the component that come after it (any node of the component, in a
+    temporal search), and only those with at least min_length and at most
+    max_length edges are kept. Since the tasks' results are merged in the order
+    of the serial search, no more than the first max_cycles cycles of any task
+    can end up in its results, so the search stops after those.
+
+    Preconditions:
+        - all(starts == sorted(starts) for _, starts in parts)
+    """
+    deadline = time.perf_counter() + (wall_deadline - time.time())
+    offsets = _WORKER_ARRAYS['member_offsets']
+    stats = CycleSearchStats()
+    found = {}
+    seconds = {}
+    for component_id, starts in parts:
+        start_time = time.perf_counter()
+        nodes = _WORKER_ARRAYS['members'][offsets[component_id]:
+                                          offsets[component_id + 1]].tolist()
+        max_left = None if max_cycles is None else max_cycles - stats.cycles_found
+        found.update(_component_cycles(nodes, starts, min_length, max_length, max_left,
+                                       stats, deadline))
+        seconds[component_id] = time.perf_counter() - start_time
+        if stats.timed_out or (max_cycles is not None and stats.cycles_found >= max_cycles):
+            break
+
+    return found, stats, seconds
+
+
+def _component_cycles(nodes: list[int], starts: list[int], min_length: int,
+                      max_length: Optional[int], max_cycles: Optional[int],
+                      stats: CycleSearchStats, deadline: float) -> dict[int, list[list[int]]]:
+    """
+    Return the first max_cycles (all, if max_cycles is None) cycles with between
+    min_length and max_length edges through each of the given start nodes of
+    the component with the given (sorted) nodes, of the graph shared with this
+    worker process, mapped to their start node. The search is recorded in stats,
+    and stops once deadline has passed (which is checked after every start, as
+    in _search_components, and while searching from it).
+
+    Preconditions:
+        - starts == sorted(starts)
+        - all(start in nodes for start in starts)
+    """
+    indptr = _WORKER_ARRAYS['indptr']
+    temporal = 'times' in _WORKER_ARRAYS
+
+    # Read the adjacency lists of the component from the shared arrays.
+    targets = {node: _WORKER_ARRAYS['targets'][indptr[node]:indptr[node + 1]].tolist()
+               for node in nodes}
+    if temporal:
+        times = {node: _WORKER_ARRAYS['times'][indptr[node]:indptr[node + 1]].tolist()
+                 for node in nodes}
+        adjacency = {node: sorted(set(targets[node])) for node in nodes}
+    else:
+        adjacency = targets
+
+    reverse = {node: [] for node in nodes}
+    for u in nodes:
+        for v in adjacency[u]:
+            if v in reverse:
+                reverse[v].append(u)
+
+    found = {}
+    num_found = 0
+    allowed = set(nodes)
+    removed = 0
+    for start in starts:
+        # Leave out the nodes whose cycles are found from earlier starts.
+        while not temporal and nodes[removed] < start:
+            allowed.remove(nodes[removed])
+            removed += 1
+
+        if temporal:
+            cycles = _temporal_cycles_from(times, targets, reverse, start, allowed, max_length,
+                                           stats, deadline)
+        elif max_length is None:
+            cycles = _cycles_through(adjacency, start, allowed, stats, deadline)
+        else:
+            cycles = _bounded_cycles_through(adjacency, reverse, start, allowed, max_length,
+                                             stats, deadline)
+
+        found[start] = []
+        for cycle in cycles:
+            if max_cycles is not None and num_found >= max_cycles:
+                return found
+            if len(cycle) >= min_length:
+                found[start].append(cycle)
+                num_found += 1
+                stats.cycles_found += 1
+
+        if stats.timed_out or time.perf_counter() > deadline:
+            stats.timed_out = True
+            return found
+
+    return found
+
+
+def _flatten(lists: list[list], dtype: type) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Return the offsets (of length len(lists) + 1) and the concatenated values of
+    lists, so that lists[i] is values[offsets[i]:offsets[i + 1]].
+    """
+    offsets = np.zeros(len(lists) + 1, dtype=np.int64)
+    np.cumsum([len(values) for values in lists], out=offsets[1:])
+    return offsets, np.fromiter(chain.from_iterable(lists), dtype=dtype, count=offsets[-1])
+
+
+def _temporal_adjacency(graph: Graph) -> tuple[list[str], list[list[float]], list[list[int]]]:
+    """
+    Return the accounts of graph (in the order of graph.nodes) and, for every
+    account, the times and the target ids of the transactions it sent to other
+    accounts, sorted by time. Transactions whose time isn't known are left out.
+    """
+    if isinstance(graph, CompactGraph):
+        addresses = graph.addresses
+        sources, targets, timestamps = graph.sources, graph.targets, graph.timestamps
+    else:
+        addresses = list(graph.nodes)
+        index = {address: i for i, address in enumerate(addresses)}
+        edges = list(graph.edges(data='timestamp', default=np.nan))
+        sources = np.array([index[u] for u, _, _ in edges], dtype=np.int64)
+        targets = np.array([index[v] for _, v, _ in edges], dtype=np.int64)
+        timestamps = np.array([t for _, _, t in edges], dtype=np.float64)
+
+    keep = ~np.isnan(timestamps) & (sources != targets)
+    sources, targets, timestamps = sources[keep], targets[keep], timestamps[keep]
+
+    # Sort the transactions by sender, and then by time.
+    order = np.lexsort((timestamps, sources))
+    bounds = np.searchsorted(sources[order], np.arange(len(addresses) + 1))
+    sorted_times = timestamps[order].tolist()
+    sorted_targets = targets[order].tolist()
+
+    return (addresses,
+            [sorted_times[bounds[i]:bounds[i + 1]] for i in range(len(addresses))],
+            [sorted_targets[bounds[i]:bounds[i + 1]] for i in range(len(addresses))])
+
+
+def _temporal_cycles(times: list[list[float]], targets: list[list[int]], min_length: int,
+                     max_length: Optional[int], stats: CycleSearchStats,
+                     deadline: float = math.inf, verbose: bool = False) -> Iterator[list[int]]:
+    """
+    Yield every time-respecting simple cycle of the graph with the given
+    transaction times and targets (as returned by _temporal_adjacency), with
+    between min_length and max_length edges (any number if max_length is None),
+    as the list of its nodes from the one it starts at, updating stats as the
+    search goes. The search stops once deadline (a time.perf_counter() value)
+    has passed.
+    """
+    adjacency = [sorted(set(nodes)) for nodes in targets]
+
+    reverse = [[] for _ in adjacency]
+    for u, nodes in enumerate(adjacency):
+        for v in nodes:
+            reverse[v].append(u)
+
+    components = _strongly_connected_components(adjacency, range(len(adjacency)))
+    cycles_from = partial(_temporal_cycles_from, times, targets, reverse,
+                          max_length=max_length, stats=stats, deadline=deadline)
+    yield from _search_components(components, cycles_from, min_length, False, stats,
+                                  deadline, verbose)
+
+
+def _temporal_cycles_from(times: list[list[float]], targets: list[list[int]],
+                          reverse: list[list[int]], start: int, allowed: set[int],
+                          max_length: Optional[int], stats: CycleSearchStats,
+                          deadline: float) -> Iterator[list[int]]:
+    """
+    Yield every time-respecting simple cycle starting at start (as the list of
+    its nodes) that only visits the nodes in allowed and has at most max_length
+    edges (if max_length isn't None). times, targets and reverse are as
+    returned by _temporal_adjacency, and the adjacency lists of the reversed graph.
+
+    The accounts expanded are recorded in stats, and the search stops once
+    deadline has passed.
+
+    Preconditions:
+        - start in allowed
+    """
+    distances = _distances_to(reverse, start, allowed, max_length)
+
+    path = [start]
+    on_path = {start}
+    stack = [_next_hops(times, targets, start, 0)]
+    if not stats.expand(len(times[start]), deadline):
+        return
+
+    while stack != []:
+        for successor, timestamp in stack[-1]:
+            if successor == start:
+                yield list(path)
+            elif successor in distances and successor not in on_path \
+                    and (max_length is None or len(path) + distances[successor] <= max_length):
+                first = bisect_left(times[successor], timestamp)
+                if not stats.expand(len(times[successor]) - first, deadline):
+                    return
+                path.append(successor)
+                on_path.add(successor)
+                stack.append(_next_hops(times, targets, successor, first))
+                break
         else:
-            return None
+            stack.pop()
+            on_path.remove(path.pop())
+
+
+def _next_hops(times: list[list[float]], targets: list[list[int]], node: int,
+               first: int) -> Iterator[tuple[int, float]]:
+    """
+    Yield the distinct targets of the transactions node sent, from its
+    transaction first on (in order of time), each with the time of the earliest
+    such transaction to it.
+    """
+    seen = set()
+    node_targets = targets[node]
+    for i in range(first, len(node_targets)):
+        if node_targets[i] not in seen:
+            seen.add(node_targets[i])
+            yield node_targets[i], times[node][i]
+
+
+def _distances_to(reverse: list[list[int]], start: int, allowed: set[int],
+                  max_length: Optional[int]) -> dict[int, int]:
+    """
+    Return the number of edges on the shortest path from every node in allowed
+    back to start (for the nodes where it is at most max_length, if max_length
+    isn't None). reverse holds the adjacency lists of the reversed graph.
+    """
+    distances = {start: 0}
+    queue = [start]
+    for node in queue:
+        if max_length is None or distances[node] < max_length:
+            for predecessor in reverse[node]:
+                if predecessor in allowed and predecessor not in distances:
+                    distances[predecessor] = distances[node] + 1
+                    queue.append(predecessor)
+
+    return distances
+
+
+def _adjacency(graph: Graph) -> tuple[list[str], list[list[int]]]:
+    """
+    Return the accounts of graph (in the order of graph.nodes) and, for every
+    account, the sorted ids (indices in that list) of the distinct accounts it
+    sent a transaction to, other than itself.
+    """
+    if isinstance(graph, CompactGraph):
+        addresses = graph.addresses
+        sources, targets = graph.sources, graph.targets
     else:
-        # Add the current account node to the visited set if it's not
-        # equal to the target account (which is the case on the first
-        # call - when length is still 0)
-        new_visited = visited
-        if current_account != target_account:
-            # Using union to avoid mutation!
-            new_visited = visited.union(current_account)
-
-        # Check every successor of the current account, to see if it
-        # tracks back to the original target account.
-        cycle_path = [current_account]
-        for successor in graph.successors(current_account):
-            # Print the current successor being checked and its length (to
-            # keep track of where we are).
-            print('  ' * (length + 1) + f"Successor #{length}: {successor}")
-
-            # If the successor hasn't already been visited, we know we can check it
-            # since it might lead us back to the original account.
-            if successor not in new_visited and not (successor == target_account and length == 0):
-                # Apparently, an account can send transactions to itself on the
-                # Ethereum network. The additional check above will account for this possibility
-                # skipping it since this is not valid.
-                new_path = _check_cycle(graph, successor, target_account, new_visited, length + 1)
-
-                if new_path is not None:
-                    cycle_path += new_path
-                    return cycle_path
-
-        # If we reach this, the current successor had no path that led back to the
-        # target account, so it can't be part of a cycle.
-        return None
+        addresses = list(graph.nodes)
+        index = {address: i for i, address in enumerate(addresses)}
+        sources = [index[u] for u, _ in graph.edges()]
+        targets = [index[v] for _, v in graph.edges()]
+
+    successors = [set() for _ in addresses]
+    for u, v in zip(sources, targets):
+        if u != v:
+            successors[u].add(v)
+
+    return addresses, [sorted(nodes) for nodes in successors]
+
+
+def _simple_cycles(adjacency: list[list[int]], min_length: int, max_length: Optional[int],
+                   stats: CycleSearchStats, deadline: float = math.inf,
+                   verbose: bool = False) -> Iterator[list[int]]:
+    """
+    Yield every simple cycle of the graph with the given adjacency lists, with
+    between min_length and max_length edges (any number if max_length is None),
+    as the list of its nodes starting from its smallest, updating stats as the
+    search goes. The search stops once deadline (a time.perf_counter() value)
+    has passed.
+    """
+    reverse = [[] for _ in adjacency]
+    for u, nodes in enumerate(adjacency):
+        for v in nodes:
+            reverse[v].append(u)
+
+    components = _strongly_connected_components(adjacency, range(len(adjacency)))
+    if max_length is None:
+        cycles_from = partial(_cycles_through, adjacency, stats=stats, deadline=deadline)
+    else:
+        cycles_from = partial(_bounded_cycles_through, adjacency, reverse,
+                              max_length=max_length, stats=stats, deadline=deadline)
+
+    # Every cycle through a start is found from it, so it can be left out after its turn.
+    yield from _search_components(components, cycles_from, min_length, True, stats,
+                                  deadline, verbose)
+
+
+def _search_components(components: list[list[int]],
+                       cycles_from: Callable[[int, set[int]], Iterator[list[int]]],
+                       min_length: int, leave_out_starts: bool, stats: CycleSearchStats,
+                       deadline: float, verbose: bool) -> Iterator[list[int]]:
+    """
+    Yield the cycles with at least min_length edges returned by
+    cycles_from(start, allowed) for every node start of every component with
+    more than one node, in sorted order, where allowed holds the nodes of the
+    component (other than the earlier starts, if leave_out_starts is True).
+
+    The number of cycles found and the time each component took are recorded in
+    stats (and printed, if verbose is True). The search stops once deadline has
+    passed, which is checked after every start (and by cycles_from itself, which
+    sets stats.timed_out).
+    """
+    for component in components:
+        if len(component) == 1:
+            continue
+
+        start_time = time.perf_counter()
+        found_before = stats.cycles_found
+        allowed = set(component)
+        try:
+            for start in sorted(component):
+                for cycle in cycles_from(start, allowed):
+                    if len(cycle) >= min_length:
+                        stats.cycles_found += 1
+                        yield cycle
+
+                if stats.timed_out or time.perf_counter() > deadline:
+                    stats.timed_out = True
+                    return
+                if leave_out_starts:
+                    allowed.remove(start)
+        finally:
+            # Also record the components whose search was cut short.
+            seconds = time.perf_counter() - start_time
+            stats.component_seconds.append((len(component), seconds))
+            if verbose:
+                print(f"Searched a component of {len(component)} accounts in {seconds:.2f}s "
+                      f"({stats.cycles_found - found_before} cycles found)")
+
+
+def _cycles_through(adjacency: list[list[int]], start: int, allowed: set[int],
+                    stats: CycleSearchStats, deadline: float) -> Iterator[list[int]]:
+    """
+    Yield every simple cycle through start (as the list of its nodes, starting
+    from start) that only visits the nodes in allowed, recording the nodes
+    expanded in stats, until deadline has passed.
+
+    This is Johnson's algorithm, written with an explicit stack: a node is
+    blocked once it is on the path, and only unblocked once the path through
+    it has led back to start, so no dead end is explored more than once.
+
+    Preconditions:
+        - start in allowed
+    """
+    path = [start]
+    stack = [iter(adjacency[start])]
+    blocked = {start}
+    blocked_by = {}
+    closed = set()
+    if not stats.expand(len(adjacency[start]), deadline):
+        return
+
+    while stack != []:
+        node = path[-1]
+        for successor in stack[-1]:
+            if successor not in allowed:
+                continue
+            if successor == start:
+                yield list(path)
+                closed.update(path)
+            elif successor not in blocked:
+                if not stats.expand(len(adjacency[successor]), deadline):
+                    return
+                path.append(successor)
+                stack.append(iter(adjacency[successor]))
+                blocked.add(successor)
+                closed.discard(successor)
+                break
+        else:
+            # Every successor of node has been explored.
+            stack.pop()
+            path.pop()
+            if node in closed:
+                _unblock(node, blocked, blocked_by)
+            else:
+                for successor in adjacency[node]:
+                    if successor in allowed:
+                        blocked_by.setdefault(successor, set()).add(node)
+
+
+def _unblock(node: int, blocked: set[int], blocked_by: dict[int, set[int]]) -> None:
+    """Unblock node, and every node that was blocked because of it."""
+    stack = [node]
+    while stack != []:
+        node = stack.pop()
+        if node in blocked:
+            blocked.remove(node)
+            stack.extend(blocked_by.pop(node, ()))
+
+
+def _bounded_cycles_through(adjacency: list[list[int]], reverse: list[list[int]], start: int,
+                            allowed: set[int], max_length: int, stats: CycleSearchStats,
+                            deadline: float) -> Iterator[list[int]]:
+    """
+    Yield every simple cycle through start with at most max_length edges (as
+    the list of its nodes, starting from start) that only visits the nodes in
+    allowed, recording the nodes expanded in stats, until deadline has passed.
+    reverse holds the adjacency lists of the reversed graph.
+
+    The path is only extended to a node if the shortest path from that node
+    back to start is short enough for the cycle to fit within max_length.
+
+    Preconditions:
+        - start in allowed
+    """
+    distances = _distances_to(reverse, start, allowed, max_length)
+
+    path = [start]
+    on_path = {start}
+    stack = [iter(adjacency[start])]
+    if not stats.expand(len(adjacency[start]), deadline):
+        return
+
+    while stack != []:
+        for successor in stack[-1]:
+            if successor == start:
+                yield list(path)
+            elif successor in distances and successor not in on_path \
+                    and len(path) + distances[successor] <= max_length:
+                if not stats.expand(len(adjacency[successor]), deadline):
+                    return
+                path.append(successor)
+                on_path.add(successor)
+                stack.append(iter(adjacency[successor]))
+                break
+        else:
+            stack.pop()
+            on_path.remove(path.pop())
+
+
+def _strongly_connected_components(adjacency: list[list[int]], nodes: Iterable[int]) \
+        -> list[list[int]]:
+    """
+    Return the strongly connected components of the subgraph of the graph with
+    the given adjacency lists induced by nodes.
+
+    This is Tarjan's algorithm, written with an explicit stack so that long
+    chains of transactions can't exceed the recursion limit.
+    """
+    allowed = nodes if isinstance(nodes, set) else set(nodes)
+    index = {}
+    lowlink = {}
+    component_stack = []
+    on_stack = set()
+    components = []
+
+    for root in allowed:
+        if root in index:
+            continue
+
+        index[root] = lowlink[root] = len(index)
+        component_stack.append(root)
+        on_stack.add(root)
+        stack = [(root, iter(adjacency[root]))]
+
+        while stack != []:
+            node, successors = stack[-1]
+            for successor in successors:
+                if successor not in allowed:
+                    continue
+                if successor not in index:
+                    index[successor] = lowlink[successor] = len(index)
+                    component_stack.append(successor)
+                    on_stack.add(successor)
+                    stack.append((successor, iter(adjacency[successor])))
+                    break
+                elif successor in on_stack:
+                    lowlink[node] = min(lowlink[node], index[successor])
+            else:
+                stack.pop()
+                if stack != []:
+                    parent = stack[-1][0]
+                    lowlink[parent] = min(lowlink[parent], lowlink[node])
+
+                if lowlink[node] == index[node]:
+                    # node is the root of a component: pop it off the stack.
+                    component = []
+                    while component[-1:] != [node]:
+                        component.append(component_stack.pop())
+                        on_stack.remove(component[-1])
+                    components.append(component)
+
+    return components
 
 
 if __name__ == "__main__":
@@ -157,8 +977,10 @@ if __name__ == "__main__":
     python_ta.check_all(config={
         'max-line-length': 100,
         'disable': ['E1136'],
-        'allowed-io': ['transaction_cycle', '_check_cycle'],
-        'extra-imports': ['networkx']
+        'allowed-io': ['transaction_cycle', '_search_components'],
+        'extra-imports': ['bisect', 'concurrent.futures', 'dataclasses', 'functools',
+                          'itertools', 'math', 'os', 'tempfile', 'time', 'numpy',
+                          'compact_graph']
     })
 
     import python_ta.contracts
@@ -18,30 +18,34 @@ Copyright Information
 This file is Copyright of Tobey Brizuela, Daniel Lazaro, Matthew Parvaneh, and
 Michael Umeh.
 """
-import networkx as nx
+from typing import Iterable
 
+import numpy as np
 
-def find_avg_balance(graph: nx.MultiDiGraph) -> float:
+from balance_stats import balance_stats
+from compact_graph import CompactGraph, Graph, edge_ids
+
+# The percentiles of the account balances that high_balance_curve is usually
+# evaluated at, since the average balance is skewed by a few very rich accounts.
+DEFAULT_PERCENTILES = (50, 75, 90, 95, 99, 99.9)
+
+
+def find_avg_balance(graph: Graph) -> float:
     """
     Find the average balance of Ether across all accounts
     in this subset of the entire network.
 
+    The average is looked up in the statistics of the balances that
+    build_graph keeps (see balance_stats.py), rather than recomputed from
+    every account.
+
     Preconditions:
-        - list(graph.nodes) != []
+        - any(graph.nodes[node] != {} for node in graph.nodes)
     """
-    balances = []
-    for node in graph.nodes():
-        # Recall that some accounts take part in transactions
-        # but have no balance; this check filters them out.
-        if graph.nodes[node] != {}:
-            balance = graph.nodes[node]['balance']
-            balances.append(balance)
-
-    # Calculate and return the average ether balance.
-    return sum(balances) / len(balances)
+    return balance_stats(graph).mean
 
 
-def high_balance_transactions(graph: nx.MultiDiGraph, avg_balance: float) -> float:
+def high_balance_transactions(graph: Graph, avg_balance: float) -> float:
     """
     Return the average proportion of transactions that a high
     balance account engages in with other high balance accounts, relative
@@ -51,36 +55,41 @@ def high_balance_transactions(graph: nx.MultiDiGraph, avg_balance: float) -> flo
     sent out by this account, and those that were received by this account
     (so both successor vertices and predecessor vertices are counted).
 
+    Every account's proportion is computed at once from the arrays of the
+    graph's balances and (distinct) neighbour pairs, rather than by looking
+    up the neighbours of one account at a time.
+
     Preconditions:
         - list(graph.nodes) != []
         - avg_balance >= 0
-    """
-    # First, find all high balance accounts in the overall graph.
-    all_accounts = list(graph.nodes)
-    accounts = find_high_balance_accounts(graph, all_accounts, avg_balance)
 
-    # Accumulator to hold each proportion across all high balance accounts.
-    all_props = []
-    for account in accounts:
-        # First, find ALL successors and predecessors.
-        successors = list(graph.successors(account))
-        predecessors = list(graph.predecessors(account))
-
-        # Next, find only the successors and predecessors with above
-        # avg balances.
-        high_successors = len(find_high_balance_accounts(graph, successors,
-                                                         avg_balance))
-        high_predecessors = len(find_high_balance_accounts(graph, predecessors,
-                                                           avg_balance))
-
-        # Calculate the proportion of high balance transactions for the
-        # current account (all of its high balance neighbours divided by
-        # all of its neighbours in general).
-        total_neighbours = len(successors) + len(predecessors)
-
-        if total_neighbours != 0:
-            proportion = (high_successors + high_predecessors) / total_neighbours
-            all_props.append(proportion)
+    >>> import networkx as nx
+    >>> g = nx.MultiDiGraph([('a', 'b'), ('a', 'b'), ('b', 'c'), ('c', 'a')])
+    >>> nx.set_node_attributes(g, {'a': {'balance': 5.0}, 'b': {'balance': 3.0},
+    ...                            'c': {'balance': 1.0}})
+    >>> high_balance_transactions(g, 2.0)
+    0.5
+    """
+    balances, has_balance, sources, targets = _graph_arrays(graph)
+    high = has_balance & (balances > avg_balance)
+    num_accounts = len(balances)
+
+    # A successor (or predecessor) is only counted once, however many
+    # transactions the two accounts made.
+    senders, receivers = _neighbour_pairs(sources, targets, num_accounts)
+
+    # Every pair makes the receiver a successor of the sender, and the sender
+    # a predecessor of the receiver.
+    total_neighbours = (np.bincount(senders, minlength=num_accounts)
+                        + np.bincount(receivers, minlength=num_accounts))
+    high_neighbours = (np.bincount(senders[high[receivers]], minlength=num_accounts)
+                       + np.bincount(receivers[high[senders]], minlength=num_accounts))
+
+    # Calculate the proportion of high balance transactions for every high
+    # balance account with any neighbours (all of its high balance neighbours
+    # divided by all of its neighbours in general).
+    valid = high & (total_neighbours != 0)
+    all_props = (high_neighbours[valid] / total_neighbours[valid]).tolist()
 
     if len(all_props) != 0:
         return sum(all_props) / len(all_props)
@@ -90,7 +99,98 @@ def high_balance_transactions(graph: nx.MultiDiGraph, avg_balance: float) -> flo
     return 0.0
 
 
-def find_high_balance_accounts(graph: nx.MultiDiGraph, accounts: list[str],
+def high_balance_curve(graph: Graph, thresholds: Iterable[float]) -> np.ndarray:
+    """
+    Return the result of high_balance_transactions(graph, threshold) for every
+    threshold in thresholds (up to floating point rounding), in the same order.
+
+    Rather than rerunning high_balance_transactions for every threshold, every
+    (account, neighbour) pair is ranked once by the smaller of the two balances,
+    since the neighbour only counts as a high balance neighbour of a high
+    balance account at the thresholds below both balances. The sum of every
+    account's proportion at a threshold is then a cumulative sum (of 1 / the
+    number of neighbours of the account) over the pairs ranked above it, and
+    the number of high balance accounts is a count over the sorted balances, so
+    a curve of hundreds of thresholds costs about as much as one call of
+    high_balance_transactions.
+
+    >>> import networkx as nx
+    >>> g = nx.MultiDiGraph([('a', 'b'), ('a', 'b'), ('b', 'c'), ('c', 'a')])
+    >>> nx.set_node_attributes(g, {'a': {'balance': 5.0}, 'b': {'balance': 3.0},
+    ...                            'c': {'balance': 1.0}})
+    >>> high_balance_curve(g, [0.0, 2.0, 4.0, 10.0]).tolist()
+    [1.0, 0.5, 0.0, 0.0]
+    """
+    balances, has_balance, sources, targets = _graph_arrays(graph)
+    num_accounts = len(balances)
+    senders, receivers = _neighbour_pairs(sources, targets, num_accounts)
+    total_neighbours = (np.bincount(senders, minlength=num_accounts)
+                        + np.bincount(receivers, minlength=num_accounts))
+
+    # Every pair makes each of its accounts a neighbour of the other.
+    accounts = np.concatenate([senders, receivers])
+    neighbours = np.concatenate([receivers, senders])
+    both = has_balance[accounts] & has_balance[neighbours]
+    pair_balances = np.minimum(balances[accounts[both]], balances[neighbours[both]])
+    order = np.argsort(pair_balances, kind='stable')
+    pair_balances = pair_balances[order]
+
+    # above[i] is the sum of the weights of the pairs from i on (in increasing order).
+    weights = 1.0 / total_neighbours[accounts[both]][order]
+    above = np.append(np.cumsum(weights[::-1])[::-1], 0.0)
+
+    account_balances = np.sort(balances[has_balance & (total_neighbours != 0)])
+
+    thresholds = np.asarray(list(thresholds), dtype=np.float64)
+    prop_sums = above[np.searchsorted(pair_balances, thresholds, side='right')]
+    num_props = len(account_balances) - np.searchsorted(account_balances, thresholds,
+                                                        side='right')
+    return np.divide(prop_sums, num_props, out=np.zeros(len(thresholds)),
+                     where=num_props != 0)
+
+
+def balance_percentiles(graph: Graph, percentiles: Iterable[float]) -> np.ndarray:
+    """
+    Return the given percentiles of the balances of the accounts of graph that
+    have one (e.g. to pass as the thresholds of high_balance_curve).
+
+    Preconditions:
+        - any(graph.nodes[account] != {} for account in graph.nodes)
+        - all(0 <= percentile <= 100 for percentile in percentiles)
+    """
+    balances, has_balance, _, _ = _graph_arrays(graph)
+    return np.percentile(balances[has_balance], list(percentiles))
+
+
+def _graph_arrays(graph: Graph) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Return the balance of every account of graph (0.0 for those without one),
+    whether every account has a balance, and the ids of the sender and the
+    receiver of every transaction, where the id of an account is its position
+    in graph.nodes.
+    """
+    if isinstance(graph, CompactGraph):
+        return graph.balances, graph.has_balance, graph.sources, graph.targets
+
+    _, sources, targets = edge_ids(graph)
+    attributes = [attributes for _, attributes in graph.nodes(data=True)]
+    has_balance = np.array([attr != {} for attr in attributes], dtype=bool)
+    balances = np.array([attr.get('balance', 0.0) for attr in attributes], dtype=np.float64)
+    return balances, has_balance, sources, targets
+
+
+def _neighbour_pairs(sources: np.ndarray, targets: np.ndarray,
+                     num_accounts: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Return the senders and receivers of the distinct (sender, receiver) pairs
+    among the transactions from sources to targets, between accounts with ids
+    below num_accounts.
+    """
+    pairs = np.unique(sources.astype(np.int64) * num_accounts + targets)
+    return pairs // num_accounts, pairs % num_accounts
+
+
+def find_high_balance_accounts(graph: Graph, accounts: list[str],
                                avg_balance: float) -> list[str]:
     """
     Find all the accounts with high balances (greater than the average
@@ -122,7 +222,7 @@ if __name__ == "__main__":
         'max-line-length': 100,
         'disable': ['E1136'],
         'allowed-io': [],
-        'extra-imports': ['networkx', 'build_graph']
+        'extra-imports': ['typing', 'numpy', 'balance_stats', 'compact_graph', 'build_graph']
     })
 
     import python_ta.contracts
@@ -134,3 +234,4 @@ if __name__ == "__main__":
     #
     # avg = find_avg_balance(g)
     # prop = high_balance_transactions(g, avg)
+    # curve = high_balance_curve(g, balance_percentiles(g, DEFAULT_PERCENTILES))
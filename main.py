@@ -7,57 +7,350 @@ General Information
 This file was created for the purpose of applying concepts in learned in
 CSC111 to the real world problem domain of cryptocurrency transactions.
 
+Running this file with no arguments walks through every analysis interactively.
+Passing the names of analyses runs them in batch mode instead, with no prompts:
+
+    python main.py high_balance subnetworks cycles --output-dir results
+
+The graph is built once, the analyses run concurrently (one process each), and
+their results are written as JSON files to the output directory, along with a
+summary.json file recording how long each analysis took.
+
+Each analysis module (and the libraries it depends on, like sklearn and plotly)
+is only imported once that analysis runs, so running a single analysis doesn't
+pay for loading the others. Pass --import-times to print how long each module
+took to import.
+
 Copyright Information
 ------------------------------------------------------------------------------
 This file is Copyright of Tobey Brizuela, Daniel Lazaro, Matthew Parvaneh, and
 Michael Umeh.
 """
-from bigquery import user_input_query_helper
-from build_graph import build_graph
-from cycles import transaction_cycle
-from high_balance import find_avg_balance, high_balance_transactions
-from subnetworks import biggest_subnetwork, future_partners
-from regression import balance_correlation_and_plot
-from visualize_graph import plot_graph
+import argparse
+import contextlib
+import importlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from types import ModuleType
+from typing import Any, Optional
+
+from compact_graph import Graph
+
+# The analyses that can be run in batch mode, in the order they are run interactively,
+# mapped to the module they are defined in.
+ANALYSES = {'visualize': 'visualize_graph', 'regression': 'regression',
+            'high_balance': 'high_balance', 'subnetworks': 'subnetworks', 'cycles': 'cycles'}
+
+# The modules imported through load_module so far, mapped to a tuple of the number of
+# seconds the import took and the third party packages it imported along with it.
+IMPORT_TIMES = {}
+
+# The graph shared by the analyses run in a batch worker process (see _init_worker).
+_WORKER_GRAPH = None
+
+
+def run_interactive() -> None:
+    """
+    Build the graph from the csv files, and run every analysis on it, prompting
+    the user before each of the longer ones.
+    """
+    # Prompt user for input, run a query on BigQuery, and write the results to csv files.
+    # Results are cached locally (in '.bigquery_cache'), so repeating a query with the
+    # same parameters doesn't use any quota.
+    # If the query fails due to exceeding the quota, replace
+    # 'credentials.json' with 'backup-credentials.json'
+    # load_module('bigquery').user_input_query_helper('credentials.json')
+
+    # Create a graph of the ethereum network using the csv files available.
+    ethereum_graph = load_module('build_graph').build_graph('balances.csv', 'transactions.csv')
+
+    # Visualize the graph
+    load_module('visualize_graph').plot_graph(ethereum_graph)
+
+    # Run the linear regression and output the result.
+    r2, rmse = load_module('regression').balance_correlation_and_plot(ethereum_graph)
+    print("Coefficient of determination (r^2): " + str(r2) + "\nRMSE: " + str(rmse) + "\n")
+
+    # Prompt the user if they are ready to run high_balance, run it if they are.
+    print("Enter 'y' when you wish to run the high_balance.py.")
+
+    user_input = input("Are you ready?: ")
+    if user_input.lower() == 'y':
+        high_balance = load_module('high_balance')
+        avg = high_balance.find_avg_balance(ethereum_graph)
+        prop = high_balance.high_balance_transactions(ethereum_graph, avg)
+
+        print("The proportion of transactions that a high balance account makes\n"
+              + f"with other high balance accounts in this network is: {prop}")
+
+        percentiles = high_balance.DEFAULT_PERCENTILES
+        thresholds = high_balance.balance_percentiles(ethereum_graph, percentiles)
+        curve = high_balance.high_balance_curve(ethereum_graph, thresholds)
+        print("Taking accounts above a percentile of the balances as high balance instead:")
+        for percentile, threshold, proportion in zip(percentiles, thresholds, curve):
+            print(f"  {percentile}th percentile ({threshold} Ether): {proportion}")
+
+    # Prompt the user if they are ready to run subnetworks, run it if they are.
+    print("Enter 'y' when you wish to run the subnetworks.py.")
+
+    user_input = input("Are you ready?: ")
+    if user_input.lower() == 'y':
+        subnetworks = load_module('subnetworks')
+        subnet = subnetworks.biggest_subnetwork(ethereum_graph)
+        partners = subnetworks.future_partners(ethereum_graph, subnet)
+
+        print(f"The account at center of the biggest subnetwork is: {subnet[0]}\n")
+        if partners == []:
+            print("It looks like there were no accounts that shared neighbours with "
+                  + "the main account in this subnetwork. We cannot tell who might be "
+                  + "a future transactional partner with them.")
+        else:
+            print("Below are the accounts in the subnetwork that are most likely to engage\n"
+                  + "in future transactions with the central account, ranked on how many of\n"
+                  + "the same neighbours they have.\n")
+            for i, (account, shared) in enumerate(partners[:10]):
+                print(f"#{i + 1} - Account Address: {account}")
+                print(f"Number of shared neighbours: {shared}\n")
+
+    # Prompt the user if they are ready to run cycles, run it if they are.
+    print("Enter 'y' when you wish to run the cycles.py.")
+
+    user_input = input("Are you ready?: ")
+    if user_input.lower() == 'y':
+        load_module('cycles').transaction_cycle(ethereum_graph)
+
+
+def load_module(name: str) -> ModuleType:
+    """
+    Import and return the module with the given name, recording how long the
+    import took in IMPORT_TIMES (unless the module was already imported).
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+
+    packages_before = _imported_packages()
+    start = time.perf_counter()
+    module = importlib.import_module(name)
+    seconds = time.perf_counter() - start
+
+    IMPORT_TIMES[name] = (seconds, sorted(package for package
+                                          in _imported_packages() - packages_before
+                                          if _is_third_party(package)))
+    return module
+
+
+def print_import_times(import_times: dict[str, tuple[float, list[str]]]) -> None:
+    """Print a report of the import times recorded (as in IMPORT_TIMES) in import_times."""
+    print("------Import Times------")
+    for name, (seconds, packages) in import_times.items():
+        print(f"{name:<16} {seconds:7.3f}s" + (f"  ({', '.join(packages)})" if packages else ''))
+
+
+def _imported_packages() -> set[str]:
+    """Return the names of the (top level, public) modules imported so far."""
+    return {name.split('.')[0] for name in sys.modules if not name.startswith('_')}
+
+
+def _is_third_party(package: str) -> bool:
+    """
+    Return whether the imported (top level) module package was installed separately,
+    rather than being part of the standard library or this project.
+    """
+    path = getattr(sys.modules.get(package), '__file__', None) or ''
+    return 'site-packages' in path or 'dist-packages' in path
+
+
+def run_analysis(graph: Graph, name: str, output_dir: str) -> dict[str, Any]:
+    """
+    Run the analysis with the given name on graph, and return its results as a
+    dictionary that can be written as JSON. Plots are written to output_dir as
+    html files rather than shown.
+
+    The 'r2' of the regression results is the score of the model on a held out
+    test set (see balance_correlation_and_plot), which is negative when the
+    model predicts the held out degrees worse than their mean does.
+
+    Preconditions:
+        - name in ANALYSES
+        - os.path.isdir(output_dir)
+    """
+    module = load_module(ANALYSES[name])
+
+    if name == 'visualize':
+        plot_file = os.path.join(output_dir, 'visualize.html')
+        module.plot_graph(graph, plot_file)
+        return {'plot': plot_file}
+
+    elif name == 'regression':
+        plot_file = os.path.join(output_dir, 'regression.html')
+        r2, rmse = module.balance_correlation_and_plot(graph, plot_file)
+        return {'r2': float(r2), 'rmse': float(rmse), 'plot': plot_file,
+                'resampling': module.resampled_regression(graph)}
+
+    elif name == 'high_balance':
+        avg = module.find_avg_balance(graph)
+        prop = module.high_balance_transactions(graph, avg)
+        thresholds = module.balance_percentiles(graph, module.DEFAULT_PERCENTILES)
+        curve = module.high_balance_curve(graph, thresholds)
+        return {'average_balance': float(avg), 'proportion': float(prop),
+                'curve': [{'percentile': percentile, 'threshold': float(threshold),
+                           'proportion': float(proportion)}
+                          for percentile, threshold, proportion
+                          in zip(module.DEFAULT_PERCENTILES, thresholds, curve)]}
+
+    elif name == 'subnetworks':
+        subnet = module.biggest_subnetwork(graph)
+        partners = module.future_partners(graph, subnet)
+        return {'central_account': subnet[0], 'subnetwork': subnet,
+                'future_partners': [{'account': account, 'shared_neighbours': shared}
+                                    for account, shared in partners]}
+
+    else:
+        return {'cycles': module.transaction_cycle(graph)}
+
+
+def run_batch(analyses: list[str], output_dir: str, accounts_file: str = 'balances.csv',
+              transactions_file: str = 'transactions.csv', compact: bool = False,
+              workers: Optional[int] = None) -> dict[str, Any]:
+    """
+    Build the graph once, run the given analyses on it concurrently, and write
+    the results of each to <output_dir>/<analysis>.json (and everything it
+    prints to <output_dir>/<analysis>.log). Return the summary of the batch,
+    which is also written to <output_dir>/summary.json.
+
+    An analysis that raises an error doesn't stop the others; the error is
+    recorded in the summary instead.
+
+    Preconditions:
+        - analyses != [] and all(name in ANALYSES for name in analyses)
+        - workers is None or workers >= 1
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    start = time.perf_counter()
+
+    graph = load_module('build_graph').build_graph(accounts_file, transactions_file,
+                                                   compact=compact)
+    build_seconds = time.perf_counter() - start
+
+    summary = {'accounts_file': accounts_file, 'transactions_file': transactions_file,
+               'build_seconds': build_seconds, 'analyses': {}}
+
+    # Every worker receives the graph once, when it starts, rather than once per analysis.
+    # With one worker per analysis, the batch takes as long as the slowest analysis.
+    with ProcessPoolExecutor(max_workers=workers or len(analyses), initializer=_init_worker,
+                             initargs=(graph,)) as executor:
+        futures = {name: executor.submit(_run_worker_analysis, name, output_dir)
+                   for name in analyses}
+
+        for name, future in futures.items():
+            try:
+                result = future.result()
+            except Exception as error:  # The worker itself failed, rather than the analysis.
+                result = {'error': f'{type(error).__name__}: {error}'}
+
+            summary['analyses'][name] = result
+            if 'error' in result:
+                print(f"{name}: failed ({result['error'].split(':')[0]})")
+            else:
+                print(f"{name}: finished in {result['seconds']:.2f}s")
+
+    summary['total_seconds'] = time.perf_counter() - start
+    _write_json(os.path.join(output_dir, 'summary.json'), summary)
+
+    return summary
+
+
+def _init_worker(graph: Graph) -> None:
+    """Store the graph shared by the analyses run in this worker process."""
+    global _WORKER_GRAPH
+    _WORKER_GRAPH = graph
+
+
+def _run_worker_analysis(name: str, output_dir: str) -> dict[str, Any]:
+    """
+    Run the analysis with the given name on the graph of this worker process,
+    writing its results and output to output_dir. Return a summary of the run
+    (or of the error it raised), including the modules this worker had to import
+    for it.
+    """
+    start = time.perf_counter()
+    imported_before = set(IMPORT_TIMES)
+    summary = {}
+
+    with open(os.path.join(output_dir, f'{name}.log'), 'w') as log, \
+            contextlib.redirect_stdout(log):
+        try:
+            results = run_analysis(_WORKER_GRAPH, name, output_dir)
+        except Exception as error:  # Record the failure, so the other analyses carry on.
+            summary['error'] = f'{type(error).__name__}: {error}'
+
+    if 'error' not in summary:
+        summary['results'] = os.path.join(output_dir, f'{name}.json')
+        _write_json(summary['results'], results)
 
+    summary['seconds'] = time.perf_counter() - start
+    summary['imports'] = {module: IMPORT_TIMES[module] for module in IMPORT_TIMES
+                          if module not in imported_before}
+    return summary
 
-# Prompt user for input, run a query on BigQuery, and write the results to csv files.
-# If the query fails due to exceeding the quota, replace 
-# 'credentials.json' with 'backup-credentials.json'
-# user_input_query_helper('credentials.json')
 
-# Create a graph of the ethereum network using the csv files available.
-ethereum_graph = build_graph('balances.csv', 'transactions.csv')
+def _write_json(path: str, data: Any) -> None:
+    """Write data to path as JSON."""
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=2)
 
-# Visualize the graph
-plot_graph(ethereum_graph)
 
-# Run the linear regression and output the result.
-r2, rmse = balance_correlation_and_plot(ethereum_graph)
-print("Coefficient of determination (r^2): " + str(r2) + "\nRMSE: " + str(rmse) + "\n")
+def main(argv: Optional[list[str]] = None) -> None:
+    """
+    Run the analyses named in the command line arguments in batch mode, or
+    walk through every analysis interactively if none are named.
+    """
+    parser = argparse.ArgumentParser(
+        description='Analyze the Ethereum transaction network.')
+    parser.add_argument('analyses', nargs='*', metavar='analysis',
+                        help=f"the analyses to run in batch mode ({', '.join(ANALYSES)}, "
+                             + "or all); with none, every analysis is run interactively")
+    parser.add_argument('--output-dir', default='results',
+                        help='the directory to write the results to (default: results)')
+    parser.add_argument('--accounts', default='balances.csv',
+                        help='the accounts csv file(s) (default: balances.csv)')
+    parser.add_argument('--transactions', default='transactions.csv',
+                        help='the transactions csv file(s) (default: transactions.csv)')
+    parser.add_argument('--compact', action='store_true',
+                        help='build the memory efficient compact graph')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='the number of worker processes (default: one per analysis)')
+    parser.add_argument('--import-times', action='store_true',
+                        help='print how long each module took to import')
+    args = parser.parse_args(argv)
 
-# Prompt the user if they are ready to run high_balance, run it if they are.
-print("Enter 'y' when you wish to run the high_balance.py.")
+    if args.analyses == []:
+        run_interactive()
+        if args.import_times:
+            print_import_times(IMPORT_TIMES)
+        return
 
-user_input = input("Are you ready?: ")
-if user_input.lower() == 'y':
-    avg = find_avg_balance(ethereum_graph)
-    prop = high_balance_transactions(ethereum_graph, avg)
+    analyses = list(ANALYSES) if 'all' in args.analyses else list(dict.fromkeys(args.analyses))
+    unknown = [name for name in analyses if name not in ANALYSES]
+    if unknown != []:
+        parser.error(f"unknown analysis: {', '.join(unknown)}")
 
-    print("The proportion of transactions that a high balance account makes\n"
-          + f"with other high balance accounts in this network is: {prop}")
+    summary = run_batch(analyses, args.output_dir, args.accounts, args.transactions,
+                        args.compact, args.workers)
 
-# Prompt the user if they are ready to run subnetworks, run it if they are.
-print("Enter 'y' when you wish to run the subnetworks.py.")
+    if args.import_times:
+        # The analyses are imported by the worker processes, so combine their records.
+        import_times = dict(IMPORT_TIMES)
+        for result in summary['analyses'].values():
+            import_times.update(result.get('imports', {}))
+        print_import_times(import_times)
 
-user_input = input("Are you ready?: ")
-if user_input.lower() == 'y':
-    subnet = biggest_subnetwork(ethereum_graph)
-    future_partners(ethereum_graph, subnet)
+    if any('error' in result for result in summary['analyses'].values()):
+        sys.exit(1)
 
-# Prompt the user if they are ready to run cycles, run it if they are.
-print("Enter 'y' when you wish to run the cycles.py.")
 
-user_input = input("Are you ready?: ")
-if user_input.lower() == 'y':
-    transaction_cycle(ethereum_graph)
+if __name__ == '__main__':
+    main()
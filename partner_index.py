@@ -0,0 +1,297 @@
+"""
+CSC111 Final Project: Reconstructing the Ethereum Network Using
+Graph Data Structures in Python
+
+General Information
+------------------------------------------------------------------------------
+This file was created for the purpose of applying concepts in learned in
+CSC111 to the real world problem domain of cryptocurrency transactions.
+
+Module Info: partner_index.py
+
+This file contains an approximate index of the accounts with similar
+neighbours, which can recommend future partners (see future_partners in
+subnetworks.py) for any account without comparing it to every other account.
+Every account's neighbours are summarized by a MinHash signature, and the
+signatures are split into bands (locality sensitive hashing), so that only the
+accounts sharing a band with an account are considered as its partners.
+
+Copyright Information
+------------------------------------------------------------------------------
+This file is Copyright of Tobey Brizuela, Daniel Lazaro, Matthew Parvaneh, and
+Michael Umeh.
+"""
+import time
+from typing import Optional
+
+import numpy as np
+from scipy import sparse
+
+from compact_graph import Graph
+from subnetworks import neighbour_matrix, shared_neighbours
+
+# The default number of bands, and of signature values per band. An account is only
+# considered as a partner if all the values of one of its bands match, so more bands
+# (or fewer values per band) find more partners, at the cost of slower queries. Since
+# the neighbours of accounts overlap very little (their Jaccard similarity is usually
+# below 0.1), bands of a single value are needed to find most of the exact partners
+# (bands of two values find far fewer, even with four times as many bands). The extra
+# bands make up for the partners lost to DEFAULT_MAX_BUCKET_SIZE.
+DEFAULT_NUM_BANDS = 32
+DEFAULT_ROWS_PER_BAND = 1
+
+# The default largest number of accounts with the same key in a band that are taken as
+# candidates. With a single value per band, every account that traded with a hub (an
+# account with very many neighbours) can share a key with all the others that did, so
+# without this cap a query could rank nearly every account. Those accounts usually
+# share little besides the hub, so the partners they would add are mostly weak ones.
+DEFAULT_MAX_BUCKET_SIZE = 1_000
+
+# The MinHash functions are of the form (a * x + b) % _PRIME, where x is an account id.
+# _PRIME is small enough for a * x to fit in an int64.
+_PRIME = 2 ** 31 - 1
+
+
+class PartnerIndex:
+    """
+    An approximate index of the future partners of every account of a graph:
+    the accounts that share the most neighbours with it.
+
+    Every account gets a MinHash signature of its neighbours (the accounts it
+    sent transactions to or received transactions from), where the chance that
+    two signature values match is the Jaccard similarity of their neighbours.
+    The signatures are split into num_bands bands of rows_per_band values, and
+    the accounts are sorted by the key of each band. The candidate partners of
+    an account are those with the same key in at least one band, which are found
+    by binary search, and are then ranked by their exact number of shared
+    neighbours.
+
+    Accounts whose neighbours have a Jaccard similarity of s are candidates with
+    probability 1 - (1 - s ** rows_per_band) ** num_bands, so increasing
+    num_bands (or decreasing rows_per_band) trades query time for recall. Keys
+    shared by more than max_bucket_size accounts are skipped, which bounds the
+    number of candidates of every query by num_bands * max_bucket_size.
+
+    Instance Attributes:
+        - addresses: the accounts of the graph, in the order of graph.nodes
+        - num_bands: the number of bands the signatures are split into
+        - rows_per_band: the number of signature values in each band
+        - max_bucket_size: the largest number of accounts with the same key in a
+          band that are taken as candidates (None if there is no limit)
+
+    Representation Invariants:
+        - self.num_bands >= 1 and self.rows_per_band >= 1
+        - self.max_bucket_size is None or self.max_bucket_size >= 1
+        - self._signatures.shape == (len(self.addresses), self.num_bands * self.rows_per_band)
+
+    Sample Usage:
+    >>> import networkx as nx
+    >>> g = nx.MultiDiGraph([('a', 'b'), ('a', 'c'), ('d', 'b'), ('d', 'c'), ('e', 'f')])
+    >>> index = PartnerIndex(g)
+    >>> index.query('a')
+    [('d', 2)]
+    """
+    addresses: list[str]
+    num_bands: int
+    rows_per_band: int
+    max_bucket_size: Optional[int]
+
+    # Private Instance Attributes:
+    #   - _index: maps every address to its account id (its position in addresses)
+    #   - _matrix: the neighbour matrix of the graph (see subnetworks.neighbour_matrix)
+    #   - _signatures: the MinHash signature of every account (all _PRIME for the
+    #     accounts without neighbours)
+    #   - _band_keys: the key of every band of every account, with a row per band
+    #   - _band_order: the account ids sorted by their key in every band, with a row per band
+    #   - _sorted_keys: the keys of every band, in the order of _band_order
+    _index: dict[str, int]
+    _matrix: sparse.csr_matrix
+    _signatures: np.ndarray
+    _band_keys: np.ndarray
+    _band_order: np.ndarray
+    _sorted_keys: np.ndarray
+
+    def __init__(self, graph: Graph, num_bands: int = DEFAULT_NUM_BANDS,
+                 rows_per_band: int = DEFAULT_ROWS_PER_BAND, seed: int = 0,
+                 max_bucket_size: Optional[int] = DEFAULT_MAX_BUCKET_SIZE) -> None:
+        """
+        Build the index of the accounts of graph, with signatures of
+        num_bands * rows_per_band values (whose hash functions are chosen with
+        the given random seed), whose queries skip the keys shared by more than
+        max_bucket_size accounts (unless it is None).
+
+        Preconditions:
+            - num_bands >= 1
+            - rows_per_band >= 1
+            - max_bucket_size is None or max_bucket_size >= 1
+        """
+        self.addresses, self._matrix = neighbour_matrix(graph)
+        self._index = {address: i for i, address in enumerate(self.addresses)}
+        self.num_bands = num_bands
+        self.rows_per_band = rows_per_band
+        self.max_bucket_size = max_bucket_size
+
+        rng = np.random.default_rng(seed)
+        num_hashes = num_bands * rows_per_band
+        a = rng.integers(1, _PRIME, size=num_hashes, dtype=np.int64)
+        b = rng.integers(0, _PRIME, size=num_hashes, dtype=np.int64)
+        self._signatures = _minhash_signatures(self._matrix.indptr, self._matrix.indices, a, b)
+
+        # Combine the values of every band into a single key (collisions between
+        # different bands only add candidates, which the exact ranking filters out).
+        bands = self._signatures.reshape(len(self.addresses), num_bands, rows_per_band)
+        keys = np.zeros((len(self.addresses), num_bands), dtype=np.uint64)
+        for row in range(rows_per_band):
+            keys = keys * np.uint64(1_000_003) + bands[:, :, row].astype(np.uint64)
+
+        self._band_keys = np.ascontiguousarray(keys.T)
+        self._band_order = np.argsort(self._band_keys, axis=1, kind='stable')
+        self._sorted_keys = np.take_along_axis(self._band_keys, self._band_order, axis=1)
+
+    def candidates(self, address: str) -> np.ndarray:
+        """
+        Return the ids of the candidate partners of address: the other accounts
+        that have the same key as it in at least one band (where that key is
+        shared by at most max_bucket_size accounts), in increasing order.
+
+        Preconditions:
+            - address in self.addresses
+        """
+        node = self._index[address]
+        if self._matrix.indptr[node] == self._matrix.indptr[node + 1]:
+            return np.zeros(0, dtype=np.int64)  # An account without neighbours has no partners
+
+        found = []
+        for band in range(self.num_bands):
+            key = self._band_keys[band, node]
+            low = np.searchsorted(self._sorted_keys[band], key, side='left')
+            high = np.searchsorted(self._sorted_keys[band], key, side='right')
+            if self.max_bucket_size is None or high - low <= self.max_bucket_size:
+                found.append(self._band_order[band, low:high])
+
+        nodes = np.unique(np.concatenate(found + [np.zeros(0, dtype=np.int64)]))
+        return nodes[nodes != node]
+
+    def query(self, address: str, k: int = 10) -> list[tuple[str, int]]:
+        """
+        Return (approximately) the k accounts that share the most neighbours with
+        address, with their numbers of shared neighbours, from most to least
+        (and by account id, if they are tied). Only candidates (see candidates)
+        that share at least one neighbour with address are returned.
+
+        Preconditions:
+            - address in self.addresses
+            - k >= 1
+        """
+        nodes = self.candidates(address)
+        counts = (self._matrix[nodes] @ self._matrix[self._index[address]].T).toarray().ravel()
+
+        order = np.lexsort((nodes, -counts))[:k]
+        return [(self.addresses[nodes[i]], int(counts[i])) for i in order.tolist()
+                if counts[i] > 0]
+
+
+def _minhash_signatures(indptr: np.ndarray, indices: np.ndarray, a: np.ndarray,
+                        b: np.ndarray) -> np.ndarray:
+    """
+    Return the MinHash signature of every row of the sparse matrix with the
+    given CSR indptr and indices: for every hash function (a[i] * x + b[i]) %
+    _PRIME, the smallest hash of the column indices x of the row (or _PRIME, if
+    the row is empty).
+    """
+    num_rows = len(indptr) - 1
+    signatures = np.full((num_rows, len(a)), _PRIME, dtype=np.int64)
+
+    # np.minimum.reduceat needs the start of every (nonempty) row.
+    nonempty = np.flatnonzero(np.diff(indptr) > 0)
+    if len(nonempty) == 0:
+        return signatures
+
+    starts = indptr[nonempty]
+    columns = indices.astype(np.int64)
+    for i in range(len(a)):
+        hashes = (a[i] * columns + b[i]) % _PRIME
+        signatures[nonempty, i] = np.minimum.reduceat(hashes, starts)
+
+    return signatures
+
+
+def recall_benchmark(graph: Graph, k: int = 10, num_queries: int = 200,
+                     num_bands: int = DEFAULT_NUM_BANDS,
+                     rows_per_band: int = DEFAULT_ROWS_PER_BAND, seed: int = 0,
+                     max_bucket_size: Optional[int] = DEFAULT_MAX_BUCKET_SIZE) \
+        -> dict[str, float]:
+    """
+    Compare the partners found by a PartnerIndex of graph with the exact ranking
+    (by the number of shared neighbours, as in subnetworks.future_partners) for
+    num_queries accounts with neighbours, chosen at random with the given seed.
+
+    The recall of a query is the fraction of the exact top k partners that were
+    found, where a partner counts as found if it shares at least as many
+    neighbours as the k-th exact partner does (so how ties are broken doesn't
+    matter). Return the mean recall, the mean number of candidates the index
+    ranked per query, the time it took to build the index, and the mean time
+    per query of both the index and the exact ranking (in seconds), as a
+    dictionary with the keys 'recall', 'mean_candidates', 'build_seconds',
+    'index_seconds' and 'exact_seconds'.
+
+    Preconditions:
+        - k >= 1
+        - num_queries >= 1
+        - some account of graph has a transaction with another account
+    """
+    start = time.perf_counter()
+    index = PartnerIndex(graph, num_bands, rows_per_band, seed, max_bucket_size)
+    build_seconds = time.perf_counter() - start
+
+    _, matrix = neighbour_matrix(graph)
+    has_neighbours = np.flatnonzero(np.diff(matrix.indptr) > 0)
+    rng = np.random.default_rng(seed)
+    queries = rng.choice(has_neighbours, size=min(num_queries, len(has_neighbours)),
+                         replace=False)
+
+    recalls = []
+    num_candidates = 0
+    index_seconds = exact_seconds = 0.0
+    for node in queries.tolist():
+        start = time.perf_counter()
+        counts = shared_neighbours(matrix, node)
+        counts[node] = 0
+        exact = np.sort(counts[counts > 0])[::-1][:k]
+        exact_seconds += time.perf_counter() - start
+
+        start = time.perf_counter()
+        found = index.query(index.addresses[node], k)
+        index_seconds += time.perf_counter() - start
+        num_candidates += len(index.candidates(index.addresses[node]))
+
+        if len(exact) > 0:
+            recalls.append(sum(shared >= exact[-1] for _, shared in found) / len(exact))
+
+    return {'recall': float(np.mean(recalls)) if recalls != [] else 1.0,
+            'mean_candidates': num_candidates / len(queries),
+            'build_seconds': build_seconds,
+            'index_seconds': index_seconds / len(queries),
+            'exact_seconds': exact_seconds / len(queries)}
+
+
+if __name__ == '__main__':
+    # Check all doctests.
+    import doctest
+    doctest.testmod()
+
+    import python_ta
+    python_ta.check_all(config={
+        'max-line-length': 100,
+        'disable': ['E1136'],
+        'allowed-io': [],
+        'extra-imports': ['time', 'typing', 'numpy', 'scipy', 'compact_graph', 'subnetworks']
+    })
+
+    import python_ta.contracts
+    python_ta.contracts.check_all_contracts()
+
+    # Example run of the recall benchmark.
+    # from build_graph import build_graph
+    # ethereum_graph = build_graph('balances.csv', 'transactions.csv')
+    # print(recall_benchmark(ethereum_graph))
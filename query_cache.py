@@ -0,0 +1,224 @@
+"""
+CSC111 Final Project: Reconstructing the Ethereum Network Using
+Graph Data Structures in Python
+
+General Information
+------------------------------------------------------------------------------
+This file was created for the purpose of applying concepts in learned in
+CSC111 to the real world problem domain of cryptocurrency transactions.
+
+Module Info: query_cache.py
+
+This file contains a local cache for the results of the BigQuery queries made
+in bigquery.py. Results are stored as columnar tables (see columnar.py), keyed
+by the normalized query parameters, so that repeating a query with the same
+parameters doesn't use up any of the BigQuery quota.
+
+Copyright Information
+------------------------------------------------------------------------------
+This file is Copyright of Tobey Brizuela, Daniel Lazaro, Matthew Parvaneh, and
+Michael Umeh.
+"""
+import hashlib
+import json
+import os
+import shutil
+import time
+from datetime import datetime, timezone
+from typing import Optional
+
+# The directory the cache is stored in by default (relative to the working directory).
+DEFAULT_CACHE_DIR = '.bigquery_cache'
+
+# By default, cached results expire after 12 hours, and the cache is limited to 2 GiB.
+DEFAULT_TTL = 12 * 60 * 60
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+
+# The name of the file holding the metadata of a cache entry, inside its directory.
+ENTRY_FILE = 'entry.json'
+
+
+class QueryCache:
+    """
+    A cache of query results on the local disk.
+
+    Every entry is a directory (named after its key) that holds the result
+    tables of one set of query parameters. Entries older than ttl seconds are
+    never returned, and when the cache grows beyond max_bytes, the least
+    recently used entries are evicted.
+
+    Instance Attributes:
+        - directory: the directory the cache is stored in
+        - ttl: the number of seconds an entry stays valid for
+        - max_bytes: the maximum total size of the cache, in bytes
+
+    Sample Usage:
+    >>> import tempfile
+    >>> cache = QueryCache(tempfile.mkdtemp())
+    >>> key = cache.key({'range': '1', 'sorting': 'ORDER BY block_timestamp DESC '})
+    >>> cache.get(key) is None
+    True
+    >>> path = cache.prepare(key)
+    >>> cache.commit(key)
+    >>> cache.get(key) == path
+    True
+    """
+    directory: str
+    ttl: float
+    max_bytes: int
+
+    def __init__(self, directory: str = DEFAULT_CACHE_DIR, ttl: float = DEFAULT_TTL,
+                 max_bytes: int = DEFAULT_MAX_BYTES) -> None:
+        """Initialize a cache stored in directory."""
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+
+    def key(self, params: dict[str, str]) -> str:
+        """
+        Return the cache key of a query with the given parameters.
+
+        The parameters are normalized first (case and whitespace don't matter),
+        and the current (UTC) date is included, since the queries select the
+        transactions of the last few days.
+
+        >>> cache = QueryCache()
+        >>> cache.key({'limit': 'LIMIT 1000 '}) == cache.key({'limit': '  limit   1000'})
+        True
+        """
+        normalized = {name: ' '.join(str(value).split()).upper()
+                      for name, value in params.items()}
+        normalized['date'] = datetime.now(timezone.utc).date().isoformat()
+
+        encoded = json.dumps(normalized, sort_keys=True).encode()
+        return hashlib.sha256(encoded).hexdigest()[:32]
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Return the directory of the (committed, unexpired) entry with the given
+        key, or None if there is no such entry. Expired entries are removed.
+        """
+        entry = self._read_entry(key)
+        if entry is None:
+            return None
+
+        if time.time() - entry['created'] > self.ttl:
+            self._remove(key)
+            return None
+
+        # Record the access, for the least recently used eviction.
+        entry['last_used'] = time.time()
+        self._write_entry(key, entry)
+
+        return self._path(key)
+
+    def prepare(self, key: str) -> str:
+        """
+        Return an empty directory to write the results of the query with the
+        given key to. The entry isn't visible to get until it is committed.
+        """
+        self._remove(key)
+        os.makedirs(self._path(key))
+        return self._path(key)
+
+    def commit(self, key: str) -> None:
+        """
+        Make the entry with the given key (which was prepared and then written)
+        visible to get, and evict entries until the cache fits within max_bytes.
+        """
+        now = time.time()
+        self._write_entry(key, {'created': now, 'last_used': now,
+                                'bytes': _directory_size(self._path(key))})
+        self._evict(keep=key)
+
+    def _evict(self, keep: str) -> None:
+        """
+        Remove every expired entry, and then the least recently used entries
+        (other than the entry keep) until the cache fits within max_bytes.
+
+        An entry that wasn't committed may still be being written by another
+        process, so it is only removed once nothing in it has been modified for
+        ttl seconds (when it must have been abandoned).
+        """
+        entries = []
+        for key in os.listdir(self.directory):
+            if key == keep:
+                continue
+
+            entry = self._read_entry(key)
+            if entry is None:
+                if time.time() - _last_modified(self._path(key)) > self.ttl:
+                    self._remove(key)
+            elif time.time() - entry['created'] > self.ttl:
+                self._remove(key)
+            else:
+                entries.append((entry['last_used'], entry['bytes'], key))
+
+        total = _directory_size(self.directory)
+        for _, size, key in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            self._remove(key)
+            total -= size
+
+    def _path(self, key: str) -> str:
+        """Return the directory of the entry with the given key."""
+        return os.path.join(self.directory, key)
+
+    def _read_entry(self, key: str) -> Optional[dict]:
+        """
+        Return the metadata of the entry with the given key, or None if it
+        doesn't exist or wasn't committed.
+        """
+        try:
+            with open(os.path.join(self._path(key), ENTRY_FILE)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_entry(self, key: str, entry: dict) -> None:
+        """Write the metadata of the entry with the given key."""
+        with open(os.path.join(self._path(key), ENTRY_FILE), 'w') as f:
+            json.dump(entry, f)
+
+    def _remove(self, key: str) -> None:
+        """Remove the entry with the given key, if it exists."""
+        shutil.rmtree(self._path(key), ignore_errors=True)
+
+
+def _last_modified(path: str) -> float:
+    """
+    Return the last time (as a time.time() value) that path, or any file or
+    directory in it, was modified, or 0.0 if it no longer exists.
+    """
+    try:
+        return max([os.path.getmtime(path)]
+                   + [os.path.getmtime(os.path.join(root, name))
+                      for root, directories, names in os.walk(path)
+                      for name in directories + names])
+    except OSError:
+        return 0.0
+
+
+def _directory_size(path: str) -> int:
+    """Return the total size (in bytes) of the files in path and its subdirectories."""
+    return sum(os.path.getsize(os.path.join(root, name))
+               for root, _, names in os.walk(path) for name in names)
+
+
+if __name__ == '__main__':
+    # Check all doctests.
+    import doctest
+    doctest.testmod()
+
+    import python_ta
+    python_ta.check_all(config={
+        'max-line-length': 100,
+        'disable': ['E1136'],
+        'allowed-io': ['QueryCache._read_entry', 'QueryCache._write_entry'],
+        'extra-imports': ['hashlib', 'json', 'os', 'shutil', 'time', 'datetime',
+                          'typing', 'tempfile']
+    })
+
+    import python_ta.contracts
+    python_ta.contracts.check_all_contracts()
@@ -0,0 +1,365 @@
+"""
+CSC111 Final Project: Reconstructing the Ethereum Network Using
+Graph Data Structures in Python
+
+General Information
+------------------------------------------------------------------------------
+This file was created for the purpose of applying concepts in learned in
+CSC111 to the real world problem domain of cryptocurrency transactions.
+
+Module Info: reachability.py
+
+This file contains a precomputed index of which accounts can be reached from
+which others through a series of transactions, so that reachability questions
+(and the number of accounts an account can reach) are answered by looking up a
+few bits, rather than by searching the graph every time.
+
+Copyright Information
+------------------------------------------------------------------------------
+This file is Copyright of Tobey Brizuela, Daniel Lazaro, Matthew Parvaneh, and
+Michael Umeh.
+"""
+import os
+import tempfile
+
+import numpy as np
+from scipy import sparse
+from scipy.sparse import csgraph
+
+from compact_graph import Graph, edge_ids
+
+# The number of rows of bits that are unpacked at a time to count the accounts they
+# reach, which bounds the memory this takes.
+_COUNT_BATCH_SIZE = 1024
+
+# The arrays saved by ReachabilityIndex.save, other than the addresses.
+_SAVED_ARRAYS = ('labels', 'component_sizes', 'dag_indptr', 'dag_targets', 'rows', 'columns',
+                 'bits', 'row_counts')
+
+
+class ReachabilityIndex:
+    """
+    An index of the accounts that every account of a graph can reach through a
+    series of transactions (or, if it is built with reverse=True, of the
+    accounts that can reach every account).
+
+    All the accounts of a strongly connected component reach the same accounts,
+    so the graph is first condensed into the DAG of its components. Components
+    that no transaction enters (sources) can't be reached by any other
+    component, and those that no transaction leaves (sinks) can't reach any
+    other component, so only the components in between (interior components)
+    get a bitset of the components they reach, with a bit for every component
+    other than the sources. The bitsets are computed in a single pass over the
+    DAG, from the sinks back, each one being the union of those of the
+    components it sends transactions to. The bitset of a source is the union
+    of those of its successors, and is only computed when it is queried.
+
+    In a transaction graph, most accounts are sources or sinks (they only send,
+    or only receive), so the bitsets take up much less than the square of the
+    number of components.
+
+    Instance Attributes:
+        - addresses: the accounts of the graph, in the order of graph.nodes
+        - reverse: whether the index is of the reversed graph, so that reaching
+          an account means being reached by it
+
+    Representation Invariants:
+        - len(self._labels) == len(self.addresses)
+        - self._bits.shape[0] == len(self._row_counts)
+
+    Sample Usage:
+    >>> import networkx as nx
+    >>> g = nx.MultiDiGraph([('a', 'b'), ('b', 'c'), ('c', 'b'), ('c', 'd'), ('e', 'd')])
+    >>> index = ReachabilityIndex(g)
+    >>> index.reaches('a', 'd'), index.reaches('d', 'a'), index.reaches('e', 'b')
+    (True, False, False)
+    >>> index.reachable_count('a'), index.reachable('b')
+    (3, ['c', 'd'])
+    >>> ReachabilityIndex(g, reverse=True).reachable('d')
+    ['a', 'b', 'c', 'e']
+    """
+    addresses: list[str]
+    reverse: bool
+
+    # Private Instance Attributes:
+    #   - _index: maps every address to its account id (its position in addresses)
+    #   - _labels: the id of the strongly connected component of every account
+    #   - _component_sizes: the number of accounts in every component
+    #   - _dag_indptr, _dag_targets: the condensation DAG, in CSR form; the components
+    #     component c sends transactions to are _dag_targets[_dag_indptr[c]:_dag_indptr[c + 1]]
+    #   - _rows: the row of the bitset of every interior component in _bits (or -1)
+    #   - _columns: the bit of every component other than the sources in the bitsets (or -1)
+    #   - _bits: the bitset of the components every interior component reaches (including
+    #     itself), packed into 64 bit words
+    #   - _row_counts: the number of accounts in the components of every bitset
+    _index: dict[str, int]
+    _labels: np.ndarray
+    _component_sizes: np.ndarray
+    _dag_indptr: np.ndarray
+    _dag_targets: np.ndarray
+    _rows: np.ndarray
+    _columns: np.ndarray
+    _bits: np.ndarray
+    _row_counts: np.ndarray
+
+    def __init__(self, graph: Graph, reverse: bool = False) -> None:
+        """
+        Build the reachability index of graph (or of the reversed graph, if
+        reverse is True).
+        """
+        addresses, sources, targets = edge_ids(graph)
+        if reverse:
+            sources, targets = targets, sources
+
+        self.addresses = list(addresses)
+        self._index = {address: i for i, address in enumerate(self.addresses)}
+        self.reverse = reverse
+
+        num_accounts = len(self.addresses)
+        matrix = sparse.csr_matrix((np.ones(len(sources), dtype=np.int8), (sources, targets)),
+                                   shape=(num_accounts, num_accounts))
+        num_components, self._labels = csgraph.connected_components(matrix, directed=True,
+                                                                    connection='strong')
+        self._component_sizes = np.bincount(self._labels, minlength=num_components)
+
+        # The distinct transactions between different components, sorted by sender.
+        dag_edges = np.unique(self._labels[sources].astype(np.int64) * num_components
+                              + self._labels[targets])
+        dag_sources, dag_targets = dag_edges // num_components, dag_edges % num_components
+        keep = dag_sources != dag_targets
+        dag_sources, self._dag_targets = dag_sources[keep], dag_targets[keep]
+        self._dag_indptr = np.searchsorted(dag_sources, np.arange(num_components + 1))
+
+        out_degrees = np.diff(self._dag_indptr)
+        in_degrees = np.bincount(self._dag_targets, minlength=num_components)
+        interior = (out_degrees > 0) & (in_degrees > 0)
+        self._rows = np.full(num_components, -1, dtype=np.int64)
+        self._rows[interior] = np.arange(np.count_nonzero(interior))
+        self._columns = np.full(num_components, -1, dtype=np.int64)
+        self._columns[in_degrees > 0] = np.arange(np.count_nonzero(in_degrees > 0))
+
+        self._bits = np.zeros((np.count_nonzero(interior), _num_words(self._columns)),
+                              dtype=np.uint64)
+        self._set_bits(np.flatnonzero(interior), np.flatnonzero(interior))
+
+        for level in _levels_from_sinks(self._dag_indptr, self._dag_targets, dag_sources):
+            # Every component in level only sends transactions to components in earlier
+            # levels, whose bitsets are complete.
+            level = level[interior[level]]
+            edges = _ranges(self._dag_indptr[level], out_degrees[level])
+            senders = np.repeat(level, out_degrees[level])
+            receivers = self._dag_targets[edges]
+
+            self._set_bits(senders, receivers)
+            through = interior[receivers]
+            np.bitwise_or.at(self._bits, self._rows[senders[through]],
+                             self._bits[self._rows[receivers[through]]])
+
+        self._row_counts = np.concatenate(
+            [self._count(self._bits[start:start + _COUNT_BATCH_SIZE])
+             for start in range(0, len(self._bits), _COUNT_BATCH_SIZE)] + [np.zeros(0, int)])
+
+    def reaches(self, address1: str, address2: str) -> bool:
+        """
+        Return whether address1 can reach address2 through a series of
+        transactions (or, in a reversed index, address2 can reach address1). An
+        account always reaches itself.
+
+        Preconditions:
+            - address1 in self.addresses and address2 in self.addresses
+        """
+        component1 = self._labels[self._index[address1]]
+        component2 = self._labels[self._index[address2]]
+        if component1 == component2:
+            return True
+
+        column = self._columns[component2]
+        if column == -1:
+            return False  # Nothing reaches a source
+
+        bits = self._reach_bits(component1)
+        return bool(bits[column // 64] >> np.uint64(column % 64) & np.uint64(1))
+
+    def reachable_count(self, address: str) -> int:
+        """
+        Return the number of accounts (other than itself) that address can reach
+        through a series of transactions (or, in a reversed index, that can
+        reach it).
+
+        Preconditions:
+            - address in self.addresses
+        """
+        component = self._labels[self._index[address]]
+        row = self._rows[component]
+        if row != -1:
+            count = self._row_counts[row]
+        else:
+            count = self._count(self._reach_bits(component)[np.newaxis])[0]
+            if self._columns[component] == -1:
+                count += self._component_sizes[component]  # A source has no bit of its own
+
+        return int(count) - 1
+
+    def reachable(self, address: str) -> list[str]:
+        """
+        Return the accounts (other than itself) that address can reach through a
+        series of transactions (or, in a reversed index, that can reach it), in
+        the order of addresses.
+
+        Preconditions:
+            - address in self.addresses
+        """
+        node = self._index[address]
+        component = self._labels[node]
+
+        bits = np.unpackbits(self._reach_bits(component).view(np.uint8), bitorder='little')
+        reached = np.zeros(len(self._component_sizes), dtype=bool)
+        has_column = self._columns != -1
+        reached[has_column] = bits[self._columns[has_column]].astype(bool)
+        reached[component] = True
+
+        nodes = np.flatnonzero(reached[self._labels])
+        return [self.addresses[i] for i in nodes.tolist() if i != node]
+
+    def save(self, path: str) -> None:
+        """
+        Save the index to the file at path (as a .npz file), e.g. next to a
+        snapshot of its graph, replacing any file already there only once the
+        new one has been written in full.
+        """
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, temp_path = tempfile.mkstemp(prefix='.reachability-', suffix='.npz', dir=directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(f, addresses=np.array([address.encode() for address in self.addresses],
+                                               dtype=np.bytes_),
+                         reverse=np.array(self.reverse),
+                         **{name: getattr(self, '_' + name) for name in _SAVED_ARRAYS})
+            os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    @classmethod
+    def load(cls, path: str) -> 'ReachabilityIndex':
+        """
+        Load the index saved to the file at path by save.
+
+        Preconditions:
+            - path is a file written by ReachabilityIndex.save
+        """
+        index = cls.__new__(cls)
+        with np.load(path) as data:
+            index.addresses = [address.decode() for address in data['addresses'].tolist()]
+            index.reverse = bool(data['reverse'])
+            for name in _SAVED_ARRAYS:
+                setattr(index, '_' + name, data[name])
+
+        index._index = {address: i for i, address in enumerate(index.addresses)}
+        return index
+
+    def _reach_bits(self, component: int) -> np.ndarray:
+        """
+        Return the bitset of the components that component reaches (including
+        itself, unless it is a source).
+        """
+        row = self._rows[component]
+        if row != -1:
+            return self._bits[row]
+
+        # A source (or a sink, which has no successors) reaches what its successors reach.
+        bits = np.zeros(self._bits.shape[1], dtype=np.uint64)
+        successors = self._dag_targets[self._dag_indptr[component]:
+                                       self._dag_indptr[component + 1]]
+        through = successors[self._rows[successors] != -1]
+        if len(through) > 0:
+            bits |= np.bitwise_or.reduce(self._bits[self._rows[through]], axis=0)
+
+        columns = self._columns[np.append(successors, component)]
+        columns = columns[columns != -1]
+        masks = np.left_shift(np.uint64(1), (columns % 64).astype(np.uint64))
+        np.bitwise_or.at(bits, columns // 64, masks)
+        return bits
+
+    def _set_bits(self, components: np.ndarray, targets: np.ndarray) -> None:
+        """
+        Set the bit of every component in targets in the bitset of the
+        corresponding (interior) component in components.
+        """
+        columns = self._columns[targets]
+        np.bitwise_or.at(self._bits, (self._rows[components], columns // 64),
+                         np.left_shift(np.uint64(1), (columns % 64).astype(np.uint64)))
+
+    def _count(self, bits: np.ndarray) -> np.ndarray:
+        """Return the number of accounts in the components of every bitset in bits."""
+        column_sizes = np.zeros(bits.shape[1] * 64, dtype=np.int64)
+        has_column = self._columns != -1
+        column_sizes[self._columns[has_column]] = self._component_sizes[has_column]
+
+        unpacked = np.unpackbits(bits.view(np.uint8), axis=1, bitorder='little')
+        return unpacked @ column_sizes
+
+
+def _num_words(columns: np.ndarray) -> int:
+    """Return the number of 64 bit words needed for a bit for every column in columns."""
+    return (int(columns.max(initial=-1)) + 1 + 63) // 64
+
+
+def _levels_from_sinks(indptr: np.ndarray, targets: np.ndarray,
+                       sources: np.ndarray) -> list[np.ndarray]:
+    """
+    Return the nodes of the DAG with the given adjacency (in CSR form, whose
+    edges are from sources to targets), grouped into levels so that every node
+    only has edges to nodes in earlier levels. The first level holds the sinks.
+    """
+    remaining = np.diff(indptr)
+    order = np.argsort(targets, kind='stable')
+    reverse_indptr = np.searchsorted(targets[order], np.arange(len(indptr)))
+    reverse_sources = sources[order]
+
+    levels = []
+    level = np.flatnonzero(remaining == 0)
+    while len(level) > 0:
+        levels.append(level)
+        predecessors = reverse_sources[_ranges(reverse_indptr[level],
+                                               np.diff(reverse_indptr)[level])]
+        np.subtract.at(remaining, predecessors, 1)
+        level = np.unique(predecessors[remaining[predecessors] == 0])
+
+    return levels
+
+
+def _ranges(starts: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    """
+    Return the concatenation of the ranges of the given lengths, starting at the
+    corresponding starts.
+
+    >>> _ranges(np.array([5, 0, 9]), np.array([2, 0, 3])).tolist()
+    [5, 6, 9, 10, 11]
+    """
+    offsets = np.cumsum(lengths) - lengths
+    return np.repeat(starts - offsets, lengths) + np.arange(lengths.sum(), dtype=np.int64)
+
+
+if __name__ == '__main__':
+    # Check all doctests.
+    import doctest
+    doctest.testmod()
+
+    import python_ta
+    python_ta.check_all(config={
+        'max-line-length': 100,
+        'disable': ['E1136', 'W0212'],
+        'allowed-io': [],
+        'extra-imports': ['os', 'tempfile', 'numpy', 'scipy', 'scipy.sparse', 'compact_graph']
+    })
+
+    import python_ta.contracts
+    python_ta.contracts.check_all_contracts()
+
+    # Example run of the index.
+    # from build_graph import build_graph
+    # ethereum_graph = build_graph('balances.csv', 'transactions.csv')
+    # index = ReachabilityIndex(ethereum_graph)
+    # index.reachable_count(next(iter(ethereum_graph.nodes)))
@@ -12,71 +12,575 @@ Copyright Information
 This file is Copyright of Tobey Brizuela, Daniel Lazaro, Matthew Parvaneh, and
 Michael Umeh.
 """
-import plotly.express as px
+import itertools
+import math
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Iterator, Optional
 
-from sklearn import linear_model, metrics
-from sklearn.model_selection import train_test_split
+import plotly.graph_objects as go
 
 import numpy as np
-import networkx as nx
-import pandas as pd
 
+from compact_graph import CompactGraph, Graph
 
-def balance_correlation_and_plot(graph: nx.MultiDiGraph) -> tuple:
+# The number of accounts read from the graph at a time by balance_degree_chunks.
+DEFAULT_CHUNK_SIZE = 100_000
+
+# The plot of balance_correlation_and_plot (with plot_mode='auto') is a scatter plot
+# drawn as SVG up to WEBGL_THRESHOLD accounts, with WebGL up to HEATMAP_THRESHOLD
+# accounts, and a heatmap of the number of accounts in each of DEFAULT_BINS x
+# DEFAULT_BINS (balance, degree) bins beyond that, whose size doesn't depend on the
+# number of accounts.
+WEBGL_THRESHOLD = 1_000
+HEATMAP_THRESHOLD = 100_000
+DEFAULT_BINS = 200
+
+# The most (resample, account) weights that are held in memory at a time while
+# bootstrapping; the resamples are fit in batches of at most this many weights.
+_MAX_BATCH_WEIGHTS = 4_000_000
+
+# The columns (see _fit_columns) shared by the bootstrap batches run in a worker
+# process (see _init_worker).
+_WORKER_ARRAYS = {}
+
+
+def balance_correlation_and_plot(graph: Graph, output_file: Optional[str] = None,
+                                 streaming: bool = False, plot_mode: str = 'auto',
+                                 log_balance: bool = False) -> tuple:
     """
     Calculate the coefficient of determination (r^2) b/w the number of transactions to/from
     an account and it's ether balance, and the root mean squared value
     of the linear model that gives this r^2 value.
     Scatter Plot the number of transactions to/from an account and it's ether balance
+    (shown in the browser, or written to output_file as html if it is given).
     Return results in tuple of the form (r^2, rmse)
+
+    r^2 is the raw score of the model on the held out test set (not its
+    absolute value), so it is negative when the model predicts the test
+    degrees worse than their mean does.
+
+    If streaming is True, the model is instead fit to every account, a chunk
+    at a time (see streaming_regression), and r^2 and the rmse are those of
+    the fit rather than of a held out test set.
+
+    plot_mode is one of 'svg' or 'webgl' (a scatter plot drawn with either),
+    'heatmap' (the number of accounts in every bin of a 2D histogram, computed
+    here a chunk of accounts at a time), or 'auto', which picks one of them by
+    the number of accounts (see WEBGL_THRESHOLD and HEATMAP_THRESHOLD). If
+    log_balance is True, the balances are plotted as log10(1 + balance).
+
+    Preconditions:
+        - plot_mode in {'auto', 'svg', 'webgl', 'heatmap'}
     """
     # Choose a random seed (stays the same each time for reproducible results)
     np.random.seed(1212)
 
-    # Dictionary accumulator that maps the balance of a UNIQUE account
-    # to its degree (the sum of all transactions that it has both sent
-    # and received).
-    account_data = {}
-    for node in graph.nodes():
-        if graph.nodes[node] != {}:
-            balance = graph.nodes[node]['balance']
-            # This gets marked as error, but it is correct according to nx docs.
-            degree = graph.degree(node)
+    if streaming:
+        stats = streaming_regression(graph)
+        r2, rmse = stats.r2, stats.rmse
+        num_accounts = stats.count
+    else:
+        # sklearn is slow to import, so it is only loaded once a model is fit with it.
+        from sklearn import linear_model, metrics
+        from sklearn.model_selection import train_test_split
+
+        # The balance of every account with a balance, and its degree (the sum
+        # of all transactions that it has both sent and received).
+        balances, degrees = _balances_and_degrees(graph)
+        num_accounts = len(balances)
+
+        balance_x = balances.reshape((-1, 1))
+        transactions_y = degrees
+
+        # Create the model.
+        lin_reg = linear_model.LinearRegression()
+
+        # Perform a train/test split on the data.
+        balance_train, balance_test, transaction_train, transaction_test \
+            = train_test_split(balance_x, transactions_y, test_size=0.2)
+
+        # Train the model
+        reg_model = lin_reg.fit(balance_train, transaction_train)
+
+        # Compute Coefficient of determination
+        r2 = reg_model.score(balance_test, transaction_test)
 
-            # Add pairing as an entry to the dictionary.
-            account_data[balance] = degree
+        # Compute RMSE
+        predictions = reg_model.predict(balance_test)
+        rmse = float(np.sqrt(metrics.mean_squared_error(y_true=transaction_test,
+                                                        y_pred=predictions)))
 
-    # Convert the predictor data (balance) and response data (number of
-    # transactions) into numpy arrays.
-    balance_x = np.array(list(account_data)).reshape((-1, 1))
-    transactions_y = np.array(list(account_data.values())).reshape(-1, 1)
+    # plot
+    if plot_mode == 'auto':
+        if num_accounts > HEATMAP_THRESHOLD:
+            plot_mode = 'heatmap'
+        elif num_accounts > WEBGL_THRESHOLD:
+            plot_mode = 'webgl'
+        else:
+            plot_mode = 'svg'
+
+    if plot_mode == 'heatmap':
+        fig = degree_balance_heatmap(graph, log_balance=log_balance)
+    else:
+        fig = _degree_balance_scatter(graph, plot_mode, log_balance)
+
+    if output_file is None:
+        fig.show()
+    else:
+        fig.write_html(output_file)
+    return (r2, rmse)
+
+
+def _degree_balance_scatter(graph: Graph, render_mode: str, log_balance: bool) -> go.Figure:
+    """
+    Return a scatter plot of the degree and the balance of every account of
+    graph with a balance, drawn as render_mode ('svg' or 'webgl'), with the
+    balances as log10(1 + balance) if log_balance is True.
+    """
+    # pandas (which plotly.express loads too) is slow to import, so it is only
+    # loaded once a scatter plot is drawn.
+    import pandas as pd
+    import plotly.express as px
+
+    balances, degrees = _balances_and_degrees(graph)
 
     # Create a dataframe with the two variables as columns.
-    ether_df = pd.DataFrame(list(account_data.items()), columns=['balance', 'degree'])
+    ether_df = pd.DataFrame({'balance': _plotted_balances(balances, log_balance),
+                             'degree': degrees})
+    return px.scatter(ether_df, x='balance', y='degree',
+                      title="Degree vs. Balance Scatter Plot",
+                      labels={'balance': _balance_label(log_balance), 'degree': "Degree"},
+                      render_mode=render_mode)
 
-    # Create the model.
-    lin_reg = linear_model.LinearRegression()
 
-    # Perform a train/test split on the data.
-    balance_train, balance_test, transaction_train, transaction_test \
-        = train_test_split(balance_x, transactions_y, test_size=0.2)
+def degree_balance_heatmap(graph: Graph, bins: int = DEFAULT_BINS,
+                           log_balance: bool = False) -> go.Figure:
+    """
+    Return a heatmap of the number of accounts of graph with a balance in each
+    of bins x bins equal (balance, degree) bins, with the balances as
+    log10(1 + balance) if log_balance is True.
+
+    The counts are accumulated a chunk of accounts at a time (after a first
+    pass over the chunks to find the range of the bins), so neither the memory
+    this takes nor the size of the figure depend on the number of accounts.
 
-    # Train the model
-    reg_model = lin_reg.fit(balance_train, transaction_train)
+    Preconditions:
+        - bins >= 1
+    """
+    low_x = low_y = np.inf
+    high_x = high_y = -np.inf
+    for balances, degrees in balance_degree_chunks(graph):
+        if len(balances) > 0:
+            balances = _plotted_balances(balances, log_balance)
+            low_x, high_x = min(low_x, balances.min()), max(high_x, balances.max())
+            low_y, high_y = min(low_y, degrees.min()), max(high_y, degrees.max())
 
-    # Compute Coefficient of determination
-    r2 = reg_model.score(balance_test, transaction_test)
+    x_edges = _bin_edges(low_x, high_x, bins)
+    y_edges = _bin_edges(low_y, high_y, bins)
+    counts = np.zeros((bins, bins))
+    for balances, degrees in balance_degree_chunks(graph):
+        counts += np.histogram2d(_plotted_balances(balances, log_balance), degrees,
+                                 bins=(x_edges, y_edges))[0]
 
-    # Compute RMSE
-    predictions = reg_model.predict(transaction_test)
-    rmse = metrics.mean_squared_error(y_true=balance_test, y_pred=predictions, squared=False)
+    # Leave the empty bins blank.
+    counts[counts == 0] = np.nan
+    fig = go.Figure(go.Heatmap(x=(x_edges[:-1] + x_edges[1:]) / 2,
+                               y=(y_edges[:-1] + y_edges[1:]) / 2,
+                               z=counts.T, colorscale='Viridis',
+                               colorbar={'title': "Accounts"},
+                               hovertemplate='balance: %{x}<br>degree: %{y}<br>'
+                                             'accounts: %{z}<extra></extra>'))
+    fig.update_layout(title="Degree vs. Balance Heatmap",
+                      xaxis_title=_balance_label(log_balance), yaxis_title="Degree")
+    return fig
 
-    # plot
-    fig = px.scatter(ether_df, x='balance', y='degree',
-                     title="Degree vs. Balance Scatter Plot",
-                     labels={"Balance", "Degree"})
-    fig.show()
-    return (abs(r2), rmse)
+
+def _plotted_balances(balances: np.ndarray, log_balance: bool) -> np.ndarray:
+    """Return balances as they are plotted: as log10(1 + balance) if log_balance is True."""
+    return np.log10(1 + balances) if log_balance else balances
+
+
+def _balance_label(log_balance: bool) -> str:
+    """Return the label of the balance axis of a plot."""
+    return "log10(1 + Balance)" if log_balance else "Balance"
+
+
+def _bin_edges(low: float, high: float, bins: int) -> np.ndarray:
+    """
+    Return the edges of bins equal bins from low to high (or around low, if
+    they are equal, or around 0 if there are no values, i.e. low is inf).
+    """
+    if not np.isfinite(low):
+        low = high = 0.0
+    if low == high:
+        low, high = low - 0.5, high + 0.5
+    return np.linspace(low, high, bins + 1)
+
+
+class RegressionStats:
+    """
+    The sufficient statistics of a simple linear regression of y on x: the
+    number of points, the means of x and y, and the sums of the (co)products
+    of their differences from the means. They are updated a batch of points at
+    a time (merging the statistics of the batch like Welford's method does), so
+    a model can be fit to any number of points in constant memory.
+
+    Instance Attributes:
+        - count: the number of points
+
+    Representation Invariants:
+        - self.count >= 0
+
+    Sample Usage:
+    >>> stats = RegressionStats()
+    >>> stats.add(np.array([0.0, 1.0]), np.array([1.0, 3.0]))
+    >>> stats.add(np.array([2.0, 3.0]), np.array([5.0, 8.0]))
+    >>> stats.count, round(stats.slope, 4), round(stats.intercept, 4)
+    (4, 2.3, 0.8)
+    >>> round(stats.r2, 4), round(stats.rmse, 4)
+    (0.9888, 0.2739)
+    """
+    count: int
+
+    # Private Instance Attributes:
+    #   - _mean_x, _mean_y: the means of x and y
+    #   - _sxx, _syy, _sxy: the sums of (x - mean_x) ** 2, (y - mean_y) ** 2 and
+    #     (x - mean_x) * (y - mean_y) over the points
+    _mean_x: float
+    _mean_y: float
+    _sxx: float
+    _syy: float
+    _sxy: float
+
+    def __init__(self) -> None:
+        """Initialize the statistics of no points."""
+        self.count = 0
+        self._mean_x = self._mean_y = 0.0
+        self._sxx = self._syy = self._sxy = 0.0
+
+    @property
+    def slope(self) -> float:
+        """The slope of the least squares line (nan if x is constant)."""
+        return self._sxy / self._sxx if self._sxx > 0 else np.nan
+
+    @property
+    def intercept(self) -> float:
+        """The intercept of the least squares line (nan if x is constant)."""
+        return self._mean_y - self.slope * self._mean_x
+
+    @property
+    def r2(self) -> float:
+        """
+        The coefficient of determination of the least squares line (nan if x or
+        y is constant).
+        """
+        if self._sxx <= 0 or self._syy <= 0:
+            return np.nan
+        return self._sxy ** 2 / (self._sxx * self._syy)
+
+    @property
+    def rmse(self) -> float:
+        """
+        The root mean squared error of the least squares line (nan if x is
+        constant).
+        """
+        if self._sxx <= 0:
+            return np.nan
+        return float(np.sqrt(max(self._syy - self._sxy ** 2 / self._sxx, 0.0) / self.count))
+
+    def add(self, x: np.ndarray, y: np.ndarray) -> None:
+        """
+        Add the points (x[i], y[i]).
+
+        Preconditions:
+            - len(x) == len(y)
+        """
+        if len(x) == 0:
+            return
+
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        mean_x, mean_y = float(x.mean()), float(y.mean())
+        dx, dy = x - mean_x, y - mean_y
+        self._merge(len(x), mean_x, mean_y, float(dx @ dx), float(dy @ dy), float(dx @ dy))
+
+    def merge(self, other: 'RegressionStats') -> None:
+        """Add the points summarized by other to these statistics."""
+        if other.count > 0:
+            self._merge(other.count, other._mean_x, other._mean_y, other._sxx, other._syy,
+                        other._sxy)
+
+    def without(self, other: 'RegressionStats') -> 'RegressionStats':
+        """
+        Return the statistics of the points of these statistics that aren't
+        summarized by other.
+
+        Preconditions:
+            - the points of other are among the points of these statistics
+            - other.count < self.count
+        """
+        count = self.count - other.count
+        mean_x = (self.count * self._mean_x - other.count * other._mean_x) / count
+        mean_y = (self.count * self._mean_y - other.count * other._mean_y) / count
+        dx, dy = other._mean_x - mean_x, other._mean_y - mean_y
+        weight = count * other.count / self.count
+
+        stats = RegressionStats()
+        stats.count = count
+        stats._mean_x, stats._mean_y = mean_x, mean_y
+        stats._sxx = self._sxx - other._sxx - dx * dx * weight
+        stats._syy = self._syy - other._syy - dy * dy * weight
+        stats._sxy = self._sxy - other._sxy - dx * dy * weight
+        return stats
+
+    def _merge(self, count: int, mean_x: float, mean_y: float, sxx: float, syy: float,
+               sxy: float) -> None:
+        """Add the statistics of a batch of count points to these statistics."""
+        total = self.count + count
+        dx, dy = mean_x - self._mean_x, mean_y - self._mean_y
+        weight = self.count * count / total
+
+        self._sxx += sxx + dx * dx * weight
+        self._syy += syy + dy * dy * weight
+        self._sxy += sxy + dx * dy * weight
+        self._mean_x += dx * count / total
+        self._mean_y += dy * count / total
+        self.count = total
+
+
+def streaming_regression(graph: Graph, chunk_size: int = DEFAULT_CHUNK_SIZE) -> RegressionStats:
+    """
+    Fit a linear model of the degree of every account of graph with a balance
+    (the number of transactions it sent or received) on its balance, reading
+    chunk_size accounts at a time, and return its statistics (which hold its
+    coefficients, r^2 and rmse).
+
+    Only one chunk is held in memory at a time, so this takes constant memory
+    however many accounts there are.
+
+    Preconditions:
+        - chunk_size > 0
+    """
+    stats = RegressionStats()
+    for balances, degrees in balance_degree_chunks(graph, chunk_size):
+        stats.add(balances, degrees)
+
+    return stats
+
+
+def balance_degree_chunks(graph: Graph, chunk_size: int = DEFAULT_CHUNK_SIZE) \
+        -> Iterator[tuple[np.ndarray, np.ndarray]]:
+    """
+    Yield the balances and degrees of the accounts of graph that have a
+    balance, chunk_size accounts of the graph (in the order of graph.nodes) at
+    a time.
+
+    Preconditions:
+        - chunk_size > 0
+    """
+    if isinstance(graph, CompactGraph):
+        balances, has_balance = graph.balances, graph.has_balance
+        out_degrees, in_degrees = graph.out_degrees, graph.in_degrees
+        for start in range(0, len(balances), chunk_size):
+            chunk = slice(start, start + chunk_size)
+            keep = has_balance[chunk]
+            degrees = out_degrees[chunk] + in_degrees[chunk]
+            yield balances[chunk][keep], degrees[keep].astype(np.float64)
+        return
+
+    # This gets marked as error, but it is correct according to nx docs.
+    accounts = zip(graph.nodes(data=True), graph.degree())
+    chunk = list(itertools.islice(accounts, chunk_size))
+    while chunk != []:
+        pairs = np.array([(attributes['balance'], degree) for (_, attributes), (_, degree)
+                          in chunk if attributes != {}], dtype=np.float64).reshape((-1, 2))
+        yield pairs[:, 0], pairs[:, 1]
+        chunk = list(itertools.islice(accounts, chunk_size))
+
+
+def resampled_regression(graph: Graph, num_resamples: int = 1000, num_folds: int = 5,
+                         confidence: float = 0.95, seed: int = 1212,
+                         workers: Optional[int] = None) -> dict[str, Any]:
+    """
+    Return confidence intervals for the slope, r^2 and rmse of the linear model
+    of the degree of every account of graph with a balance on its balance, and
+    the r^2 and rmse of the model under k-fold cross-validation.
+
+    The intervals are the percentile intervals (covering the given confidence)
+    of the fits to num_resamples bootstrap resamples of the accounts. Every
+    resample is represented by the number of times each account was drawn, so
+    a batch of resamples is fit at once with a few matrix products (the least
+    squares line has a closed form in terms of the weighted sums of x, y, x^2,
+    xy and y^2). If workers is more than 1, the batches are split between a
+    pool of that many processes. The resamples only depend on seed, so the
+    intervals are the same however many workers there are.
+
+    The accounts are also split into num_folds folds at random, and the model
+    fit to all the other folds is tested on each one in turn.
+
+    Return a dictionary mapping 'slope', 'r2' and 'rmse' to (estimate, lower,
+    upper) tuples, where the estimate is that of the fit to every account, and
+    'cv_r2' and 'cv_rmse' to the means of the metrics over the folds.
+
+    Preconditions:
+        - num_resamples >= 1
+        - num_folds >= 2
+        - 0 < confidence < 1
+        - workers is None or workers >= 1
+        - at least num_folds accounts of graph have a balance
+    """
+    balances, degrees = _balances_and_degrees(graph)
+    rng = np.random.default_rng(seed)
+
+    # Center the data, so that the sums of squares in the closed form don't lose
+    # precision to the (huge) means of the balances.
+    x = balances - balances.mean()
+    y = degrees - degrees.mean()
+    columns = _fit_columns(x, y)
+
+    batch_size = max(1, min(num_resamples, _MAX_BATCH_WEIGHTS // max(len(x), 1)))
+    sizes = [min(batch_size, num_resamples - start)
+             for start in range(0, num_resamples, batch_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+
+    if workers is not None and workers > 1:
+        fits = _parallel_bootstrap(columns, sizes, seeds, workers)
+    else:
+        _WORKER_ARRAYS['columns'] = columns
+        try:
+            fits = [_bootstrap_batch(size, batch_seed) for size, batch_seed in zip(sizes, seeds)]
+        finally:
+            _WORKER_ARRAYS.clear()
+
+    fits = np.concatenate(fits)
+    bounds = [50 * (1 - confidence), 50 * (1 + confidence)]
+    full = _weighted_fits(columns, np.ones((1, len(x))))[0]
+
+    result = {}
+    for i, name in enumerate(('slope', 'r2', 'rmse')):
+        lower, upper = np.nanpercentile(fits[:, i], bounds)
+        result[name] = (float(full[i]), float(lower), float(upper))
+
+    fold_r2, fold_rmse = _cross_validate(x, y, rng.permutation(len(x)) % num_folds, num_folds)
+    result['cv_r2'] = float(np.mean(fold_r2))
+    result['cv_rmse'] = float(np.mean(fold_rmse))
+    return result
+
+
+def _parallel_bootstrap(columns: np.ndarray, sizes: list[int],
+                        seeds: list[np.random.SeedSequence], workers: int) -> list[np.ndarray]:
+    """
+    Return the fits of the bootstrap batches of the given sizes (drawn with the
+    given seeds) of the points with the given columns (see _fit_columns),
+    computed by a pool of workers processes, in order.
+
+    As in cycles._parallel_cycles, the columns are saved to a temporary
+    directory, which every worker memory-maps once, rather than being pickled
+    for every batch.
+
+    Preconditions:
+        - workers > 1
+    """
+    with tempfile.TemporaryDirectory(prefix='.regression-') as directory:
+        np.save(os.path.join(directory, 'columns.npy'), columns)
+
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(directory,)) as pool:
+            futures = [pool.submit(_bootstrap_batch, size, batch_seed)
+                       for size, batch_seed in zip(sizes, seeds)]
+            return [future.result() for future in futures]
+
+
+def _init_worker(directory: str) -> None:
+    """Memory-map the columns saved in directory by _parallel_bootstrap."""
+    _WORKER_ARRAYS['columns'] = np.load(os.path.join(directory, 'columns.npy'), mmap_mode='r')
+
+
+def _bootstrap_batch(num_resamples: int, seed: np.random.SeedSequence) -> np.ndarray:
+    """
+    Return the fits (see _weighted_fits) to num_resamples bootstrap resamples
+    of the points whose columns are in _WORKER_ARRAYS, drawn with the given seed.
+    """
+    columns = _WORKER_ARRAYS['columns']
+    n = len(columns)
+    rng = np.random.default_rng(seed)
+
+    # The number of times every point was drawn, in every resample.
+    draws = rng.integers(0, n, size=(num_resamples, n))
+    draws += np.arange(num_resamples)[:, np.newaxis] * n
+    weights = np.bincount(draws.ravel(), minlength=num_resamples * n).reshape(num_resamples, n)
+    return _weighted_fits(columns, weights)
+
+
+def _fit_columns(x: np.ndarray, y: np.ndarray) -> np.ndarray:
+    """
+    Return the columns 1, x, y, x^2, y^2 and xy of the points (x[i], y[i]), as
+    an array with a row per point, so that the weighted sums needed to fit
+    many resamples are a single matrix product.
+    """
+    return np.column_stack([np.ones(len(x)), x, y, x * x, y * y, x * y])
+
+
+def _weighted_fits(columns: np.ndarray, weights: np.ndarray) -> np.ndarray:
+    """
+    Return the slope, r^2 and rmse of the least squares line through the points
+    with the given columns (see _fit_columns) and weights, for every row of
+    weights, as the columns of an array (with nan where the line isn't defined).
+    """
+    count, sum_x, sum_y, sum_xx, sum_yy, sum_xy = (weights.astype(np.float64) @ columns).T
+    mean_x, mean_y = sum_x / count, sum_y / count
+
+    sxx = sum_xx - count * mean_x ** 2
+    syy = sum_yy - count * mean_y ** 2
+    sxy = sum_xy - count * mean_x * mean_y
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slope = np.where(sxx > 0, sxy / sxx, np.nan)
+        r2 = np.where((sxx > 0) & (syy > 0), sxy ** 2 / (sxx * syy), np.nan)
+        rmse = np.sqrt(np.maximum(syy - slope * sxy, 0.0) / count)
+
+    return np.column_stack([slope, r2, rmse])
+
+
+def _cross_validate(x: np.ndarray, y: np.ndarray, folds: np.ndarray,
+                    num_folds: int) -> tuple[list[float], list[float]]:
+    """
+    Return the r^2 and rmse on every fold of the least squares line fit to the
+    points (x[i], y[i]) in all the other folds, where folds holds the fold of
+    every point.
+
+    The line fit to the other folds is found by taking the sufficient
+    statistics of the fold out of those of all the points.
+    """
+    everything = RegressionStats()
+    everything.add(x, y)
+
+    all_r2, all_rmse = [], []
+    for fold in range(num_folds):
+        test = folds == fold
+        held_out = RegressionStats()
+        held_out.add(x[test], y[test])
+        train = everything.without(held_out)
+
+        errors = y[test] - (train.intercept + train.slope * x[test])
+        total = np.square(y[test] - y[test].mean()).sum()
+        sse = float(errors @ errors)
+        all_r2.append(1 - sse / total if total > 0 else math.nan)
+        all_rmse.append(math.sqrt(sse / np.count_nonzero(test)))
+
+    return all_r2, all_rmse
+
+
+def _balances_and_degrees(graph: Graph) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Return the balance of every account of graph with a balance, and its
+    degree, in the order of graph.nodes.
+    """
+    chunks = list(balance_degree_chunks(graph))
+    return (np.concatenate([balances for balances, _ in chunks] + [np.zeros(0)]),
+            np.concatenate([degrees for _, degrees in chunks] + [np.zeros(0)]))
 
 
 if __name__ == '__main__':
@@ -87,10 +591,12 @@ if __name__ == '__main__':
     import python_ta
     python_ta.check_all(config={
         'max-line-length': 100,
-        'disable': ['E1136'],
+        'disable': ['E1136', 'W0212', 'C0415'],
         'allowed-io': [],
-        'extra-imports': ['networkx', 'sklearn', 'plotly.express',
-                          'numpy', 'pandas', 'sklearn.model_selection']
+        'extra-imports': ['compact_graph', 'sklearn', 'plotly.express', 'typing',
+                          'numpy', 'pandas', 'sklearn.model_selection', 'itertools',
+                          'plotly.graph_objects',
+                          'math', 'os', 'tempfile', 'concurrent.futures']
     })
 
     import python_ta.contracts
@@ -18,135 +18,114 @@ Copyright Information
 This file is Copyright of Tobey Brizuela, Daniel Lazaro, Matthew Parvaneh, and
 Michael Umeh.
 """
-import networkx as nx
+import os
+import tempfile
+from typing import Iterable
 
+import numpy as np
+from scipy import sparse
 
-def transaction_network(graph: nx.MultiDiGraph, account: str) -> list[str]:
-    """
-    Find the largest connected subset of accounts in the graphical
-    representation of the Ethereum network.
-
-    The algorithm used to do this is somewhat similar to that which
-    calculates a spanning tree.
-
-    Preconditions:
-        - list(graph.nodes) != []
-    """
-    # Find any relevant nodes that we can recurse on:
-    # Criteria:
-    # - Must have at least 1 successor (outgoing transaction)
-    # - Must have at least 1 predecessor (incoming transaction)
-    # We must find the successors and predecessors for a given account
-    # separately
-    succ = _find_trans_network_successors(graph, account, set())
-    pred = _find_trans_network_predecessors(graph, account, set())
+from compact_graph import Graph, edge_ids
 
-    # First, initialize the entire subnetwork of all accounts
-    # to just that of the successors. Next, we can add all the predecessor
-    # accounts to the subnetwork if they haven't already been counted
-    # as successors.
-    total_connected = succ.copy()
-    for p in pred:
-        if p not in total_connected:
-            total_connected.append(p)
+# The number of rows of the neighbour matrix that top_partners multiplies at a time,
+# which bounds the memory used by the shared neighbour counts of each batch.
+DEFAULT_BATCH_SIZE = 10_000
 
-    return total_connected
 
-
-def _find_trans_network_successors(graph: nx.MultiDiGraph, account: str,
-                                   visited: set) -> list[str]:
+def transaction_network(graph: Graph, account: str) -> list[str]:
     """
-    Recursive helper function for transaction_network.
-
-    Recurses on all of the successors of account, using a depth-first
-    approach, finding all items that are linked to account through
-    a series of transactions.
+    Return the subnetwork of account: every account linked to it through a
+    series of transactions (in either direction), starting with account itself.
 
     Preconditions:
-        - list(graph.nodes) != []
-        - account != ''
-    """
-    # Initialize the current network to contain only account
-    # (since it is the central account which we start at, and
-    # branch out from).
-    current_network = [account]
-
-    new_visited = visited.union({account})
-    for successor in graph.successors(account):
-        if successor not in new_visited:
-            # If the successor hasn't already been visited, we recurse
-            # on it to find its successors.
-            current_network += _find_trans_network_successors(graph, successor,
-                                                              new_visited)
-
-    return current_network
+        - account in graph.nodes
 
-
-def _find_trans_network_predecessors(graph: nx.MultiDiGraph, account: str,
-                                     visited: set) -> list[str]:
+    Sample Usage:
+    >>> import networkx as nx
+    >>> g = nx.MultiDiGraph([('a', 'b'), ('c', 'b'), ('d', 'e')])
+    >>> transaction_network(g, 'c')
+    ['c', 'a', 'b']
     """
-    Recursive helper function for transaction_network.
+    addresses, labels, _ = connected_components(graph)
+    node = addresses.index(account)
+    return [account] + [addresses[i] for i in np.flatnonzero(labels == labels[node])
+                        if i != node]
 
-    Recurses on all of the predecessors of account, using a depth-first
-    approach, finding all items that are linked to account through
-    a series of transactions.
 
-    Preconditions:
-        - list(graph.nodes) != []
-        - account != ''
+def connected_components(graph: Graph) -> tuple[list[str], np.ndarray, np.ndarray]:
     """
-    current_network = [account]
+    Return the accounts of graph (in the order of graph.nodes), the id of the
+    subnetwork (weakly connected component) every account is in, and the
+    number of accounts in every subnetwork.
+
+    The subnetworks are found in a single pass over the transactions with a
+    union-find structure (a ComponentIndex), rather than a search from every
+    account, so this takes (nearly) linear time. They are numbered in the order
+    of their first account.
+
+    Sample Usage:
+    >>> import networkx as nx
+    >>> g = nx.MultiDiGraph([('a', 'b'), ('c', 'b'), ('d', 'e')])
+    >>> addresses, labels, sizes = connected_components(g)
+    >>> labels.tolist(), sizes.tolist()
+    ([0, 0, 0, 1, 1], [3, 2])
+    """
+    index = ComponentIndex.from_graph(graph)
+    addresses = index.addresses
+    roots = np.array(index.roots(), dtype=np.int64)
+    _, first, labels = np.unique(roots, return_index=True, return_inverse=True)
 
-    new_visited = visited.union({account})
-    for predecessor in graph.predecessors(account):
-        if predecessor not in new_visited:
-            # If the predecessor hasn't already been visited, we recurse
-            # on it to find its predecessors.
-            current_network += _find_trans_network_predecessors(graph, predecessor,
-                                                                new_visited)
+    # Renumber the subnetworks in the order of their first account.
+    order = np.argsort(first)
+    ranks = np.empty_like(order)
+    ranks[order] = np.arange(len(order))
+    labels = ranks[labels.ravel()]
 
-    return current_network
+    return addresses, labels, np.bincount(labels, minlength=len(order))
 
 
-def biggest_subnetwork(graph: nx.MultiDiGraph) -> list[str]:
+def biggest_subnetwork(graph: Graph) -> list[str]:
     """
     Find and return a list containing all of the accounts
     that make up the biggest subnetwork of the graph.
 
+    The first account of the list is the central account of the subnetwork:
+    the one that made or received the most transactions (the first one, in
+    the order of graph.nodes, if there is a tie). Every account of the
+    subnetwork appears exactly once.
+
     Preconditions:
         - list(graph.nodes) != []
-    """
-    accounts = []
-    for node in graph.nodes():
-        # Find the number of successors and predecessors for each account.
-        num_predecessors = len(list(graph.predecessors(node)))
-        num_successors = len(list(graph.successors(node)))
 
-        # If there is at least 1 successor and 1 predecessor, this account
-        # is a viable candidate for having a large subnetwork.
-        if num_successors >= 1 and num_predecessors >= 1:
-            accounts.append(node)
-
-    # A list of list that will contain every single subnetwork in the graph.
-    networks = []
-    for account in accounts:
-        subnetwork = transaction_network(graph, account)
-        networks.append(subnetwork)
+    Sample Usage:
+    >>> import networkx as nx
+    >>> g = nx.MultiDiGraph([('a', 'b'), ('c', 'b'), ('d', 'e')])
+    >>> biggest_subnetwork(g)
+    ------Biggest Subnetwork------
+    *Central Account*: b
+    Number of accounts: 3
+    <BLANKLINE>
+    <BLANKLINE>
+    ['b', 'a', 'c']
+    """
+    addresses, labels, sizes = connected_components(graph)
+    members = np.flatnonzero(labels == np.argmax(sizes))
 
-    # Find the largest subnetwork (the longest list of accounts).
-    biggest_sub = max(networks, key=len)
+    degrees = np.array([degree for _, degree in graph.degree()], dtype=np.int64)
+    central = members[np.argmax(degrees[members])]
+    biggest_sub = [addresses[central]] + [addresses[i] for i in members if i != central]
 
     # Return information about the biggest subnetwork of interconnected
-    # accounts on the
+    # accounts on the network.
     print("------Biggest Subnetwork------")
     print(f"*Central Account*: {biggest_sub[0]}")
-    print(f"Entire subnetwork: {biggest_sub}")
+    print(f"Number of accounts: {len(biggest_sub)}")
     print("\n")
 
     return biggest_sub
 
 
-def future_partners(graph: nx.MultiDiGraph, subnetwork: list[str]) -> None:
+def future_partners(graph: Graph, subnetwork: list[str]) -> list[tuple[str, int]]:
     """
     Find future partners of the central account of the biggest subnetwork,
     meaning all those accounts which the central one is likely to engage
@@ -155,50 +134,368 @@ def future_partners(graph: nx.MultiDiGraph, subnetwork: list[str]) -> None:
     This function employs a similar metric as similarity score in A3,
     except it just uses the number of shared neighbours (accounts) as
     a means of determining which accounts are most likely to be future
-    transactions partners.
+    transactions partners. The counts for the whole subnetwork are computed at
+    once, as a product with the sparse neighbour matrix of graph.
+
+    Return the potential future partners (the accounts with at least one shared
+    neighbour), with their number of shared neighbours, from most to least
+    likely (and in the order of subnetwork, if they are tied).
 
     Preconditions:
         - list(graph.nodes) != []
+        - subnetwork != [] and all(account in graph.nodes for account in subnetwork)
+
+    Sample Usage:
+    >>> import networkx as nx
+    >>> g = nx.MultiDiGraph([('a', 'b'), ('a', 'c'), ('d', 'b'), ('d', 'c'), ('e', 'c')])
+    >>> future_partners(g, ['a', 'b', 'c', 'd', 'e'])
+    [('d', 2), ('e', 1)]
     """
-    # The account at the center of the
-    main_account = subnetwork[0]
-    main_neighbours = set(list(graph.successors(main_account))
-                          + list(graph.predecessors(main_account)))
+    addresses, matrix = neighbour_matrix(graph)
+    index = {address: i for i, address in enumerate(addresses)}
+    nodes = np.array([index[account] for account in subnetwork], dtype=np.int64)
 
-    partners = []
-    for account in subnetwork[1:]:
-        preds = list(graph.predecessors(account))
-        succs = list(graph.successors(account))
-        acct_neighbours = set(preds + succs)
+    # The number of neighbours every other account shares with the central one.
+    counts = shared_neighbours(matrix, nodes[0])[nodes[1:]]
+    order = np.argsort(-counts, kind='stable')
 
-        # Find out how many of the same accounts as the main account that
-        # this account has engaged made a transaction with.
-        same_neighbours = len(main_neighbours.intersection(acct_neighbours))
+    return [(subnetwork[i + 1], int(counts[i])) for i in order.tolist() if counts[i] > 0]
 
-        partners.append((account, same_neighbours))
 
-    # Sort by same neighbours from least to greatest.
-    partners.sort(key=lambda partner: partner[1])
-    partners.reverse()
+def neighbour_matrix(graph: Graph) -> tuple[list[str], sparse.csr_matrix]:
+    """
+    Return the accounts of graph (in the order of graph.nodes) and its
+    neighbour matrix: the symmetric sparse matrix with a 1 in row u and column
+    v when accounts u and v made a transaction with each other (in either
+    direction), and a 0 everywhere else.
+
+    The product of the rows of two accounts is their number of shared
+    neighbours.
+
+    Sample Usage:
+    >>> import networkx as nx
+    >>> g = nx.MultiDiGraph([('a', 'b'), ('b', 'a'), ('c', 'b')])
+    >>> addresses, matrix = neighbour_matrix(g)
+    >>> matrix.toarray().tolist()
+    [[0, 1, 0], [1, 0, 1], [0, 1, 0]]
+    """
+    addresses, sources, targets = edge_ids(graph)
+    rows = np.concatenate([sources, targets])
+    columns = np.concatenate([targets, sources])
 
-    # Print a summary of the central accounts potential future partners.
-    print(f"The account at center of the biggest subnetwork is: {main_account}\n")
-    print("Below are the accounts in the subnetwork that are most likely to engage\n"
-          + "in future transactions with the central account, ranked on how many of the\n"
-          + "same neighbours they have. (To be a potential future partner, they must have\n"
-          + "AT LEAST ONE common neighbour.)\n")
+    # Converting to CSR adds up the entries of parallel transactions, which are then reset to 1.
+    matrix = sparse.coo_matrix((np.ones(len(rows), dtype=np.int32), (rows, columns)),
+                               shape=(len(addresses), len(addresses))).tocsr()
+    matrix.data[:] = 1
+    return addresses, matrix
 
-    for i in range(0, len(partners)):
-        if partners[i][1] > 0:
-            print(f"#{i + 1} - Account Address: {partners[i][0]}")
-            print(f"Number of shared neighbours: {partners[i][1]}\n")
 
-    # If all accounts in the subnetwork had no shared neighbours with the central
-    # account, we won't classify them as future partners.
-    if all(partners[n][1] == 0 for n in range(0, len(partners))):
-        print("It looks like there were no accounts that shared neighbours with"
-              + "the main account in this subnetwork. We cannot tell who might be"
-              + "a future transactional partner with them.")
+def shared_neighbours(matrix: sparse.csr_matrix, node: int) -> np.ndarray:
+    """
+    Return the number of neighbours every account shares with the account with
+    id node, given the neighbour matrix of their graph.
+
+    Sample Usage:
+    >>> import networkx as nx
+    >>> g = nx.MultiDiGraph([('a', 'b'), ('a', 'c'), ('d', 'b'), ('d', 'c')])
+    >>> _, matrix = neighbour_matrix(g)
+    >>> shared_neighbours(matrix, 0).tolist()
+    [2, 0, 0, 2]
+    """
+    return (matrix @ matrix[node].T).toarray().ravel()
+
+
+def shared_neighbours_batch(matrix: sparse.csr_matrix, nodes: np.ndarray) -> sparse.csr_matrix:
+    """
+    Return the number of neighbours every account shares with each of the
+    accounts with the ids in nodes, as a sparse matrix with a row for each of
+    nodes and a column for every account, given the neighbour matrix of their
+    graph.
+    """
+    return (matrix[nodes] @ matrix).tocsr()
+
+
+def top_partners(matrix: sparse.csr_matrix, k: int,
+                 batch_size: int = DEFAULT_BATCH_SIZE) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Return the ids of the (at most) k accounts every account shares the most
+    neighbours with (other than itself), and their numbers of shared
+    neighbours, given the neighbour matrix of their graph.
+
+    Both are returned as arrays with a row for every account and k columns,
+    from most to least shared neighbours (ties go to the smaller id). Rows with
+    fewer than k partners are padded with an id of -1 and a count of 0.
+
+    The shared neighbour counts are computed batch_size accounts at a time, and
+    only the top k of each are kept, so the whole (possibly dense) matrix of
+    counts is never stored.
+
+    Preconditions:
+        - k >= 1
+        - batch_size >= 1
+
+    Sample Usage:
+    >>> import networkx as nx
+    >>> g = nx.MultiDiGraph([('a', 'b'), ('a', 'c'), ('d', 'b'), ('d', 'c'), ('e', 'c')])
+    >>> _, matrix = neighbour_matrix(g)
+    >>> partners, counts = top_partners(matrix, 2)
+    >>> partners[0].tolist(), counts[0].tolist()
+    ([3, 4], [2, 1])
+    """
+    num_accounts = matrix.shape[0]
+    partners = np.full((num_accounts, k), -1, dtype=np.int64)
+    counts = np.zeros((num_accounts, k), dtype=np.int64)
+
+    for start in range(0, num_accounts, batch_size):
+        batch = shared_neighbours_batch(matrix, np.arange(start, min(start + batch_size,
+                                                                     num_accounts))).tocoo()
+        rows, columns, data = batch.row, batch.col, batch.data
+
+        # Leave out every account's count with itself, and the accounts with no shared ones.
+        keep = (rows + start != columns) & (data > 0)
+        rows, columns, data = rows[keep], columns[keep], data[keep]
+
+        # Sort the counts of each row from largest to smallest, and keep the first k.
+        order = np.lexsort((columns, -data, rows))
+        rows, columns, data = rows[order], columns[order], data[order]
+        row_starts = np.searchsorted(rows, rows, side='left')
+        ranks = np.arange(len(rows)) - row_starts
+        top = ranks < k
+
+        partners[rows[top] + start, ranks[top]] = columns[top]
+        counts[rows[top] + start, ranks[top]] = data[top]
+
+    return partners, counts
+
+
+class ComponentIndex:
+    """
+    An index of the subnetworks (weakly connected components) of a transaction
+    graph, which is kept up to date as transactions are added to it, so that it
+    never has to be rebuilt from the whole graph.
+
+    It is a union-find structure (with union by size and path halving), so
+    adding a transaction and looking up the subnetwork of an account, its size
+    or the largest subnetwork all take nearly constant time. It can be saved to
+    disk, and loaded again later to carry on where it left off.
+
+    Instance Attributes:
+        - addresses: the address of every account in the index, in the order
+          they were added
+        - num_components: the number of subnetworks
+
+    Representation Invariants:
+        - len(self.addresses) == len(self._index) == len(self._parent) == len(self._size)
+        - self.addresses == [] or self._largest == self._root(self._largest)
+
+    Sample Usage:
+    >>> index = ComponentIndex()
+    >>> index.add_transactions(['a', 'c', 'd'], ['b', 'b', 'e'])
+    >>> index.component_size('a'), index.num_components
+    (3, 2)
+    >>> index.same_component('a', 'd')
+    False
+    >>> index.add_transaction('e', 'c')
+    >>> index.largest_component()
+    ('a', 5)
+    """
+    addresses: list[str]
+    num_components: int
+
+    # Private Instance Attributes:
+    #   - _index: maps the address of every account to its id (its position in addresses)
+    #   - _parent: the parent of every account in the union-find forest; the root
+    #     of each tree (the account that is its own parent) represents its subnetwork
+    #   - _size: the number of accounts in the tree of every root (the sizes of
+    #     accounts that are no longer roots are out of date)
+    #   - _largest: the root of the largest subnetwork (or -1 if there are no accounts)
+    _index: dict[str, int]
+    _parent: list[int]
+    _size: list[int]
+    _largest: int
+
+    def __init__(self) -> None:
+        """Initialize an empty index."""
+        self.addresses = []
+        self.num_components = 0
+        self._index = {}
+        self._parent = []
+        self._size = []
+        self._largest = -1
+
+    @classmethod
+    def from_graph(cls, graph: Graph) -> 'ComponentIndex':
+        """
+        Return the index of the subnetworks of graph, whose accounts are added
+        in the order of graph.nodes.
+        """
+        index = cls()
+        addresses, sources, targets = edge_ids(graph)
+        index.add_accounts(addresses)
+        for u, v in zip(sources.tolist(), targets.tolist()):
+            index._union(u, v)
+
+        return index
+
+    def __len__(self) -> int:
+        """Return the number of accounts in the index."""
+        return len(self.addresses)
+
+    def __contains__(self, address: str) -> bool:
+        """Return whether the account address is in the index."""
+        return address in self._index
+
+    def add_accounts(self, addresses: Iterable[str]) -> None:
+        """
+        Add the given accounts to the index (each in a subnetwork of its own),
+        skipping those that are already in it.
+        """
+        for address in addresses:
+            self._add(address)
+
+    def add_transaction(self, sender: str, receiver: str) -> None:
+        """
+        Record a transaction from sender to receiver, merging their subnetworks.
+        Accounts that aren't in the index yet are added to it.
+        """
+        self._union(self._add(sender), self._add(receiver))
+
+    def add_transactions(self, senders: Iterable[str], receivers: Iterable[str]) -> None:
+        """
+        Record a transaction from every account in senders to the corresponding
+        account in receivers, e.g. a chunk from build_graph.read_transaction_chunks.
+        """
+        for sender, receiver in zip(senders, receivers):
+            self._union(self._add(sender), self._add(receiver))
+
+    def component(self, address: str) -> str:
+        """
+        Return the account that represents the subnetwork of address. Two
+        accounts are in the same subnetwork exactly when they have the same
+        representative, until their subnetwork is merged with another one.
+
+        Preconditions:
+            - address in self
+        """
+        return self.addresses[self._root(self._index[address])]
+
+    def component_size(self, address: str) -> int:
+        """
+        Return the number of accounts in the subnetwork of address.
+
+        Preconditions:
+            - address in self
+        """
+        return self._size[self._root(self._index[address])]
+
+    def same_component(self, address1: str, address2: str) -> bool:
+        """
+        Return whether address1 and address2 are in the same subnetwork.
+
+        Preconditions:
+            - address1 in self and address2 in self
+        """
+        return self._root(self._index[address1]) == self._root(self._index[address2])
+
+    def largest_component(self) -> tuple[str, int]:
+        """
+        Return the account that represents the largest subnetwork, and its
+        number of accounts.
+
+        Preconditions:
+            - len(self) > 0
+        """
+        return self.addresses[self._largest], self._size[self._largest]
+
+    def roots(self) -> list[int]:
+        """
+        Return the id of the root (see component) of the subnetwork of every
+        account, in the order of addresses.
+        """
+        return [self._root(node) for node in range(len(self.addresses))]
+
+    def save(self, path: str) -> None:
+        """
+        Save the index to the file at path (as a .npz file), replacing any file
+        already there only once the new one has been written in full.
+        """
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, temp_path = tempfile.mkstemp(prefix='.components-', suffix='.npz', dir=directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(f, addresses=np.array([address.encode() for address in self.addresses],
+                                               dtype=np.bytes_),
+                         parent=np.array(self._parent, dtype=np.int64),
+                         size=np.array(self._size, dtype=np.int64))
+            os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    @classmethod
+    def load(cls, path: str) -> 'ComponentIndex':
+        """
+        Load the index saved to the file at path by save.
+
+        Preconditions:
+            - path is a file written by ComponentIndex.save
+        """
+        with np.load(path) as data:
+            addresses = [address.decode() for address in data['addresses'].tolist()]
+            parent = data['parent'].tolist()
+            size = data['size'].tolist()
+
+        index = cls()
+        index.addresses = addresses
+        index._index = {address: i for i, address in enumerate(addresses)}
+        index._parent = parent
+        index._size = size
+
+        roots = [node for node in range(len(parent)) if parent[node] == node]
+        index.num_components = len(roots)
+        index._largest = max(roots, key=size.__getitem__, default=-1)
+        return index
+
+    def _add(self, address: str) -> int:
+        """Return the id of the account address, adding it to the index if it isn't in it."""
+        node = self._index.get(address)
+        if node is None:
+            node = len(self.addresses)
+            self._index[address] = node
+            self.addresses.append(address)
+            self._parent.append(node)
+            self._size.append(1)
+            self.num_components += 1
+            if self._largest == -1:
+                self._largest = node
+
+        return node
+
+    def _root(self, node: int) -> int:
+        """Return the root of the tree of node, halving the path to it along the way."""
+        parent = self._parent
+        while parent[node] != node:
+            parent[node] = parent[parent[node]]
+            node = parent[node]
+
+        return node
+
+    def _union(self, u: int, v: int) -> None:
+        """Merge the subnetworks of the accounts with ids u and v."""
+        u, v = self._root(u), self._root(v)
+        if u == v:
+            return
+
+        # Attach the smaller tree to the larger one, to keep the trees shallow.
+        if self._size[u] < self._size[v]:
+            u, v = v, u
+        self._parent[v] = u
+        self._size[u] += self._size[v]
+        self.num_components -= 1
+
+        if self._size[u] > self._size[self._largest]:
+            self._largest = u
 
 
 if __name__ == '__main__':
@@ -210,8 +507,9 @@ if __name__ == '__main__':
     python_ta.check_all(config={
         'max-line-length': 100,
         'disable': ['E1136'],
-        'allowed-io': ['future_partners', 'biggest_subnetwork'],
-        'extra-imports': ['networkx', 'build_graph']
+        'allowed-io': ['biggest_subnetwork'],
+        'extra-imports': ['os', 'tempfile', 'typing', 'numpy', 'scipy', 'compact_graph',
+                          'build_graph']
     })
 
     import python_ta.contracts
@@ -10,16 +10,25 @@ Copyright Information
 This file is Copyright of Tobey Brizuela, Daniel Lazaro, Matthew Parvaneh, and
 Michael Umeh.
 """
+from typing import Optional
+
 import plotly.graph_objects as go
 import networkx as nx
 
 from build_graph import build_graph
+from compact_graph import CompactGraph, Graph
 
 
-def plot_graph(graph: nx.MultiDiGraph) -> None:
+def plot_graph(graph: Graph, output_file: Optional[str] = None) -> None:
     """
     Plot the Multiple Directed graph using the plotly library.
+
+    The plot is shown in the browser, or written to output_file as html if it is given.
     """
+    # The layout algorithm needs a networkx graph.
+    if isinstance(graph, CompactGraph):
+        graph = graph.to_networkx()
+
     # Choosing the spring layout to position the vertices of the graph.
     pos = nx.spring_layout(graph)
 
@@ -66,8 +75,7 @@ def plot_graph(graph: nx.MultiDiGraph) -> None:
     edge_values_trace = go.Scatter(x=xtext, y=ytext, mode='none',
                                    text=edge_values_text,
                                    textposition='top center',
-                                   hovertemplate='%{text}<extra></extra>'
-    )
+                                   hovertemplate='%{text}<extra></extra>')
 
     # Creating the node trace.
     node_x = []
@@ -155,4 +163,7 @@ def plot_graph(graph: nx.MultiDiGraph) -> None:
         title_font_size=15
     )
 
-    fig.show()
+    if output_file is None:
+        fig.show()
+    else:
+        fig.write_html(output_file)